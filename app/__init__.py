@@ -1,10 +1,93 @@
-from flask import Flask
+import logging
+
 import config
 
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = config.SECRET_KEY
+# Flask's app.logger once the app is created, see app.web
+logger = logging.getLogger(__name__)
 
 SQLITE_DATABASE_URI = config.SQLITE_DATABASE_URI
 
-from app import api, db
\ No newline at end of file
+# SQLite tuning: page cache in KiB, memory-mapped I/O in bytes, seconds a
+# connection waits on a lock, and idle connections kept for background work
+SQLITE_CACHE_SIZE_KB = getattr(config, 'SQLITE_CACHE_SIZE_KB', 16384)
+SQLITE_MMAP_SIZE = getattr(config, 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+SQLITE_BUSY_TIMEOUT = getattr(config, 'SQLITE_BUSY_TIMEOUT', 10)
+SQLITE_POOL_SIZE = getattr(config, 'SQLITE_POOL_SIZE', 4)
+
+# HTTP fetch layer: worker threads, simultaneous calls allowed per store,
+# and (connect, read) timeout in seconds for each call
+FETCH_MAX_WORKERS = getattr(config, 'FETCH_MAX_WORKERS', 8)
+FETCH_STORE_CONCURRENCY = getattr(config, 'FETCH_STORE_CONCURRENCY', 4)
+FETCH_TIMEOUT = getattr(config, 'FETCH_TIMEOUT', (5, 60))
+
+# 'live' calls the order management system; 'record' also saves every
+# response to FETCH_RECORD_DIR, and 'replay' serves the saved responses
+# instead of calling it, waiting FETCH_REPLAY_LATENCY seconds per call
+# (None for no wait, 'recorded' for as long as the original took), see app.replay
+FETCH_MODE = getattr(config, 'FETCH_MODE', 'live')
+FETCH_RECORD_DIR = getattr(config, 'FETCH_RECORD_DIR', 'recordings')
+FETCH_REPLAY_LATENCY = getattr(config, 'FETCH_REPLAY_LATENCY', None)
+
+# each order feed's last response (body, ETag, Last-Modified and content
+# hash) is kept here so unchanged feeds cost a 304 and are not parsed or
+# ingested again; None disables the cache
+FETCH_CACHE_DIR = getattr(config, 'FETCH_CACHE_DIR', 'fetch-cache')
+
+# 'full' replaces every store's open orders on each refresh; 'incremental'
+# only pulls orders modified since each store's high-water mark (less an
+# overlap in seconds), and falls back to a full sync of a store at least
+# every SYNC_FULL_INTERVAL seconds to drop orders that left the open list
+SYNC_MODE = getattr(config, 'SYNC_MODE', 'full')
+SYNC_FULL_INTERVAL = getattr(config, 'SYNC_FULL_INTERVAL', 3600)
+SYNC_OVERLAP = getattr(config, 'SYNC_OVERLAP', 300)
+
+# refresh pipeline (see app.pipeline): threads normalizing orders, and
+# batches of normalized orders that may wait for the SQLite writer
+PIPELINE_NORMALIZE_WORKERS = getattr(config, 'PIPELINE_NORMALIZE_WORKERS', 2)
+PIPELINE_QUEUE_SIZE = getattr(config, 'PIPELINE_QUEUE_SIZE', 8)
+
+# opt-in normalization on worker processes for peak volumes (see
+# app.logic._normalize_on_pool): processes, 0 normalizes on the pipeline's
+# threads; a feed is only handed to them once it has at least
+# NORMALIZE_PROCESS_MIN_ORDERS orders, below that starting the processes
+# and pickling the orders costs more than it saves
+NORMALIZE_PROCESSES = getattr(config, 'NORMALIZE_PROCESSES', 0)
+NORMALIZE_PROCESS_MIN_ORDERS = getattr(config, 'NORMALIZE_PROCESS_MIN_ORDERS', 5000)
+
+# snapshots of the order data kept on disk, the current one included;
+# each refresh writes a new one, and the others can be rolled back to at
+# /update/rollback (see app.db._publish_snapshot), 1 keeps none
+SNAPSHOT_KEEP = getattr(config, 'SNAPSHOT_KEEP', 3)
+
+# orders per page of a store's metadata
+METADATA_PAGE_SIZE = getattr(config, 'METADATA_PAGE_SIZE', 100)
+
+# most items a /search returns, newest orders first
+SEARCH_LIMIT = getattr(config, 'SEARCH_LIMIT', 200)
+
+# seconds between scheduled background refreshes, 0 only refreshes on /update
+REFRESH_INTERVAL = getattr(config, 'REFRESH_INTERVAL', 0)
+
+# seconds after which a refresh still marked running is taken to be
+# abandoned (its worker process died) and another may start
+REFRESH_LEASE_SECONDS = getattr(config, 'REFRESH_LEASE_SECONDS', 900)
+
+# upper bound in bytes of rendered pages kept between refreshes, see app.cache
+RESPONSE_CACHE_MAX_BYTES = getattr(config, 'RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+# timers and counters on the refresh pipeline, queries and rendering,
+# served at /metrics; when False nothing is recorded and /metrics is a 404
+METRICS_ENABLED = getattr(config, 'METRICS_ENABLED', True)
+
+
+# The Flask app and its routes (see app.web) are only imported the first
+# time app.app is asked for, ex: by the web server loading premier.app;
+# the command line (see premier.py) reads and refreshes the db without them.
+# The app is returned as imported, not yet readied to serve (see
+# app.web.init_app)
+def __getattr__(name: str):
+	if name == 'app':
+		from app.web import app
+		return app
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
\ No newline at end of file
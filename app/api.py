@@ -1,42 +1,32 @@
 import datetime
-from typing import Any
 
-from flask import render_template, flash, redirect, url_for, current_app, abort
-from app import app
-from app.forms import NoteForm, EditNoteForm
-from app.db import _connect_db, _close_db, _get_metadata
+from flask import render_template, flash, redirect, url_for, abort, jsonify, request, Response
+from app import app, METRICS_ENABLED
+from app import metrics
+from app.forms import NoteForm, EditNoteForm, SkuRemapForm
+from app.db import _connect_db, _close_db, _get_metadata, _get_pick_list_rows, _get_sku_remap, _get_snapshots, _get_history
+from app.worker import RefreshJob, start_refresh, get_job, get_last_update
+from app.cache import cached_response
+from app.sku import SkuIndex, REMAP_KINDS, get_index
+from app.stores import AMAZON, EBAY, PREM_SHIRTS, NSOTD, BUCKEROO, STORES
+from app.picklist import PickListItem, _format_pick_list
 
 
 from app.logic import (
-	_refresh_stores, 
-	_get_amazon_orders, 
-	_get_ebay_orders, 
-	_get_prem_orders, 
-	_get_nsotd_orders, 
-	_get_buckeroo_orders, 
-	_parse_store_metadata, 
 	_clean_sku,
-	_create_pick_list
+	_check_sku_remap,
+	_save_sku_remap,
+	_rollback_snapshot,
+	_search
 )
 
-AMAZON: str = 'Amazon'
-EBAY: str = 'eBay'
-PREM_SHIRTS: str = 'Premier Shirts'
-NSOTD: str = 'New Shirt of the Day'
-BUCKEROO: str = 'Buckeroo'
-
 
 @app.route('/', methods=['GET', 'POST'])
 def home():
 	# display date and time of most recent update for all stores
-	with app.app_context():
-		update: str | None
-		try:
-			update = current_app.last_update
-		except:
-			update = None
+	update: str | None = get_last_update()
 
-	return render_template('home.html', title='Premier Pick List', last_update=update)
+	return render_template('home.html', title='Premier Pick List', last_update=update, job=get_job())
 
 
 @app.errorhandler(500)
@@ -44,91 +34,225 @@ def internal_error(error):
 	return render_template('500.html', error=error), 500
 
 
+# start a background refresh of every store (or join the one in flight)
+# and return at once; JSON clients get the job, browsers go back home
 @app.route('/update')
 def update():
-	if _refresh_stores():
-		flash('All Stores Updated!')
-
-		# set date and time when all stores were last updated, ex: "Jan 31, 11:59 PM"
-		with app.app_context():
-			current_app.last_update: str = datetime.datetime.now().strftime('%b %d, %I:%M %p')
-
-		# amazon
-		usa_await: list[dict[str, Any]]
-		usa_pend: list[dict[str, Any]]
-		can_await: list[dict[str, Any]]
-		can_pend: list[dict[str, Any]]
-
-		usa_await, usa_pend, can_await, can_pend = _get_amazon_orders()
-		_parse_store_metadata(usa_await, AMAZON)
-		_parse_store_metadata(usa_pend, AMAZON)
-		_parse_store_metadata(can_await, AMAZON)
-		_parse_store_metadata(can_pend, AMAZON)
-
-		# ebay
-		ebay_orders: list[dict[str, Any]] = _get_ebay_orders()
-		_parse_store_metadata(ebay_orders, EBAY, is_ebay=True)
-
-		# premier shirtrs
-		prem_orders: list[dict[str, Any]] = _get_prem_orders()
-		_parse_store_metadata(prem_orders, PREM_SHIRTS)
-
-		# new shirt of the day
-		nsotd_orders: list[dict[str, Any]] = _get_nsotd_orders()
-		_parse_store_metadata(nsotd_orders, NSOTD)
-	
-		# buckeroo
-		buck_orders: list[dict[str, Any]] = _get_buckeroo_orders()
-		_parse_store_metadata(buck_orders, BUCKEROO)
-
-		return redirect(url_for('home'))
+	job: RefreshJob = start_refresh()
+
+	if request.accept_mimetypes.best == 'application/json':
+		return jsonify(job.as_json()), 202
+
+	flash(f'Updating All Stores... (job {job.id})')
+	return redirect(url_for('home'))
+
+
+# progress and per-store timings of the running refresh, or the last one
+@app.route('/update/status')
+def update_status():
+	job: RefreshJob | None = get_job()
+	if job is None:
+		return jsonify(state='idle')
+	return jsonify(job.as_json())
+
+
+# the kept snapshots of the order data, newest first; each refresh that
+# changed anything wrote one, see app.db._publish_snapshot
+@app.route('/update/snapshots')
+def update_snapshots():
+	return jsonify([
+		{
+			'name': name,
+			'created': datetime.datetime.fromtimestamp(created).isoformat(timespec='seconds'),
+			'orders': orders,
+			'current': bool(is_current),
+		}
+		for name, created, orders, is_current in _get_snapshots()
+	])
+
+
+# switch every reader back to the snapshot before the current one, or the
+# one named by ?to=, ex: after a refresh ingested a bad feed; not while a
+# refresh is running, it would switch them over again when it finishes
+@app.route('/update/rollback')
+def update_rollback():
+	wants_json: bool = request.accept_mimetypes.best == 'application/json'
+	job: RefreshJob | None = get_job()
+
+	if job is not None and job.state == 'running':
+		message = f'Cannot roll back while updating (job {job.id})'
+		name: str | None = None
 	else:
-		abort(500)
-	
+		name = _rollback_snapshot(request.args.get('to'))
+		message = f'Rolled back to {name}' if name is not None else 'No snapshot to roll back to'
+
+	if wants_json:
+		return jsonify(snapshot=name, message=message), 200 if name is not None else 409
+
+	flash(message)
+	return redirect(url_for('home'))
+
+
+# Prometheus scrape target: latency histograms of the refresh pipeline,
+# queries, templates and requests, and the last refresh's durations
+@app.route('/metrics')
+def metrics_endpoint():
+	if not METRICS_ENABLED:
+		abort(404)
+
+	index: SkuIndex = get_index()
+	for name, cache in (('clean_sku', index.clean_sku), ('normalize', index.normalize)):
+		info = cache.cache_info()
+		metrics.set_gauge('premier_sku_cache', info.hits, cache=name, field='hits')
+		metrics.set_gauge('premier_sku_cache', info.misses, cache=name, field='misses')
+		metrics.set_gauge('premier_sku_cache', info.currsize, cache=name, field='size')
+
+	return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 
 @app.route('/pick-list')
+@cached_response
 def pick_list():
-	conn = _connect_db()
-	cur = conn.cursor()
-	query = """
-		SELECT sku, SUM(quantity)
-		FROM Item
-		GROUP BY sku
-	"""
-	items: list[tuple[str, int]] = cur.execute(query).fetchall()
-	pick_list: list[str] = _create_pick_list(items)
-	_close_db(conn)
+	# the PickList table is maintained at ingest, rows are already in order
+	rows: list[tuple[str, str, int, int]] = _get_pick_list_rows()
+	pick_list: list[PickListItem] = _format_pick_list(rows)
 	return render_template('pick-list.html', pick_list=pick_list)
 
 
+# the pick list as JSON, for the scanner app and label printer
+@app.route('/api/pick-list')
+@cached_response
+def api_pick_list():
+	rows: list[tuple[str, str, int, int]] = _get_pick_list_rows()
+	pick_list: list[PickListItem] = _format_pick_list(rows)
+	return jsonify(pick_list=[item.as_json() for item in pick_list])
+
+
+# one page of a store's metadata; the next page's link carries the cursor
+# of the last order on this page, ex) /amazon?after=2023-05-25T14:50:07.0000000&id=42
+def _store_page(store: str, template: str):
+	after: tuple[str, int] | None = None
+	if 'after' in request.args:
+		try:
+			after = (request.args['after'], int(request.args['id']))
+		except (KeyError, ValueError):
+			abort(400)
+
+	items: list[tuple[str, str, str, str, int]]
+	next_page: tuple[str, int] | None
+	items, next_page = _get_metadata(store, after)
+
+	next_url: str | None = None
+	if next_page is not None:
+		next_url = url_for(request.endpoint, after=next_page[0], id=next_page[1])
+
+	return render_template(template, items=items, next_url=next_url, first_url=url_for(request.endpoint) if after else None)
+
+
+# ?q= and ?store= of a search, a 400 for a store that isn't one of STORES
+def _search_args() -> tuple[str, str | None]:
+	text: str = request.args.get('q', '')
+	store: str | None = request.args.get('store') or None
+	if store is not None and store not in STORES:
+		abort(400)
+	return text, store
+
+
+# find open orders across every store by order number, customer, SKU (raw
+# or cleaned, 'PREM-6*' for a prefix) or item description
+@app.route('/search')
+@cached_response
+def search():
+	text, store = _search_args()
+	items: list[tuple[str, str, str, str, int, str]] = _search(text, store)
+	return render_template('search.html', title='Search', q=text, store=store, stores=STORES, items=items)
+
+
+# a search as JSON, ex) /api/search?q=PREM-6*
+@app.route('/api/search')
+@cached_response
+def api_search():
+	text, store = _search_args()
+	return jsonify(items=[
+		{
+			'store': item_store,
+			'order_datetime': order_datetime,
+			'order_number': order_number,
+			'customer': customer,
+			'sku': sku,
+			'quantity': quantity,
+		}
+		for order_datetime, order_number, customer, sku, quantity, item_store in _search(text, store)
+	])
+
+
+# quantities of every style and size the archived orders of a range of
+# days had, for restocking, ex) /api/history?start=2023-05-01&end=2023-05-31&style=PREM-646&size=XXL
+# read off the daily rollups (see app.db._archive_orders):
+# 	start, end : days, inclusive; end defaults to today, start to 30 days before end
+# 	style, size, store : only these
+# 	by=day : the quantities of each day, day is None otherwise
+@app.route('/api/history')
+@cached_response
+def api_history():
+	try:
+		end = datetime.date.fromisoformat(request.args['end']) if 'end' in request.args else datetime.date.today()
+		start = datetime.date.fromisoformat(request.args['start']) if 'start' in request.args else end - datetime.timedelta(days=30)
+	except ValueError:
+		abort(400)
+
+	store: str | None = request.args.get('store') or None
+	if store is not None and store not in STORES:
+		abort(400)
+
+	rows = _get_history(
+		start.isoformat(),
+		end.isoformat(),
+		style=request.args.get('style') or None,
+		size=request.args.get('size') or None,
+		store=store,
+		by_day=request.args.get('by') == 'day'
+	)
+	return jsonify(start=start.isoformat(), end=end.isoformat(), items=[
+		{
+			'day': day,
+			'style': style,
+			'size': size,
+			'quantity': quantity,
+			'orders': orders,
+		}
+		for day, style, size, quantity, orders in rows
+	])
+
+
 @app.route('/amazon')
+@cached_response
 def amazon():
-	items: list[tuple[str, str, str, str, int]] = _get_metadata(AMAZON)	
-	return render_template('amazon.html', items=items)
+	return _store_page(AMAZON, 'amazon.html')
 
 
 @app.route('/ebay')
+@cached_response
 def ebay():
-	items: list[tuple[str, str, str, str, int]] = _get_metadata(EBAY)
-	return render_template('ebay.html', items=items)
+	return _store_page(EBAY, 'ebay.html')
 
 
 @app.route('/premier-shirts')
+@cached_response
 def prem_shirts():
-	items: list[tuple[str, str, str, str, int]] = _get_metadata(PREM_SHIRTS)
-	return render_template('premier-shirts.html', items=items)
+	return _store_page(PREM_SHIRTS, 'premier-shirts.html')
 
 
 @app.route('/new-shirt-of-the-day')
+@cached_response
 def nsotd():
-	items: list[tuple[str, str, str, str, int]] = _get_metadata(NSOTD)
-	return render_template('new-shirt-of-the-day.html', items=items)
+	return _store_page(NSOTD, 'new-shirt-of-the-day.html')
 
 
 @app.route('/buckeroo')
+@cached_response
 def buckeroo():
-	items: list[tuple[str, str, str, str, int]] = _get_metadata(BUCKEROO)
-	return render_template('buckeroo.html', items=items)
+	return _store_page(BUCKEROO, 'buckeroo.html')
 
 
 @app.route('/notes', methods=['GET', 'POST'])
@@ -146,7 +270,8 @@ def notes():
 			VALUES (?);
 		"""
 		data = (note,)
-		cur.execute(new_note, data)
+		with metrics.timer('premier_db_query_seconds', query='note_insert'):
+			cur.execute(new_note, data)
 		conn.commit()
 		_close_db(conn)
 
@@ -158,7 +283,8 @@ def notes():
 		SELECT * 
 		FROM Note 
 	"""
-	notes: list(tuple(str)) = cur.execute(query).fetchall()
+	with metrics.timer('premier_db_query_seconds', query='notes'):
+		notes: list(tuple(str)) = cur.execute(query).fetchall()
 	_close_db(conn)
 
 	return render_template('notes.html', title='Notes', form=form, notes=notes)
@@ -173,7 +299,8 @@ def delete_note(id):
 		WHERE id = ?
 	"""
 	note = (id,)
-	cur.execute(query, note)
+	with metrics.timer('premier_db_query_seconds', query='note_delete'):
+		cur.execute(query, note)
 	conn.commit()
 
 	flash('Note Deleted')
@@ -181,17 +308,15 @@ def delete_note(id):
 
 
 # selects the note ID to be edited, redirects to edit_note route function
-@app.route('/edit/<id>')
+@app.route('/edit/<int:id>')
 def edit(id):
-	with app.app_context():
-		current_app.edit_note_id = int(id)
+	return redirect(url_for('edit_note', id=id))
 
-	return redirect(url_for('edit_note'))
 
-
-@app.route('/edit-note', methods=['GET', 'POST'])
-def edit_note():
-	note_id: int = current_app.edit_note_id
+# the note ID is in the URL, so any worker process can serve the edit
+@app.route('/edit-note/<int:id>', methods=['GET', 'POST'])
+def edit_note(id):
+	note_id: int = id
 	form = EditNoteForm()
 	
 	# edit a note
@@ -206,11 +331,52 @@ def edit_note():
 			WHERE Note.id = ?
 		"""
 		data = (note, note_id)
-		cur.execute(edit, data)
+		with metrics.timer('premier_db_query_seconds', query='note_update'):
+			updated: int = cur.execute(edit, data).rowcount
 		conn.commit()
 		_close_db(conn)
 
+		if not updated:
+			abort(404)
+
 		flash(f'Note Edited')
 		return redirect(url_for('notes'))
 
-	return render_template('edit-note.html', form=form)
\ No newline at end of file
+	return render_template('edit-note.html', form=form)
+
+
+# the SKU remaps, which take effect at once: the ingested items they change
+# are re-normalized without waiting for a refresh
+@app.route('/sku-remap', methods=['GET', 'POST'])
+def sku_remap():
+	form = SkuRemapForm()
+
+	if form.validate_on_submit():
+		kind: str = form.kind.data
+		sku: str = form.sku.data.strip()
+		remap: str = form.remap.data.strip()
+
+		error: str | None = _check_sku_remap(kind, sku, remap)
+		if error is None:
+			changed: int = _save_sku_remap(kind, sku, remap)
+			flash(f'SKU Remap Saved ({changed} items re-normalized)')
+			return redirect(url_for('sku_remap'))
+
+		form.remap.errors.append(error)
+
+	conn = _connect_db()
+	version, _, remaps = _get_sku_remap(conn)
+	_close_db(conn)
+
+	return render_template('sku-remap.html', title='SKU Remap', form=form, remaps=remaps, kinds=REMAP_KINDS, version=version)
+
+
+@app.route('/sku-remap/delete/<kind>/<path:sku>')
+def delete_sku_remap(kind, sku):
+	if kind not in REMAP_KINDS:
+		abort(404)
+
+	changed: int = _save_sku_remap(kind, sku, None)
+
+	flash(f'SKU Remap Deleted ({changed} items re-normalized)')
+	return redirect(url_for('sku_remap'))
\ No newline at end of file
@@ -0,0 +1,128 @@
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from app import RESPONSE_CACHE_MAX_BYTES
+from app.metrics import inc
+from app.db import _get_generation, _bump_generation
+
+
+# The generation is bumped by every ingest that commits; a rendered page is
+# only valid for the generation it was rendered in. It lives in the db
+# (see app.db._get_generation) so a refresh in one worker process makes the
+# pages every other worker cached stale; each process keeps its own pages
+#
+# (endpoint, generation, query string) -> (body, mimetype, etag), least
+# recently used first
+_responses: OrderedDict[tuple[str, int, str], tuple[bytes, str, str]] = OrderedDict()
+_responses_bytes: int = 0
+_responses_lock = threading.Lock()
+
+# the latest generation this process has seen, pages of older ones are dropped
+_seen_generation: int = 0
+
+
+def _clear() -> None:
+	global _responses_bytes
+
+	with _responses_lock:
+		_responses.clear()
+		_responses_bytes = 0
+
+
+def get_generation() -> int:
+	global _seen_generation
+
+	generation: int = _get_generation()
+	if generation != _seen_generation:
+		_seen_generation = generation
+		_clear()
+	return generation
+
+
+# Mark the order data as changed: every cached page is stale
+def bump_generation() -> int:
+	global _seen_generation
+
+	generation: int = _bump_generation()
+	_seen_generation = generation
+	_clear()
+	return generation
+
+
+def _get(key: tuple[str, int, str]) -> tuple[bytes, str, str] | None:
+	with _responses_lock:
+		entry = _responses.get(key)
+		if entry is not None:
+			_responses.move_to_end(key)
+		return entry
+
+
+def _put(key: tuple[str, int, str], entry: tuple[bytes, str, str]) -> None:
+	global _responses_bytes
+
+	size = len(entry[0])
+	if size > RESPONSE_CACHE_MAX_BYTES:
+		return
+
+	with _responses_lock:
+		# a refresh finished while this page was rendering
+		if key[1] != _seen_generation:
+			return
+
+		old = _responses.pop(key, None)
+		if old is not None:
+			_responses_bytes -= len(old[0])
+
+		_responses[key] = entry
+		_responses_bytes += size
+
+		while _responses_bytes > RESPONSE_CACHE_MAX_BYTES:
+			_, (body, _, _) = _responses.popitem(last=False)
+			_responses_bytes -= len(body)
+
+
+# Cache a read-only route's rendered response until the next refresh, and
+# answer a matching If-None-Match with 304 Not Modified; the ETag is a hash
+# of the body, so it stays valid across restarts while the data is the same
+#
+# a page carrying flashed messages is rendered once for its user and never cached;
+# bump_generation is used outside the web app, Flask is only imported here
+def cached_response(view: Callable) -> Callable:
+	from flask import request, session, make_response, Response
+
+	@functools.wraps(view)
+	def wrapper(*args, **kwargs):
+		if session.get('_flashes'):
+			return view(*args, **kwargs)
+
+		generation = get_generation()
+		key = (request.endpoint, generation, request.query_string.decode())
+		entry = _get(key)
+
+		if entry is None:
+			inc('premier_response_cache_total', result='miss')
+			rendered = make_response(view(*args, **kwargs))
+			if rendered.status_code != 200:
+				return rendered
+
+			body: bytes = rendered.get_data()
+			entry = (body, rendered.mimetype, hashlib.blake2b(body, digest_size=16).hexdigest())
+			_put(key, entry)
+		else:
+			inc('premier_response_cache_total', result='hit')
+
+		body, mimetype, etag = entry
+		response = Response(body, mimetype=mimetype)
+		response.set_etag(etag)
+		# clients must revalidate, which costs them a 304 until the next refresh
+		response.headers['Cache-Control'] = 'no-cache'
+		response = response.make_conditional(request)
+
+		if response.status_code == 304:
+			inc('premier_response_cache_total', result='not_modified')
+		return response
+
+	return wrapper
\ No newline at end of file
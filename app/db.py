@@ -1,92 +1,1469 @@
+import os
+import sys
+import time
+import uuid
 import sqlite3
-from app import app, SQLITE_DATABASE_URI
+import threading
+from typing import Any, Callable
 
+from app.sku import SIZE_ORDERING, NO_SIZE_RANK, VS_MAP, STEX_LOCATIONS
+from app.metrics import timer
+from app import (
+	SQLITE_DATABASE_URI, 
+	SQLITE_CACHE_SIZE_KB, 
+	SQLITE_MMAP_SIZE, 
+	SQLITE_BUSY_TIMEOUT, 
+	SQLITE_POOL_SIZE,
+	METADATA_PAGE_SIZE,
+	SEARCH_LIMIT,
+	SNAPSHOT_KEEP
+)
 
-# sqlite3.connect creates the db file if it doesn't exist
+
+# idle connections for work outside a request (refresh worker, benchmarks),
+# as (db path, connection)
+_pool: list[tuple[str, sqlite3.Connection]] = []
+_pool_lock = threading.Lock()
+
+
+# sqlite3.connect creates the db file if it doesn't exist; WAL lets pickers
+# read while a refresh writes, and NORMAL sync is durable enough in WAL mode
+def _open_db(path: str) -> sqlite3.Connection:
+	conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+	conn.execute("PRAGMA journal_mode = WAL")
+	conn.execute("PRAGMA synchronous = NORMAL")
+	conn.execute(f"PRAGMA cache_size = -{int(SQLITE_CACHE_SIZE_KB)}")
+	conn.execute(f"PRAGMA mmap_size = {int(SQLITE_MMAP_SIZE)}")
+	return conn
+
+
+# flask.g inside an app context, else None; Flask is only imported by the
+# web app (see app.web), without it there is no app context to look for
+def _app_globals() -> Any:
+	flask = sys.modules.get('flask')
+	if flask is None or not flask.has_app_context():
+		return None
+	return flask.g
+
+
+# Inside a request (or any app context) every call shares one connection
+# from the pool, given back when the context ends; elsewhere every call
+# checks one out. Either way the connection reads the current snapshot of
+# the order data as of when it was checked out, see _attach_snapshot
 def _connect_db():
-	conn = sqlite3.connect(SQLITE_DATABASE_URI)
+	path: str = SQLITE_DATABASE_URI
+
+	g = _app_globals()
+	if g is not None:
+		conn = g.get('db')
+		if conn is None or g.get('db_path') != path:
+			conn = _pooled_db()
+			g.db, g.db_path = conn, path
+		return conn
+
+	return _pooled_db()
+
+
+# An idle connection from the pool, or a new one; give it back with _close_db
+# 	attach : False for work on the main db only (shared state, refresh
+# 	jobs), which skips bringing the attached snapshot up to date
+def _pooled_db(attach: bool = True) -> sqlite3.Connection:
+	path: str = SQLITE_DATABASE_URI
+	conn: sqlite3.Connection | None = None
+
+	with _pool_lock:
+		while _pool:
+			pool_path, idle = _pool.pop()
+			if pool_path == path:
+				conn = idle
+				break
+			idle.close()
+
+	if conn is None:
+		conn = _open_db(path)
+	if attach:
+		_attach_snapshot(conn)
 	return conn
 
 
+# The request's connection stays open until the app context ends; any
+# other connection goes back to the pool, rolling back what wasn't committed
 def _close_db(conn):
+	g = _app_globals()
+	if g is not None and g.get('db') is conn:
+		return
+
+	if conn.in_transaction:
+		conn.rollback()
+
+	with _pool_lock:
+		if len(_pool) < SQLITE_POOL_SIZE:
+			_pool.append((SQLITE_DATABASE_URI, conn))
+			return
+
 	conn.close()
 
 
+# Close every idle pooled connection, ex: before the db file is replaced
+def _close_pool() -> None:
+	with _pool_lock:
+		while _pool:
+			_pool.pop()[1].close()
+
+
+# registered by app.web
+def _teardown_db(exception):
+	g = _app_globals()
+	conn = g.pop('db', None)
+	g.pop('db_path', None)
+	if conn is not None:
+		_close_db(conn)
+
+
+# one page of a store's orders and their items, see _get_metadata
+METADATA_PAGE_QUERY = """
+	WITH Page AS (
+		SELECT id, store, order_number, iso_datetime, order_datetime, customer
+		FROM Customer_Order
+		WHERE store = ? AND (iso_datetime, id) < (?, ?)
+		ORDER BY iso_datetime DESC, id DESC
+		LIMIT ?
+	)
+	SELECT Page.order_datetime, Page.order_number, Page.customer, Item.sku, Item.quantity, Page.iso_datetime, Page.id
+	FROM Page
+	INNER JOIN Item ON Item.store = Page.store AND Item.order_number = Page.order_number
+	ORDER BY Page.iso_datetime DESC, Page.id DESC, Item.id
+"""
+
+
 # get a store's order date, order number, customer name, item SKU, 
 # and item quantity; this is the relevant data for quality control
-def _get_metadata(store: str) -> list[tuple[str, str, str, str, int]]:
+#
+# newest orders first, one page of orders at a time (keyset pagination,
+# so every page costs the same however many orders the store has):
+# 	after : (iso_datetime, id) cursor of the last order on the previous page
+# returns the page's rows and the cursor of the next page, None on the last
+def _get_metadata(
+	store: str, 
+	after: tuple[str, int] | None = None, 
+	limit: int = METADATA_PAGE_SIZE
+) -> tuple[list[tuple[str, str, str, str, int]], tuple[str, int] | None]:
 	conn = _connect_db()
 	cur = conn.cursor()	
 
+	# no cursor: start above every order, '~' sorts after any ISO datetime
+	after_dt, after_id = after if after is not None else ('~', 2 ** 63 - 1)
+	data = (store, after_dt, after_id, limit + 1)
+	with timer('premier_db_query_seconds', query='metadata_page'):
+		rows = cur.execute(METADATA_PAGE_QUERY, data).fetchall()
+
+	_close_db(conn)
+
+	# one extra order was asked for to know whether there is a next page
+	order_keys: list[tuple[str, int]] = list(dict.fromkeys((row[5], row[6]) for row in rows))
+	next_page: tuple[str, int] | None = None
+	if len(order_keys) > limit:
+		next_page = order_keys[limit - 1]
+		page = set(order_keys[:limit])
+		rows = [row for row in rows if (row[5], row[6]) in page]
+
+	items: list[tuple[str, str, str, str, int]] = [row[:5] for row in rows]
+
+	return items, next_page
+
+
+# the whole pick list in one query off pick_list_idx: styles in pick
+# list order, each style's sizes by size rank, and the style's total; the
+# window is ordered like the index so neither needs a sort
+PICK_LIST_QUERY = """
+	SELECT style, size, quantity, SUM(quantity) OVER (
+		PARTITION BY sort_key ORDER BY size_rank, size ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+	) AS total
+	FROM PickList
+	ORDER BY sort_key, size_rank, size
+"""
+
+
+# the pick list, ex) [('PREM-001', 'SML', 1, 4), ('PREM-001', 'MED', 3, 4), ('GIFTCARD', '', 2, 2)];
+# rows come out of the PickList table already in pick list order
+def _get_pick_list_rows() -> list[tuple[str, str, int, int]]:
+	conn = _connect_db()
+	cur = conn.cursor()
+
+	with timer('premier_db_query_seconds', query='pick_list'):
+		rows: list[tuple[str, str, int, int]] = cur.execute(PICK_LIST_QUERY).fetchall()
+
+	_close_db(conn)
+
+	return rows
+
+
+# items matching a full-text search (see Order_Search), newest orders
+# first; the match is read off the FTS index, then each item and its
+# order by key
+SEARCH_QUERY = """
+	SELECT Customer_Order.order_datetime, Customer_Order.order_number, Customer_Order.customer, 
+		Item.sku, Item.quantity, Item.store
+	FROM Order_Search
+	INNER JOIN Item ON Item.id = Order_Search.rowid
+	INNER JOIN Customer_Order ON Customer_Order.store = Item.store AND Customer_Order.order_number = Item.order_number
+	WHERE Order_Search MATCH ? AND (? IS NULL OR Item.store = ?)
+	ORDER BY Customer_Order.iso_datetime DESC, Customer_Order.id DESC, Item.id
+	LIMIT ?
+"""
+
+
+# the items of every store's open orders matching an FTS5 query, ex)
+# '"PREM-6"*' for every SKU and order number starting with PREM-6 (see
+# logic._search_query), at most limit of them; rows as in _get_metadata
+# with the store last, ex) [('05/25/2023 02:50 PM', '1001', 'Jane Doe', 'PREM-646-MED', 1, 'Amazon')]
+# 	store : only this store's items
+def _search_orders(
+	match: str,
+	store: str | None = None,
+	limit: int = SEARCH_LIMIT
+) -> list[tuple[str, str, str, str, int, str]]:
+	conn = _connect_db()
+	cur = conn.cursor()
+
+	with timer('premier_db_query_seconds', query='search'):
+		rows: list[tuple[str, str, str, str, int, str]] = cur.execute(SEARCH_QUERY, (match, store, store, limit)).fetchall()
+
+	_close_db(conn)
+
+	return rows
+
+
+# Rebuild the search index (see Order_Search) from the orders and items
+# in the db; the caller owns the transaction
+def _index_search(conn: sqlite3.Connection) -> None:
+	with timer('premier_db_query_seconds', query='index_search'):
+		conn.execute("INSERT INTO Order_Search (Order_Search) VALUES ('rebuild')")
+
+
+# an order's items in and out of the search index; the index stores no
+# text, so what to take out is read back from Order_Search_Source while it
+# still holds what was indexed
+UNINDEX_ORDER = """
+	INSERT INTO Order_Search (Order_Search, rowid, order_number, customer, sku, raw_sku, description, store)
+	SELECT 'delete', id, order_number, customer, sku, raw_sku, description, store
+	FROM Order_Search_Source
+	WHERE store = ? AND order_number = ?;
+"""
+
+INDEX_ORDER = """
+	INSERT INTO Order_Search (rowid, order_number, customer, sku, raw_sku, description, store)
+	SELECT id, order_number, customer, sku, raw_sku, description, store
+	FROM Order_Search_Source
+	WHERE store = ? AND order_number = ?;
+"""
+
+
+# Take orders' items out of the search index, before the orders are
+# rewritten or deleted, and (_index_orders) put them back once they are
+# written, ex) [('eBay', '1234')]; keeps the index up to date for a few
+# orders without a rebuild (see _index_search). The caller owns the transaction
+def _unindex_orders(conn: sqlite3.Connection, keys: list[tuple[str, str]]) -> None:
+	with timer('premier_db_query_seconds', query='unindex_orders'):
+		conn.executemany(UNINDEX_ORDER, keys)
+
+
+def _index_orders(conn: sqlite3.Connection, keys: list[tuple[str, str]]) -> None:
+	with timer('premier_db_query_seconds', query='index_orders'):
+		conn.executemany(INDEX_ORDER, keys)
+
+
+# statements are module constants so sqlite3's statement cache compiles
+# each one once and reuses it for every row and every refresh
+#
+# an order already in the db (same store and order number) is updated in
+# place, and its items are replaced with the ones in the latest payload
+UPSERT_ORDER = """
+	INSERT INTO Customer_Order (store, order_number, iso_datetime, order_datetime, customer, modify_date)
+	VALUES (?, ?, ?, ?, ?, ?)
+	ON CONFLICT (store, order_number) DO UPDATE SET
+		iso_datetime = excluded.iso_datetime,
+		order_datetime = excluded.order_datetime,
+		customer = excluded.customer,
+		modify_date = excluded.modify_date;
+"""
+
+DELETE_ORDER = """
+	DELETE FROM Customer_Order
+	WHERE store = ? AND order_number = ?;
+"""
+
+DELETE_ITEMS = """
+	DELETE FROM Item
+	WHERE store = ? AND order_number = ?;
+"""
+
+INSERT_ITEM = """
+	INSERT INTO Item (store, order_number, sku, quantity, style, size, raw_sku, description)
+	VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+# bulk upsert normalized order and item rows; the caller owns the
+# transaction (use "with conn:") so nothing here commits
+def _insert_orders(
+	conn: sqlite3.Connection,
+	order_rows: list[tuple[str, str, str, str, str, str]],
+	item_rows: list[tuple[str, str, str, int, str, str | None, str | None, str | None]]
+) -> None:
+	cur = conn.cursor()
+	keys: list[tuple[str, str]] = [(row[0], row[1]) for row in order_rows]
+	with timer('premier_db_query_seconds', query='insert_orders'):
+		cur.executemany(UPSERT_ORDER, order_rows)
+		cur.executemany(DELETE_ITEMS, keys)
+		cur.executemany(INSERT_ITEM, item_rows)
+
+
+# bulk delete orders, ex: shipped or cancelled, along with their items
+def _delete_orders(conn: sqlite3.Connection, keys: list[tuple[str, str]]) -> None:
+	cur = conn.cursor()
+	with timer('premier_db_query_seconds', query='delete_orders'):
+		cur.executemany(DELETE_ITEMS, keys)
+		cur.executemany(DELETE_ORDER, keys)
+
+
+# delete every order of a store that isn't one of current, the order
+# numbers of its open orders
+def _delete_stale_orders(conn: sqlite3.Connection, store: str, current: set[str]) -> None:
+	cur = conn.cursor()
+	query = """
+		SELECT order_number
+		FROM Customer_Order
+		WHERE store = ?
+	"""
+	with timer('premier_db_query_seconds', query='store_orders'):
+		existing: set[str] = {row[0] for row in cur.execute(query, (store,))}
+
+	_delete_orders(conn, [(store, order_num) for order_num in existing - current])
+
+
+# per-store sync state, ex) ('eBay', '2023-05-25T14:50:07.0000000', '2023-05-25T15:00:00', '9f86d0...')
+# 	high_water_mark : latest upstream modify date ingested for the store
+# 	last_full_sync : local time the store's orders were last fully replaced
+# 	payload_hash : content hash of the feeds last ingested for the store,
+# 	None if unknown (see app.logic._store_hash)
+def _get_sync_state(conn: sqlite3.Connection) -> dict[str, tuple[str | None, str | None, str | None]]:
+	cur = conn.cursor()
+	query = """
+		SELECT store, high_water_mark, last_full_sync, payload_hash
+		FROM Sync_State
+	"""
+	return {store: (hwm, full, payload_hash) for store, hwm, full, payload_hash in cur.execute(query)}
+
+
+def _set_sync_state(
+	conn: sqlite3.Connection,
+	store: str,
+	high_water_mark: str | None,
+	last_full_sync: str | None,
+	payload_hash: str | None = None
+) -> None:
+	cur = conn.cursor()
+	query = """
+		INSERT INTO Sync_State (store, high_water_mark, last_full_sync, payload_hash)
+		VALUES (?, ?, ?, ?)
+		ON CONFLICT (store) DO UPDATE SET
+			high_water_mark = excluded.high_water_mark,
+			last_full_sync = COALESCE(excluded.last_full_sync, Sync_State.last_full_sync),
+			payload_hash = excluded.payload_hash;
+	"""
+	cur.execute(query, (store, high_water_mark, last_full_sync, payload_hash))
+
+
+# recompute the PickList table from Item in one pass, ex: after SizeRank
+# changed; the caller owns the transaction
+def _rebuild_pick_list(conn: sqlite3.Connection) -> None:
+	cur = conn.cursor()
+	cur.execute("DELETE FROM PickList")
+	query = f"""
+		INSERT INTO PickList (style, size, size_rank, sort_key, quantity, items)
+		SELECT 
+			Item.style, 
+			COALESCE(Item.size, ''), 
+			CASE WHEN Item.size IS NULL THEN {NO_SIZE_RANK} ELSE SizeRank.size_rank END, 
+			Item.style || CASE WHEN Item.size IS NULL THEN char(10) ELSE '?' END, 
+			SUM(Item.quantity), 
+			COUNT(*)
+		FROM Item
+		LEFT JOIN SizeRank ON SizeRank.prefix = substr(Item.size, 1, 2)
+		WHERE Item.size IS NULL OR SizeRank.size_rank IS NOT NULL
+		GROUP BY Item.style, Item.size
+	"""
+	cur.execute(query)
+
+
+# The state every worker process shares lives in the db, so the app runs
+# the same under any number of gunicorn workers and threads:
+# 	Shared_State 'generation' : bumped by every change to the order data,
+# 	see app.cache
+# 	Shared_State 'snapshot' : the current snapshot of the order data, see
+# 	_attach_snapshot
+# 	Refresh_Job : every refresh, the running one is the refresh lock, see
+# 	app.worker.start_refresh
+
+# the order data's generation; read on every cached page, so it takes a
+# pooled connection rather than opening the request's own
+def _get_generation() -> int:
+	conn = _pooled_db(attach=False)
+	try:
+		row = conn.execute("SELECT value FROM Shared_State WHERE key = 'generation'").fetchone()
+	finally:
+		_close_db(conn)
+	return int(row[0]) if row is not None else 0
+
+
+def _bump_generation() -> int:
+	conn = _pooled_db(attach=False)
 	query = """
-		SELECT CO.order_datetime, CO.order_number, CO.customer, Item.sku, Item.quantity
-		FROM Customer_Order AS CO
-		INNER JOIN Item ON Item.order_number = CO.order_number
-		WHERE CO.store = ?
-		ORDER BY iso_datetime DESC
+		INSERT INTO Shared_State (key, value)
+		VALUES ('generation', 1)
+		ON CONFLICT (key) DO UPDATE SET 
+			value = value + 1
+		RETURNING value
 	"""
-	data = (store,)
-	items: list[tuple[str, str, str, str, int]] = cur.execute(query, data).fetchall()
+	try:
+		with conn:
+			generation = int(conn.execute(query).fetchone()[0])
+	finally:
+		_close_db(conn)
+	return generation
+
 
+# Take the refresh lock: record job as the running refresh, unless another
+# refresh is running; returns the running refresh (its Refresh_Job row as
+# (id, state, owner, started, finished, job)) or None if job took the lock
+# 	is_stale : whether a running refresh's owner is gone, its row is then
+# 	marked failed and the lock taken over
+def _claim_refresh(
+	job_id: str, 
+	owner: str, 
+	started: float, 
+	job: str, 
+	is_stale: Callable[[tuple[str, str, str, float, float | None, str]], bool]
+) -> tuple[str, str, str, float, float | None, str] | None:
+	conn = _pooled_db(attach=False)
+	cur = conn.cursor()
+	query = """
+		SELECT id, state, owner, started, finished, job
+		FROM Refresh_Job
+		WHERE state = 'running'
+		ORDER BY started DESC
+	"""
+
+	try:
+		# IMMEDIATE takes the write lock first, so two workers can't both
+		# see no running refresh and both start one
+		cur.execute("BEGIN IMMEDIATE")
+		for row in cur.execute(query).fetchall():
+			if not is_stale(row):
+				conn.rollback()
+				return row
+			cur.execute("UPDATE Refresh_Job SET state = 'failed', finished = ? WHERE id = ?", (time.time(), row[0]))
+
+		insert = """
+			INSERT INTO Refresh_Job (id, state, owner, started, finished, job)
+			VALUES (?, 'running', ?, ?, NULL, ?)
+		"""
+		cur.execute(insert, (job_id, owner, started, job))
+		conn.commit()
+	finally:
+		_close_db(conn)
+
+	return None
+
+
+# save a refresh's progress; a finished refresh (state 'done' or 'failed')
+# releases the refresh lock, and only the last keep refreshes are kept
+def _save_refresh(job_id: str, state: str, finished: float | None, job: str, keep: int = 100) -> None:
+	conn = _pooled_db(attach=False)
+	cur = conn.cursor()
+	query = """
+		UPDATE Refresh_Job
+		SET state = ?, finished = ?, job = ?
+		WHERE id = ?
+	"""
+	prune = """
+		DELETE FROM Refresh_Job
+		WHERE id NOT IN (SELECT id FROM Refresh_Job ORDER BY started DESC LIMIT ?)
+	"""
+
+	try:
+		with conn:
+			cur.execute(query, (state, finished, job, job_id))
+			if state != 'running':
+				cur.execute(prune, (keep,))
+	finally:
+		_close_db(conn)
+
+
+# the running refresh, or the most recent one, see _claim_refresh
+def _get_last_refresh() -> tuple[str, str, str, float, float | None, str] | None:
+	conn = _connect_db()
+	query = """
+		SELECT id, state, owner, started, finished, job
+		FROM Refresh_Job
+		ORDER BY state = 'running' DESC, started DESC
+		LIMIT 1
+	"""
+	row = conn.execute(query).fetchone()
+	_close_db(conn)
+	return row
+
+
+# unix time the last successful refresh finished, None if there wasn't one
+def _get_last_update() -> float | None:
+	conn = _connect_db()
+	row = conn.execute("SELECT MAX(finished) FROM Refresh_Job WHERE state = 'done'").fetchone()
 	_close_db(conn)
+	return row[0]
+
+
+# The order data (Customer_Order, Item, PickList, SizeRank, Sync_State and
+# Item_Remap, see _create_snapshot_tables) lives in snapshot files beside
+# the db, ex) premier.db.orders-20231124-180003-3f1c0a9e, and the current
+# one is attached to every connection. A refresh writes a copy of the
+# current snapshot (_create_shadow) and swaps the pointer over once every
+# store is in (_publish_snapshot), so readers keep reading the previous
+# snapshot at full speed and never see a half-written one; the last
+# SNAPSHOT_KEEP snapshots are kept to roll back to (_set_snapshot)
+
+def _snapshot_path(name: str) -> str:
+	return f'{SQLITE_DATABASE_URI}.{name}'
+
+
+def _new_snapshot_name() -> str:
+	return time.strftime('orders-%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+
+
+def _remove_snapshot_files(name: str) -> None:
+	path: str = _snapshot_path(name)
+	for stale in (path, path + '-wal', path + '-shm'):
+		try:
+			os.remove(stale)
+		except OSError:
+			pass
+
+
+# Attach the current snapshot to conn as 'orders', replacing the one it
+# had if the pointer moved since; the main db has no order tables, so
+# queries name them unqualified and read whichever snapshot is attached.
+# A connection only re-attaches when it is opened or checked out, so a
+# request reads one snapshot from start to end
+def _attach_snapshot(conn: sqlite3.Connection) -> None:
+	query = """
+		SELECT 
+			(SELECT value FROM Shared_State WHERE key = 'snapshot'), 
+			(SELECT file FROM pragma_database_list WHERE name = 'orders')
+	"""
+	try:
+		name, attached = conn.execute(query).fetchone()
+	except sqlite3.OperationalError:
+		# the db is older than the snapshots, see create_tables
+		return
+
+	path: str | None = os.path.realpath(_snapshot_path(name)) if name is not None else None
+	if attached == path:
+		return
+
+	if attached is not None:
+		conn.execute("DETACH DATABASE orders")
+	if path is not None:
+		conn.execute("ATTACH DATABASE ? AS orders", (path,))
+		conn.execute("PRAGMA orders.synchronous = NORMAL")
+		conn.execute(f"PRAGMA orders.cache_size = -{int(SQLITE_CACHE_SIZE_KB)}")
+		conn.execute(f"PRAGMA orders.mmap_size = {int(SQLITE_MMAP_SIZE)}")
+
+
+# the current snapshot's name, None before create_tables made one
+def _get_snapshot() -> str | None:
+	conn = _pooled_db(attach=False)
+	try:
+		row = conn.execute("SELECT value FROM Shared_State WHERE key = 'snapshot'").fetchone()
+	finally:
+		_close_db(conn)
+	return row[0] if row is not None else None
+
+
+# every kept snapshot, newest first, as (name, created, orders, is current),
+# ex) [('orders-20231124-180003-3f1c0a9e', 1700848803.2, 412, 1), ...]
+def _get_snapshots() -> list[tuple[str, float, int, int]]:
+	conn = _pooled_db(attach=False)
+	query = """
+		SELECT name, created, orders, name IS (SELECT value FROM Shared_State WHERE key = 'snapshot')
+		FROM Snapshot
+		ORDER BY created DESC
+	"""
+	try:
+		rows: list[tuple[str, float, int, int]] = conn.execute(query).fetchall()
+	finally:
+		_close_db(conn)
+	return rows
+
+
+# point every connection at snapshot name; the caller owns the transaction
+def _point_snapshot(conn: sqlite3.Connection, name: str) -> None:
+	query = """
+		INSERT INTO Shared_State (key, value)
+		VALUES ('snapshot', ?)
+		ON CONFLICT (key) DO UPDATE SET 
+			value = excluded.value
+	"""
+	conn.execute(query, (name,))
+
+
+# Copy the current snapshot into a new file for a refresh to write, with
+# the backup API so it is a consistent copy however busy readers are;
+# returns its name and a connection to it, which the refresh hands to
+# _publish_snapshot when it is done or _discard_snapshot if it fails
+def _create_shadow() -> tuple[str, sqlite3.Connection]:
+	name: str = _new_snapshot_name()
+	live = _open_db(_snapshot_path(_get_snapshot()))
+	shadow = _open_db(_snapshot_path(name))
+
+	try:
+		with timer('premier_db_query_seconds', query='copy_snapshot'):
+			live.backup(shadow)
+	except BaseException:
+		_discard_snapshot(name, shadow)
+		raise
+	finally:
+		live.close()
+
+	return name, shadow
+
+
+def _discard_snapshot(name: str, conn: sqlite3.Connection) -> None:
+	conn.close()
+	_remove_snapshot_files(name)
+
+
+# Make the snapshot a refresh wrote (see _create_shadow) current: conn's
+# transaction is committed and every connection reads the snapshot from
+# its next checkout; then snapshots beyond the last SNAPSHOT_KEEP, the
+# current one included, are deleted
+def _publish_snapshot(name: str, conn: sqlite3.Connection) -> None:
+	orders: int = conn.execute("SELECT COUNT(*) FROM Customer_Order").fetchone()[0]
+	conn.commit()
+	conn.close()
+
+	main = _pooled_db(attach=False)
+	insert = """
+		INSERT INTO Snapshot (name, created, orders)
+		VALUES (?, ?, ?)
+	"""
+	prune = """
+		DELETE FROM Snapshot
+		WHERE name != ? AND name NOT IN (
+			SELECT name 
+			FROM Snapshot 
+			WHERE name != ? 
+			ORDER BY created DESC 
+			LIMIT ?
+		)
+		RETURNING name
+	"""
+
+	try:
+		with main:
+			main.execute(insert, (name, time.time(), orders))
+			_point_snapshot(main, name)
+			pruned: list[str] = [row[0] for row in main.execute(prune, (name, name, max(SNAPSHOT_KEEP, 1) - 1))]
+	finally:
+		_close_db(main)
+
+	# connections still reading a pruned snapshot keep their open file
+	for stale in pruned:
+		_remove_snapshot_files(stale)
 
-	return items
 
+# Make a kept snapshot current again, ex: to roll back a bad refresh;
+# False if it isn't kept, or was written by an older SCHEMA_VERSION
+def _set_snapshot(name: str) -> bool:
+	path: str = _snapshot_path(name)
+	if not os.path.exists(path):
+		return False
 
-# create table for Orders, Items, and Notes
+	# a snapshot kept from before a table was added (ex: Order_Search) gets it
+	snapshot = _open_db(path)
+	try:
+		version: int = snapshot.execute("PRAGMA user_version").fetchone()[0]
+		if version == SCHEMA_VERSION:
+			_create_snapshot_tables(snapshot)
+	finally:
+		snapshot.close()
+	if version != SCHEMA_VERSION:
+		return False
+
+	conn = _pooled_db(attach=False)
+	try:
+		with conn:
+			if conn.execute("SELECT 1 FROM Snapshot WHERE name = ?", (name,)).fetchone() is None:
+				return False
+			_point_snapshot(conn, name)
+	finally:
+		_close_db(conn)
+
+	# the request that rolled back reads the snapshot it rolled back to
+	g = _app_globals()
+	if g is not None and g.get('db') is not None and not g.db.in_transaction:
+		_attach_snapshot(g.db)
+
+	return True
+
+
+# The order archive: every order and its items as a refresh first saw
+# them, kept in the main db whichever snapshot is current, and daily
+# rollups of the items per style, size and store, which the history
+# reports read instead of the archived rows (see _get_history). Every
+# table is keyed by day first, so a range of days is one contiguous range
+# of rows however long the archive grows; nothing is updated or deleted,
+# an order edited after it was archived stays as it was first seen
+
+# the current snapshot's orders that aren't archived yet, ex: every order
+# placed since the last refresh
+ARCHIVE_NEW_ORDERS = """
+	INSERT INTO temp.Archive_New (day, store, order_number, iso_datetime, customer)
+	SELECT substr(Open_Order.iso_datetime, 1, 10), Open_Order.store, Open_Order.order_number, Open_Order.iso_datetime, Open_Order.customer
+	FROM orders.Customer_Order AS Open_Order
+	WHERE NOT EXISTS (
+		SELECT 1
+		FROM Archive_Order
+		WHERE Archive_Order.store = Open_Order.store AND Archive_Order.order_number = Open_Order.order_number
+	)
+"""
+
+ARCHIVE_ORDERS = """
+	INSERT INTO Archive_Order (day, store, order_number, iso_datetime, customer, archived)
+	SELECT day, store, order_number, iso_datetime, customer, ?
+	FROM temp.Archive_New
+"""
+
+ARCHIVE_ITEMS = """
+	INSERT INTO Archive_Item (day, store, order_number, line, sku, quantity, style, size, raw_sku)
+	SELECT 
+		Archive_New.day, 
+		Item.store, 
+		Item.order_number, 
+		row_number() OVER (PARTITION BY Item.store, Item.order_number ORDER BY Item.id), 
+		Item.sku, 
+		Item.quantity, 
+		Item.style, 
+		Item.size, 
+		Item.raw_sku
+	FROM temp.Archive_New
+	INNER JOIN orders.Item ON Item.store = Archive_New.store AND Item.order_number = Archive_New.order_number
+"""
+
+# fold the newly archived items into their days' rollups; sizes and their
+# order as in PickList (WHERE true lets the upsert follow a SELECT)
+ROLLUP_ITEMS = f"""
+	INSERT INTO Daily_Rollup (day, style, size, store, size_rank, sort_key, quantity, items, orders)
+	SELECT 
+		Archive_New.day, 
+		Item.style, 
+		COALESCE(Item.size, ''), 
+		Item.store, 
+		CASE WHEN Item.size IS NULL THEN {NO_SIZE_RANK} ELSE SizeRank.size_rank END, 
+		Item.style || CASE WHEN Item.size IS NULL THEN char(10) ELSE '?' END, 
+		SUM(Item.quantity), 
+		COUNT(*), 
+		COUNT(DISTINCT Item.order_number)
+	FROM temp.Archive_New
+	INNER JOIN orders.Item ON Item.store = Archive_New.store AND Item.order_number = Archive_New.order_number
+	LEFT JOIN orders.SizeRank ON SizeRank.prefix = substr(Item.size, 1, 2)
+	WHERE true
+	GROUP BY Archive_New.day, Item.style, COALESCE(Item.size, ''), Item.store
+	ON CONFLICT (day, style, size, store) DO UPDATE SET
+		quantity = quantity + excluded.quantity,
+		items = items + excluded.items,
+		orders = orders + excluded.orders;
+"""
+
+
+# Archive the current snapshot's orders that aren't archived yet and fold
+# their items into the daily rollups, in one transaction; returns the
+# number of orders archived
+def _archive_orders() -> int:
+	conn = _pooled_db()
+	cur = conn.cursor()
+	cur.execute("""
+		CREATE TEMP TABLE IF NOT EXISTS Archive_New (
+			day TEXT, 
+			store TEXT, 
+			order_number TEXT, 
+			iso_datetime TEXT, 
+			customer TEXT
+		)
+	""")
+
+	try:
+		# IMMEDIATE: a transaction that reads first can't wait for another
+		# writer when it comes to write, it fails
+		cur.execute("BEGIN IMMEDIATE")
+		with timer('premier_db_query_seconds', query='archive_orders'):
+			archived: int = cur.execute(ARCHIVE_NEW_ORDERS).rowcount
+			if archived:
+				cur.execute(ARCHIVE_ORDERS, (time.time(),))
+				cur.execute(ARCHIVE_ITEMS)
+				cur.execute(ROLLUP_ITEMS)
+		cur.execute("DELETE FROM temp.Archive_New")
+		conn.commit()
+	finally:
+		_close_db(conn)
+
+	return archived
+
+
+# {day} is 'day' for a row per day, 'NULL' for totals over the days
+HISTORY_QUERY = """
+	SELECT {day}, style, size, SUM(quantity), SUM(orders)
+	FROM Daily_Rollup
+	WHERE day BETWEEN ? AND ? 
+		AND (? IS NULL OR style = ?) 
+		AND (? IS NULL OR size = ?) 
+		AND (? IS NULL OR store = ?)
+	GROUP BY {day}, style, size
+	ORDER BY {day}, MIN(sort_key), MIN(size_rank), size
+"""
+
+
+# the archived items of the days from start to end (inclusive, ex)
+# '2023-05-01', '2023-05-31') per style and size, in pick list order, read
+# off the daily rollups, ex) [(None, 'PREM-646', 'XXL', 14, 12), ...]
+# 	style, size, store : only these
+# 	by_day : a row per day as well, the day first, oldest day first
+# rows are (day or None, style, size, quantity, orders)
+def _get_history(
+	start: str,
+	end: str,
+	style: str | None = None,
+	size: str | None = None,
+	store: str | None = None,
+	by_day: bool = False
+) -> list[tuple[str | None, str, str, int, int]]:
+	conn = _pooled_db(attach=False)
+	cur = conn.cursor()
+
+	query: str = HISTORY_QUERY.format(day='day' if by_day else 'NULL')
+	data = (start, end, style, style, size, size, store, store)
+	try:
+		with timer('premier_db_query_seconds', query='history'):
+			rows: list[tuple[str | None, str, str, int, int]] = cur.execute(query, data).fetchall()
+	finally:
+		_close_db(conn)
+
+	return rows
+
+
+# the SKU remaps, see app.sku.SkuIndex:
+# ex) {'revised': {'PREM-646-MEDIUM': 'PREM-646-MED'}, 'vs': {...}, 'stex': {...}}
+# 	version : bumped by every change to SkuRemap
+# 	items_version : version the current snapshot's items were normalized
+# 	with, None if they are a mix (see _mark_items_remap_version)
+def _get_sku_remap(conn: sqlite3.Connection) -> tuple[int, int | None, dict[str, dict[str, str]]]:
+	cur = conn.cursor()
+	version, items_version = _get_sku_remap_version(conn)
+
+	remap: dict[str, dict[str, str]] = {}
+	query = """
+		SELECT kind, sku, remap
+		FROM SkuRemap
+		ORDER BY kind, sku
+	"""
+	with timer('premier_db_query_seconds', query='sku_remap'):
+		for kind, sku, target in cur.execute(query):
+			remap.setdefault(kind, {})[sku] = target
+
+	return version, items_version, remap
+
+
+def _get_sku_remap_version(conn: sqlite3.Connection) -> tuple[int, int | None]:
+	cur = conn.cursor()
+	query = """
+		SELECT version, (SELECT version FROM Item_Remap)
+		FROM SkuRemapVersion
+	"""
+	return cur.execute(query).fetchone()
+
+
+# add or change one remap, ex) ('revised', 'PREM-646-MEDIUM', 'PREM-646-MED');
+# the caller owns the transaction
+def _set_sku_remap(conn: sqlite3.Connection, kind: str, sku: str, remap: str) -> None:
+	cur = conn.cursor()
+	query = """
+		INSERT INTO SkuRemap (kind, sku, remap)
+		VALUES (?, ?, ?)
+		ON CONFLICT (kind, sku) DO UPDATE SET
+			remap = excluded.remap
+		WHERE remap != excluded.remap;
+	"""
+	cur.execute(query, (kind, sku, remap))
+
+
+def _delete_sku_remap(conn: sqlite3.Connection, kind: str, sku: str) -> None:
+	cur = conn.cursor()
+	query = """
+		DELETE FROM SkuRemap
+		WHERE kind = ? AND sku = ?
+	"""
+	cur.execute(query, (kind, sku))
+
+
+# Record that items normalized with SkuRemap version were written; if the
+# items already in the snapshot were normalized with another version, they
+# are now a mix and need re-normalizing (Item_Remap.version None)
+def _mark_items_remap_version(conn: sqlite3.Connection, version: int) -> None:
+	cur = conn.cursor()
+	query = """
+		UPDATE Item_Remap
+		SET version = NULL
+		WHERE version IS NOT ?
+	"""
+	cur.execute(query, (version,))
+
+
+# every distinct SKU the items were normalized from, with the cleaned SKU
+# it was normalized to, ex) [('PREM-646-MEDIUM', 'Premier Shirt 646', 'PREM-646-MED')]
+# 	description : the item's description, which an item without a usable
+# 	SKU (see app.sku.has_sku) is normalized from instead
+def _get_item_skus(conn: sqlite3.Connection) -> list[tuple[str | None, str | None, str]]:
+	cur = conn.cursor()
+	query = """
+		SELECT DISTINCT raw_sku, description, sku
+		FROM Item
+	"""
+	with timer('premier_db_query_seconds', query='item_skus'):
+		return cur.execute(query).fetchall()
+
+
+# Re-normalize items in one pass over Item, the PickList triggers keep the
+# pick list in step, and record the SkuRemap version they now match; the
+# caller owns the transaction
+# 	changes : (raw_sku, description, old sku, new sku, style, size) for
+# 	every distinct SKU whose cleaned SKU changed
+# returns the number of items changed
+def _renormalize_items(
+	conn: sqlite3.Connection,
+	changes: list[tuple[str | None, str | None, str, str, str, str | None]],
+	version: int
+) -> int:
+	cur = conn.cursor()
+	changed: int = 0
+
+	if changes:
+		cur.execute("""
+			CREATE TEMP TABLE IF NOT EXISTS SkuChange (
+				raw_sku TEXT, 
+				description TEXT, 
+				old_sku TEXT, 
+				sku TEXT, 
+				style TEXT, 
+				size TEXT
+			)
+		""")
+		cur.execute("DELETE FROM temp.SkuChange")
+		cur.executemany("INSERT INTO temp.SkuChange VALUES (?, ?, ?, ?, ?, ?)", changes)
+
+		query = """
+			UPDATE Item
+			SET sku = SkuChange.sku, style = SkuChange.style, size = SkuChange.size
+			FROM temp.SkuChange
+			WHERE Item.sku = SkuChange.old_sku
+				AND Item.raw_sku IS SkuChange.raw_sku
+				AND Item.description IS SkuChange.description
+		"""
+		with timer('premier_db_query_seconds', query='renormalize_items'):
+			changed = cur.execute(query).rowcount
+		cur.execute("DELETE FROM temp.SkuChange")
+
+	cur.execute("UPDATE Item_Remap SET version = ?", (version,))
+	return changed
+
+
+# the remaps SkuRemap starts with: app.sku's defaults, and the revised SKUs
+# of the app.sku_map module SKU revisions used to be kept in, if any
+def _default_sku_remap() -> list[tuple[str, str, str]]:
+	try:
+		from app.sku_map import MAP
+	except ImportError:
+		MAP = {}
+
+	return (
+		[('revised', sku, remap) for sku, remap in MAP.items()]
+		+ [('vs', style, remap) for style, remap in VS_MAP.items()]
+		+ [('stex', color, location) for color, location in STEX_LOCATIONS.items()]
+	)
+
+
+# bump when the schema of the order tables changes; they only hold a copy
+# of the open orders upstream, so a snapshot with an older schema is
+# emptied and refilled on the next refresh, but Note and SkuRemap are
+# always kept. Version 6 moved the order tables out of the main db into
+# snapshots, see _attach_snapshot
+SCHEMA_VERSION: int = 6
+
+
+# create tables for Notes, SKU remaps, shared state, snapshots and the
+# order archive in the main db, and a first, empty snapshot of the order
+# data, if they don't exist
 def create_tables():
-	conn = _connect_db()
+	# its own connection without a snapshot attached: BEGIN IMMEDIATE takes
+	# the write lock of every attached db, the snapshot's is taken below
+	conn = _open_db(SQLITE_DATABASE_URI)
 
 	cur = conn.cursor()
-	cur.execute("DROP TABLE IF EXISTS Customer_Order")
-	cur.execute("DROP TABLE IF EXISTS Item")
-	cur.execute("DROP TABLE IF EXISTS Note")
+	# every worker process creates the tables at startup, one at a time
+	cur.execute("BEGIN IMMEDIATE")
+	version: int = cur.execute("PRAGMA main.user_version").fetchone()[0]
+	if version < 6:
+		cur.execute("DROP TABLE IF EXISTS main.Customer_Order")
+		cur.execute("DROP TABLE IF EXISTS main.Item")
+		cur.execute("DROP TABLE IF EXISTS main.Sync_State")
+		cur.execute("DROP TABLE IF EXISTS main.PickList")
+		cur.execute("DROP TABLE IF EXISTS main.SizeRank")
+		columns: list[str] = [row[0] for row in cur.execute("SELECT name FROM pragma_table_info('SkuRemapVersion')")]
+		if 'items_version' in columns:
+			cur.execute("ALTER TABLE SkuRemapVersion DROP COLUMN items_version")
+
+	note_table = """
+		CREATE TABLE IF NOT EXISTS Note (
+			id INTEGER PRIMARY KEY,
+			note TEXT
+		);
+	"""
+
+	# the SKU remaps (see app.sku.SkuIndex), kind is one of app.sku.REMAP_KINDS,
+	# ex) ('revised', 'PREM-646-MEDIUM', 'PREM-646-MED'); every change to
+	# them bumps SkuRemapVersion.version, see the triggers below
+	sku_remap_table = """
+		CREATE TABLE IF NOT EXISTS SkuRemap (
+			kind TEXT,
+			sku TEXT,
+			remap TEXT,
+			PRIMARY KEY (kind, sku)
+		);
+	"""
+
+	# one row, see _get_sku_remap
+	sku_remap_version_table = """
+		CREATE TABLE IF NOT EXISTS SkuRemapVersion (
+			version INTEGER
+		);
+	"""
+	# see _get_generation
+	shared_state_table = """
+		CREATE TABLE IF NOT EXISTS Shared_State (
+			key TEXT PRIMARY KEY,
+			value
+		);
+	"""
+
+	# every refresh, see _claim_refresh
+	# 	owner : 'host:pid' of the worker process running it
+	# 	started, finished : unix times
+	# 	job : the refresh's progress as JSON, see app.worker.RefreshJob.as_json
+	refresh_job_table = """
+		CREATE TABLE IF NOT EXISTS Refresh_Job (
+			id TEXT PRIMARY KEY,
+			state TEXT,
+			owner TEXT,
+			started REAL,
+			finished REAL,
+			job TEXT
+		);
+	"""
+
+	# every kept snapshot of the order data, see _publish_snapshot
+	# 	name : the file is _snapshot_path(name)
+	# 	created : unix time
+	# 	orders : number of orders in it
+	snapshot_table = """
+		CREATE TABLE IF NOT EXISTS Snapshot (
+			name TEXT PRIMARY KEY,
+			created REAL,
+			orders INTEGER
+		);
+	"""
+	# the order archive, see _archive_orders; WITHOUT ROWID stores each
+	# table in its key's order, so the rows of a day are stored together
+	# 	archived : unix time of the refresh that archived the order
+	# 	line : the item's place in its order
+	archive_order_table = """
+		CREATE TABLE IF NOT EXISTS Archive_Order (
+			day TEXT,
+			store TEXT,
+			order_number TEXT,
+			iso_datetime TEXT,
+			customer TEXT,
+			archived REAL,
+			PRIMARY KEY (day, store, order_number)
+		) WITHOUT ROWID;
+	"""
+	archive_item_table = """
+		CREATE TABLE IF NOT EXISTS Archive_Item (
+			day TEXT,
+			store TEXT,
+			order_number TEXT,
+			line INTEGER,
+			sku TEXT,
+			quantity INTEGER,
+			style TEXT,
+			size TEXT,
+			raw_sku TEXT,
+			PRIMARY KEY (day, store, order_number, line)
+		) WITHOUT ROWID;
+	"""
+
+	# total quantity of every style and size each store's archived orders
+	# of a day had, see _get_history
+	# 	size, size_rank, sort_key : as in PickList
+	# 	items, orders : number of Item rows and orders counted
+	daily_rollup_table = """
+		CREATE TABLE IF NOT EXISTS Daily_Rollup (
+			day TEXT,
+			style TEXT,
+			size TEXT,
+			store TEXT,
+			size_rank INTEGER,
+			sort_key TEXT,
+			quantity INTEGER,
+			items INTEGER,
+			orders INTEGER,
+			PRIMARY KEY (day, style, size, store)
+		) WITHOUT ROWID;
+	"""
+
+	# an order is archived once, whatever day it is on
+	archive_order_key_index = """
+		CREATE UNIQUE INDEX IF NOT EXISTS archive_order_key_idx
+		ON Archive_Order (store, order_number);
+	"""
+	cur.execute(note_table)
+	cur.execute(sku_remap_table)
+	cur.execute(sku_remap_version_table)
+	cur.execute(shared_state_table)
+	cur.execute(refresh_job_table)
+	cur.execute(snapshot_table)
+	cur.execute(archive_order_table)
+	cur.execute(archive_item_table)
+	cur.execute(daily_rollup_table)
+	cur.execute(archive_order_key_index)
+
+	if cur.execute("SELECT COUNT(*) FROM SkuRemapVersion").fetchone()[0] == 0:
+		cur.execute("INSERT INTO SkuRemapVersion (version) VALUES (0)")
+		cur.executemany("INSERT INTO SkuRemap (kind, sku, remap) VALUES (?, ?, ?)", _default_sku_remap())
+
+	for event in ('INSERT', 'UPDATE', 'DELETE'):
+		cur.execute(f"""
+			CREATE TRIGGER IF NOT EXISTS sku_remap_{event.lower()}_version
+			AFTER {event} ON SkuRemap
+			BEGIN
+				UPDATE SkuRemapVersion SET version = version + 1;
+			END;
+		""")
+
+	# the current snapshot, or a new empty one if there is none
+	row = cur.execute("SELECT value FROM Shared_State WHERE key = 'snapshot'").fetchone()
+	name: str | None = row[0] if row is not None else None
+	created: bool = name is None or not os.path.exists(_snapshot_path(name))
+	if created:
+		name = _new_snapshot_name()
+
+	snapshot = _open_db(_snapshot_path(name))
+	try:
+		_create_snapshot_tables(snapshot)
+	finally:
+		snapshot.close()
+
+	if created:
+		cur.execute("INSERT INTO Snapshot (name, created, orders) VALUES (?, ?, 0)", (name, time.time()))
+		_point_snapshot(conn, name)
+
+	cur.execute(f"PRAGMA main.user_version = {SCHEMA_VERSION}")
+	conn.commit()
+	conn.close()
+
+
+# create the order tables of a snapshot (conn is connected to its file
+# alone) if they don't exist, and bring SizeRank up to date
+def _create_snapshot_tables(conn: sqlite3.Connection) -> None:
+	cur = conn.cursor()
+	cur.execute("BEGIN IMMEDIATE")
+	version: int = cur.execute("PRAGMA user_version").fetchone()[0]
+	if version < SCHEMA_VERSION:
+		cur.execute("DROP TABLE IF EXISTS Customer_Order")
+		cur.execute("DROP TABLE IF EXISTS Item")
+		cur.execute("DROP TABLE IF EXISTS Sync_State")
+		cur.execute("DROP TABLE IF EXISTS PickList")
+		cur.execute("DROP TABLE IF EXISTS SizeRank")
+		cur.execute("DROP TABLE IF EXISTS Item_Remap")
+		cur.execute("DROP TABLE IF EXISTS Order_Search")
+		cur.execute("DROP VIEW IF EXISTS Order_Search_Source")
 
 	order_table = """
-		CREATE TABLE Customer_Order (
+		CREATE TABLE IF NOT EXISTS Customer_Order (
 			id INTEGER PRIMARY KEY,
 			store TEXT,
 			order_number TEXT,
 			iso_datetime TEXT,
 			order_datetime TEXT,
-			customer TEXT
+			customer TEXT,
+			modify_date TEXT
 		);
 	"""
 
 	item_table = """
-		CREATE TABLE Item (
+		CREATE TABLE IF NOT EXISTS Item (
 			id INTEGER PRIMARY KEY,
+			store TEXT,
 			sku TEXT,
 			quantity INTEGER,
 			order_number TEXT,
-			FOREIGN KEY (order_number) 
-			REFERENCES Customer_Order (order_number) 
+			style TEXT,
+			size TEXT,
+			raw_sku TEXT,
+			description TEXT,
+			FOREIGN KEY (store, order_number) 
+			REFERENCES Customer_Order (store, order_number) 
 				ON DELETE CASCADE
 		);
 	"""
 
-	note_table = """
-		CREATE TABLE Note (
-			id INTEGER PRIMARY KEY,
-			note TEXT
+	sync_table = """
+		CREATE TABLE IF NOT EXISTS Sync_State (
+			store TEXT PRIMARY KEY,
+			high_water_mark TEXT,
+			last_full_sync TEXT,
+			payload_hash TEXT
+		);
+	"""
+	# sort sizes in logical order, a size is ranked by its first two
+	# characters, see app.sku.SIZE_ORDERING
+	size_rank_table = """
+		CREATE TABLE IF NOT EXISTS SizeRank (
+			prefix TEXT PRIMARY KEY,
+			size_rank INTEGER
+		);
+	"""
+
+	# the pick list, materialized: total quantity of every style and size
+	# of the open orders, kept up to date by the triggers on Item below
+	# 	size : '' for irregular SKUs, which don't have a size (NULL in Item)
+	# 	sort_key : pick list order of the style; sizes then sort by size_rank
+	# 	items : number of Item rows counted, the row is deleted at zero
+	pick_list_table = """
+		CREATE TABLE IF NOT EXISTS PickList (
+			style TEXT,
+			size TEXT,
+			size_rank INTEGER,
+			sort_key TEXT,
+			quantity INTEGER,
+			items INTEGER,
+			PRIMARY KEY (style, size)
+		);
+	"""
+
+	# one row: the SkuRemap version the items were normalized with, see
+	# _get_sku_remap; it lives with the items so a snapshot carries it along
+	item_remap_table = """
+		CREATE TABLE IF NOT EXISTS Item_Remap (
+			version INTEGER
 		);
 	"""
 	cur.execute(order_table)
 	cur.execute(item_table)
-	cur.execute(note_table)
+	cur.execute(sync_table)
+	cur.execute(size_rank_table)
+	cur.execute(pick_list_table)
+	cur.execute(item_remap_table)
+
+	if cur.execute("SELECT COUNT(*) FROM Item_Remap").fetchone()[0] == 0:
+		cur.execute("INSERT INTO Item_Remap (version) VALUES (NULL)")
+
+	# full-text search over the open orders (see _search_orders), one row
+	# per item with the Item id as its rowid; '-' and '_' are part of a
+	# token, so a SKU or order number is one token and 'PREM-6*' matches it
+	# by prefix. The index reads its text from Order_Search_Source and
+	# stores none of it; a refresh that fully syncs a store, and so replaces
+	# its every item, rebuilds it (see _index_search) rather than keeping it
+	# up to date row by row, one that only syncs changed orders updates it
+	# for those (see _unindex_orders). A snapshot made before it existed is
+	# indexed here
+	search_source_view = """
+		CREATE VIEW IF NOT EXISTS Order_Search_Source AS
+		SELECT Item.id, Item.order_number, Customer_Order.customer, Item.sku, Item.raw_sku, Item.description, Item.store
+		FROM Item
+		INNER JOIN Customer_Order ON Customer_Order.store = Item.store AND Customer_Order.order_number = Item.order_number
+	"""
+	order_search_table = """
+		CREATE VIRTUAL TABLE Order_Search USING fts5 (
+			order_number,
+			customer,
+			sku,
+			raw_sku,
+			description,
+			store UNINDEXED,
+			content = 'Order_Search_Source',
+			content_rowid = 'id',
+			tokenize = "unicode61 tokenchars '-_'"
+		);
+	"""
+	cur.execute(search_source_view)
+	if cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'Order_Search'").fetchone() is None:
+		cur.execute(order_search_table)
+		cur.execute("INSERT INTO Order_Search (Order_Search) VALUES ('rebuild')")
+
+	# items whose size has no rank are coupon codes and are not picked; a
+	# style sorts as it did when the pick list was sorted as strings,
+	# 'style?sizes' or 'style (quantity)' for irregular SKUs
+	cur.execute("DROP TRIGGER IF EXISTS item_insert_pick_list")
+	cur.execute("DROP TRIGGER IF EXISTS item_delete_pick_list")
+	cur.execute("DROP TRIGGER IF EXISTS item_update_old_pick_list")
+	cur.execute("DROP TRIGGER IF EXISTS item_update_new_pick_list")
+
+	item_insert_trigger = f"""
+		CREATE TRIGGER item_insert_pick_list
+		AFTER INSERT ON Item
+		WHEN NEW.size IS NULL OR EXISTS (SELECT 1 FROM SizeRank WHERE prefix = substr(NEW.size, 1, 2))
+		BEGIN
+			INSERT INTO PickList (style, size, size_rank, sort_key, quantity, items)
+			VALUES (
+				NEW.style, 
+				COALESCE(NEW.size, ''), 
+				CASE 
+					WHEN NEW.size IS NULL THEN {NO_SIZE_RANK} 
+					ELSE (SELECT size_rank FROM SizeRank WHERE prefix = substr(NEW.size, 1, 2)) 
+				END, 
+				NEW.style || CASE WHEN NEW.size IS NULL THEN char(10) ELSE '?' END, 
+				NEW.quantity, 
+				1
+			)
+			ON CONFLICT (style, size) DO UPDATE SET 
+				quantity = quantity + excluded.quantity, 
+				items = items + 1;
+		END;
+	"""
+
+	item_delete_trigger = """
+		CREATE TRIGGER item_delete_pick_list
+		AFTER DELETE ON Item
+		WHEN OLD.size IS NULL OR EXISTS (SELECT 1 FROM SizeRank WHERE prefix = substr(OLD.size, 1, 2))
+		BEGIN
+			UPDATE PickList
+			SET quantity = quantity - OLD.quantity, items = items - 1
+			WHERE style = OLD.style AND size = COALESCE(OLD.size, '');
 
-	# index store name, because it is used to query for metadata
-	store_idx = """
-		CREATE INDEX store_idx
-		ON Customer_Order (store);
+			DELETE FROM PickList
+			WHERE style = OLD.style AND size = COALESCE(OLD.size, '') AND items <= 0;
+		END;
 	"""
+	# a re-normalized item (see _renormalize_items) moves its quantity from
+	# its old style and size to the new ones, as a delete and an insert
+	item_update_old_trigger = """
+		CREATE TRIGGER item_update_old_pick_list
+		AFTER UPDATE OF style, size, quantity ON Item
+		WHEN OLD.size IS NULL OR EXISTS (SELECT 1 FROM SizeRank WHERE prefix = substr(OLD.size, 1, 2))
+		BEGIN
+			UPDATE PickList
+			SET quantity = quantity - OLD.quantity, items = items - 1
+			WHERE style = OLD.style AND size = COALESCE(OLD.size, '');
 
-	# index customer order date, because it is used to query for metadata
-	iso_dt_idx = """
-		CREATE INDEX iso_dt_idx
-		ON Customer_Order (iso_datetime);
+			DELETE FROM PickList
+			WHERE style = OLD.style AND size = COALESCE(OLD.size, '') AND items <= 0;
+		END;
 	"""
-	cur.execute(store_idx)
-	cur.execute(iso_dt_idx)
 
-	_close_db(conn)
\ No newline at end of file
+	item_update_new_trigger = f"""
+		CREATE TRIGGER item_update_new_pick_list
+		AFTER UPDATE OF style, size, quantity ON Item
+		WHEN NEW.size IS NULL OR EXISTS (SELECT 1 FROM SizeRank WHERE prefix = substr(NEW.size, 1, 2))
+		BEGIN
+			INSERT INTO PickList (style, size, size_rank, sort_key, quantity, items)
+			VALUES (
+				NEW.style, 
+				COALESCE(NEW.size, ''), 
+				CASE 
+					WHEN NEW.size IS NULL THEN {NO_SIZE_RANK} 
+					ELSE (SELECT size_rank FROM SizeRank WHERE prefix = substr(NEW.size, 1, 2)) 
+				END, 
+				NEW.style || CASE WHEN NEW.size IS NULL THEN char(10) ELSE '?' END, 
+				NEW.quantity, 
+				1
+			)
+			ON CONFLICT (style, size) DO UPDATE SET 
+				quantity = quantity + excluded.quantity, 
+				items = items + 1;
+		END;
+	"""
+	cur.execute(item_insert_trigger)
+	cur.execute(item_delete_trigger)
+	cur.execute(item_update_old_trigger)
+	cur.execute(item_update_new_trigger)
+
+	# a re-normalized item's new SKU is searchable at once, without waiting
+	# for a rebuild; its old text is taken out of the index first
+	cur.execute("DROP TRIGGER IF EXISTS item_update_search")
+
+	item_update_search_trigger = """
+		CREATE TRIGGER item_update_search
+		AFTER UPDATE OF sku ON Item
+		BEGIN
+			INSERT INTO Order_Search (Order_Search, rowid, order_number, customer, sku, raw_sku, description, store)
+			SELECT 'delete', OLD.id, OLD.order_number, customer, OLD.sku, OLD.raw_sku, OLD.description, OLD.store
+			FROM Customer_Order
+			WHERE store = OLD.store AND order_number = OLD.order_number;
+
+			INSERT INTO Order_Search (rowid, order_number, customer, sku, raw_sku, description, store)
+			SELECT NEW.id, NEW.order_number, customer, NEW.sku, NEW.raw_sku, NEW.description, NEW.store
+			FROM Customer_Order
+			WHERE store = NEW.store AND order_number = NEW.order_number;
+		END;
+	"""
+	cur.execute(item_update_search_trigger)
+
+	# an order is identified by its store and order number, this is the
+	# key refreshes upsert on
+	order_key_idx = """
+		CREATE UNIQUE INDEX IF NOT EXISTS order_key_idx
+		ON Customer_Order (store, order_number);
+	"""
+
+	# index store name and customer order date, because a store's metadata
+	# is paged newest first; the rowid in the index breaks datetime ties
+	store_iso_dt_idx = """
+		CREATE INDEX IF NOT EXISTS store_iso_dt_idx
+		ON Customer_Order (store, iso_datetime);
+	"""
+	cur.execute("DROP INDEX IF EXISTS store_idx")
+	cur.execute("DROP INDEX IF EXISTS iso_dt_idx")
+
+	# index an item's order, because items are replaced and deleted by order
+	item_order_idx = """
+		CREATE INDEX IF NOT EXISTS item_order_idx
+		ON Item (store, order_number);
+	"""
+	# pick list order, covering so /pick-list is read straight off the index
+	pick_list_idx = """
+		CREATE INDEX IF NOT EXISTS pick_list_idx
+		ON PickList (sort_key, size_rank, size, style, quantity);
+	"""
+	cur.execute(order_key_idx)
+	cur.execute(pick_list_idx)
+	cur.execute(store_iso_dt_idx)
+	cur.execute(item_order_idx)
+
+	# keep SizeRank in step with SIZE_ORDERING, re-ranking the pick list
+	# when the ordering changed
+	size_ranks: dict[str, int] = dict(cur.execute("SELECT prefix, size_rank FROM SizeRank"))
+	if size_ranks != SIZE_ORDERING:
+		cur.execute("DELETE FROM SizeRank")
+		cur.executemany("INSERT INTO SizeRank (prefix, size_rank) VALUES (?, ?)", SIZE_ORDERING.items())
+		_rebuild_pick_list(conn)
+
+	cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+	conn.commit()
\ No newline at end of file
@@ -0,0 +1,317 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, TextIO
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from app import (
+	logger, 
+	FETCH_MAX_WORKERS, 
+	FETCH_STORE_CONCURRENCY, 
+	FETCH_TIMEOUT, 
+	FETCH_MODE, 
+	FETCH_RECORD_DIR, 
+	FETCH_REPLAY_LATENCY, 
+	FETCH_CACHE_DIR
+)
+from app.replay import RecordingAdapter, ReplayAdapter
+from app.metrics import timer, inc
+from app.secrets import AUTH
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+# feed bodies are streamed and decoded this many bytes (characters) at a time
+FEED_CHUNK_SIZE: int = 64 * 1024
+_scratch_dir: str | None = None
+
+# caps the number of simultaneous calls to any one store's endpoints
+_store_semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+# wall clock seconds each store took during the most recent fetch, ex)
+# { 'Amazon': 1.42, 'eBay': 0.38 }
+last_timings: dict[str, float] = {}
+
+
+# the transport for FETCH_MODE, see app.replay
+def _make_adapter() -> BaseAdapter:
+	if FETCH_MODE == 'replay':
+		return ReplayAdapter(FETCH_RECORD_DIR, FETCH_REPLAY_LATENCY)
+	if FETCH_MODE == 'record':
+		return RecordingAdapter(FETCH_RECORD_DIR, pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS)
+	return HTTPAdapter(pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS)
+
+
+# One keep-alive session shared by every call, so each store reuses its
+# pooled TCP/TLS connection instead of opening a new one per request
+def _get_session() -> requests.Session:
+	global _session
+
+	with _session_lock:
+		if _session is None:
+			session = requests.Session()
+			session.auth = AUTH
+			# order payloads are large and compress well
+			session.headers['Accept-Encoding'] = 'gzip, deflate'
+			adapter = _make_adapter()
+			session.mount('https://', adapter)
+			session.mount('http://', adapter)
+			_session = session
+
+	return _session
+
+
+def _get_semaphore(store: str) -> threading.BoundedSemaphore:
+	with _session_lock:
+		if store not in _store_semaphores:
+			_store_semaphores[store] = threading.BoundedSemaphore(FETCH_STORE_CONCURRENCY)
+		return _store_semaphores[store]
+
+
+# Send a request to one of a store's endpoints and return the decoded JSON;
+# params are merged into any query string the endpoint already has
+def _request_json(
+	store: str, 
+	method: str, 
+	url: str, 
+	params: dict[str, str] | None = None
+) -> dict[str, Any]:
+	with _get_semaphore(store):
+		with timer('premier_fetch_seconds', store=store, method=method):
+			resp = _get_session().request(method, url, params=params, timeout=FETCH_TIMEOUT)
+
+	with timer('premier_json_decode_seconds', store=store):
+		return resp.json()
+
+
+# the cache entry of a feed: ETag, Last-Modified and content hash of its
+# last response, whose body is kept beside it as <key>.json.gz; a feed is
+# keyed on its URL alone, so the cache holds one response per feed however
+# its query parameters (ex: the incremental sync date) change
+def _cache_key(url: str) -> str:
+	return hashlib.sha1(url.encode()).hexdigest()
+
+
+# where feed bodies are streamed to: FETCH_CACHE_DIR, or a scratch
+# directory when the cache is disabled
+def _feed_dir() -> str:
+	global _scratch_dir
+
+	if FETCH_CACHE_DIR is not None:
+		os.makedirs(FETCH_CACHE_DIR, exist_ok=True)
+		return FETCH_CACHE_DIR
+
+	with _session_lock:
+		if _scratch_dir is None:
+			_scratch_dir = tempfile.mkdtemp(prefix='premier-feeds-')
+	return _scratch_dir
+
+
+def _read_cache_entry(key: str) -> dict[str, str] | None:
+	if FETCH_CACHE_DIR is None:
+		return None
+	try:
+		with open(os.path.join(FETCH_CACHE_DIR, key + '.meta.json')) as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+
+def _write_cache_entry(key: str, entry: dict[str, str]) -> None:
+	path = os.path.join(FETCH_CACHE_DIR, key + '.meta.json')
+	with open(path + '.tmp', 'w') as f:
+		json.dump(entry, f)
+	os.replace(path + '.tmp', path)
+
+
+# GET a feed conditionally against its cached response and stream the body
+# to disk, gzipped, without decoding it; returns the body's path and its
+# content hash. A 304 Not Modified, or the same bytes again, keeps the
+# cached body; see _iter_feed to read it.
+def _fetch_feed(
+	store: str, 
+	url: str, 
+	params: dict[str, str] | None = None
+) -> tuple[str, str]:
+	key = _cache_key(url)
+	path = os.path.join(_feed_dir(), key + '.json.gz')
+	entry = _read_cache_entry(key)
+
+	headers: dict[str, str] = {}
+	if entry is not None:
+		if entry.get('etag'):
+			headers['If-None-Match'] = entry['etag']
+		if entry.get('last_modified'):
+			headers['If-Modified-Since'] = entry['last_modified']
+
+	digest = hashlib.blake2b(digest_size=16)
+
+	with _get_semaphore(store):
+		with timer('premier_fetch_seconds', store=store, method='GET'):
+			with _get_session().get(url, params=params, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as resp:
+				if resp.status_code == 304 and entry is not None:
+					inc('premier_fetch_unchanged_total', store=store, reason='not_modified')
+					return path, entry['hash']
+
+				resp.raise_for_status()
+				with gzip.open(path + '.tmp', 'wb', compresslevel=1) as f:
+					for chunk in resp.iter_content(chunk_size=FEED_CHUNK_SIZE):
+						digest.update(chunk)
+						f.write(chunk)
+
+	content_hash = digest.hexdigest()
+	if entry is not None and entry['hash'] == content_hash:
+		inc('premier_fetch_unchanged_total', store=store, reason='same_hash')
+		os.remove(path + '.tmp')
+	else:
+		os.replace(path + '.tmp', path)
+
+	if FETCH_CACHE_DIR is not None:
+		new_entry = {
+			'url': url,
+			'etag': resp.headers.get('ETag', ''),
+			'last_modified': resp.headers.get('Last-Modified', ''),
+			'hash': content_hash,
+		}
+		if new_entry != entry:
+			_write_cache_entry(key, new_entry)
+
+	return path, content_hash
+
+
+# Decode the items of the array under key in a JSON object one at a time,
+# reading f a chunk at a time, ex) {"orders": [{...}, {...}], "total": 2}
+# yields each order; the rest of the object is decoded and dropped, so
+# memory holds one item and one chunk however long the array is
+def _iter_json_array(f: TextIO, key: str) -> Iterator[Any]:
+	decoder = json.JSONDecoder()
+	buf: str = ''
+	pos: int = 0
+	eof: bool = False
+
+	def fill() -> None:
+		nonlocal buf, pos, eof
+		chunk = f.read(FEED_CHUNK_SIZE)
+		if not chunk:
+			eof = True
+		buf = buf[pos:] + chunk
+		pos = 0
+
+	# skip whitespace to the next character, which must be in expected
+	def skip(expected: str | None = None) -> str:
+		nonlocal pos
+		while True:
+			while pos < len(buf) and buf[pos] in ' \t\r\n':
+				pos += 1
+			if pos < len(buf):
+				break
+			if eof:
+				raise ValueError(f'expected one of {expected!r}, got end of input')
+			fill()
+		char = buf[pos]
+		if expected is not None and char not in expected:
+			raise ValueError(f'expected one of {expected!r}, got {char!r}')
+		return char
+
+	# a value must end before the buffer does, and not be followed by what
+	# could still be part of a number, or the buffer may hold only part of
+	# it, ex: 1.5 cut off as 1 between two chunks
+	def value() -> Any:
+		nonlocal pos
+		skip()
+		while True:
+			try:
+				item, end = decoder.raw_decode(buf, pos)
+				if eof or (end < len(buf) and buf[end] not in '0123456789.eE+-'):
+					pos = end
+					return item
+			except json.JSONDecodeError:
+				if eof:
+					raise
+			fill()
+
+	fill()
+	skip('{')
+	pos += 1
+
+	while skip('"}') == '"':
+		name = value()
+		skip(':')
+		pos += 1
+
+		if name != key:
+			value()
+		else:
+			skip('[')
+			pos += 1
+			if skip() != ']':
+				while True:
+					yield value()
+					if skip(',]') == ']':
+						break
+					pos += 1
+			pos += 1
+
+		if skip(',}') == '}':
+			break
+		pos += 1
+
+
+# The items under key of a feed body written by _fetch_feed, decoded lazily
+def _iter_feed(path: str, key: str = 'orders') -> Iterator[Any]:
+	with gzip.open(path, 'rt', encoding='utf-8') as f:
+		yield from _iter_json_array(f, key)
+
+
+def _post_json(store: str, url: str) -> dict[str, Any]:
+	return _request_json(store, 'POST', url)
+
+
+# Run every (store, function) job on the thread pool and return the results
+# in the same order as the jobs; the first exception raised by a job is
+# re-raised here. Total latency is about the slowest store, not the sum.
+# 	on_store_done : called with (store, seconds) as soon as every job of
+# 	a store has finished, ex: to report refresh progress
+def _run_concurrently(
+	jobs: list[tuple[str, Callable[[], Any]]],
+	on_store_done: Callable[[str, float], None] | None = None
+) -> list[Any]:
+	started: dict[str, float] = {}
+	finished: dict[str, float] = {}
+	remaining: dict[str, int] = {}
+	lock = threading.Lock()
+
+	for store, _ in jobs:
+		remaining[store] = remaining.get(store, 0) + 1
+
+	def timed(store: str, fn: Callable[[], Any]) -> Any:
+		start = time.perf_counter()
+		try:
+			return fn()
+		finally:
+			end = time.perf_counter()
+			with lock:
+				started[store] = min(started.get(store, start), start)
+				finished[store] = max(finished.get(store, end), end)
+				remaining[store] -= 1
+				done = remaining[store] == 0
+			if done and on_store_done is not None:
+				on_store_done(store, round(finished[store] - started[store], 3))
+
+	with ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS) as pool:
+		futures = [pool.submit(timed, store, fn) for store, fn in jobs]
+		results = [future.result() for future in futures]
+
+	for store in started:
+		last_timings[store] = round(finished[store] - started[store], 3)
+		logger.info('fetch %s: %.3fs', store, last_timings[store])
+
+	return results
@@ -1,6 +1,8 @@
 from flask_wtf import FlaskForm
-from wtforms import TextAreaField, SubmitField
-from wtforms.validators import InputRequired
+from wtforms import TextAreaField, SubmitField, SelectField, StringField
+from wtforms.validators import InputRequired, Regexp
+
+from app.sku import REMAP_KINDS
 
 
 # Note
@@ -12,4 +14,12 @@ class NoteForm(FlaskForm):
 # Edit a note
 class EditNoteForm(FlaskForm):
     note = TextAreaField('Edit note', validators=[InputRequired()])
+    save = SubmitField('Save')
+
+
+# Add or change a SKU remap, see app.sku.REMAP_KINDS
+class SkuRemapForm(FlaskForm):
+    kind = SelectField('Kind', choices=[(kind, f'{kind}: {about}') for kind, about in REMAP_KINDS.items()])
+    sku = StringField('SKU', validators=[InputRequired(), Regexp(r'^\S+$', message='No spaces')])
+    remap = StringField('Remap to', validators=[InputRequired(), Regexp(r'^\S+$', message='No spaces')])
     save = SubmitField('Save')
\ No newline at end of file
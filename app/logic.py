@@ -1,13 +1,55 @@
 import time
+import hashlib
 import datetime
-import requests
-from typing import Any
-
-from app import SQLITE_DATABASE_URI
-from app.db import create_tables, _connect_db, _close_db
-from app.sku_map import MAP
+import sqlite3
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice, chain
+from typing import Any, Iterable, Iterator
+
+from app import (
+	logger, 
+	SQLITE_DATABASE_URI, 
+	SYNC_MODE, 
+	SYNC_FULL_INTERVAL, 
+	SYNC_OVERLAP, 
+	NORMALIZE_PROCESSES, 
+	NORMALIZE_PROCESS_MIN_ORDERS
+)
+from app.db import (
+	create_tables, 
+	_connect_db, 
+	_close_db, 
+	_insert_orders, 
+	_delete_orders, 
+	_delete_stale_orders, 
+	_get_sync_state, 
+	_set_sync_state,
+	_get_sku_remap,
+	_get_sku_remap_version,
+	_mark_items_remap_version,
+	_get_item_skus,
+	_renormalize_items,
+	_set_sku_remap,
+	_delete_sku_remap,
+	_get_snapshots,
+	_set_snapshot,
+	_search_orders,
+	_index_search,
+	_index_orders,
+	_unindex_orders,
+	_archive_orders,
+	_create_shadow,
+	_publish_snapshot,
+	_discard_snapshot
+)
+from app.fetch import _post_json, _iter_feed, _run_concurrently
+from app.metrics import observe, inc, set_gauge
+from app.cache import bump_generation
+from app.sku import SkuIndex, REMAP_KINDS, clean_sku, normalize_item, split_sku, get_index, load_index, NO_SIZE_RANK
+from app.stores import AMAZON, EBAY, PREM_SHIRTS, NSOTD, BUCKEROO
 from app.secrets import (
-	AUTH,
 	AMZ_USA_REFRESH_ENDPOINT,
 	AMZ_CAN_REFRESH_ENDPOINT,
 	EBAY_REFRESH_ENDPOINT,
@@ -24,131 +66,130 @@ from app.secrets import (
 	BUCK_ENDPOINT
 )
 
+# Every order endpoint as (store, endpoint, is_ebay), in the order the
+# stores are ingested; Amazon sales data is categorized into "awaiting
+# shipment" and "pending fulfillment" for both USA and Canada
+ORDER_ENDPOINTS: list[tuple[str, str, bool]] = [
+	(AMAZON, AMZ_USA_AWAIT_ENDPOINT, False),
+	(AMAZON, AMZ_USA_PEND_ENDPOINT, False),
+	(AMAZON, AMZ_CAN_AWAIT_ENDPOINT, False),
+	(AMAZON, AMZ_CAN_PEND_ENDPOINT, False),
+	(EBAY, EBAY_ENDPOINT, True),
+	(PREM_SHIRTS, PREM_SHIRTS_ENDPOINT, False),
+	(NSOTD, NSOTD_ENDPOINT, False),
+	(BUCKEROO, BUCK_ENDPOINT, False),
+]
+
+# upstream order statuses that take an order off the pick list
+CLOSED_STATUSES: frozenset[str] = frozenset(('shipped', 'cancelled'))
+
+# orders normalized and written at a time while ingesting a feed
+INGEST_BATCH_SIZE: int = 1000
+
+# bounds of the chunks of orders sent to a normalizing process, see _chunks
+NORMALIZE_CHUNK_MIN: int = 250
+NORMALIZE_CHUNK_MAX: int = 5000
+
+
 # Refresh and import orders from all online stores; 
-# creates db tables and throws exception on error
+# creates db tables, returns False (and logs why) if a store's refresh
+# failed or wasn't accepted
 def _refresh_stores() -> bool:
-	try:
-		# Amazon sales restricted to United States and Canada
-		# and each has its own selling channel
-		amazon_usa = requests.post(AMZ_USA_REFRESH_ENDPOINT, auth=AUTH)
-		amazon_can = requests.post(AMZ_CAN_REFRESH_ENDPOINT, auth=AUTH)
-		ebay = requests.post(EBAY_REFRESH_ENDPOINT, auth=AUTH)
-		prem = requests.post(PREM_SHIRTS_REFRESH_ENDPOINT, auth=AUTH)
-		nsotd = requests.post(NSOTD_REFRESH_ENDPOINT, auth=AUTH)
-		buckeroo = requests.post(BUCK_REFRESH_ENDPOINT, auth=AUTH)
+	# Amazon sales restricted to United States and Canada
+	# and each has its own selling channel
+	refreshes: list[tuple[str, str, str]] = [
+		(AMAZON, 'Amazon USA', AMZ_USA_REFRESH_ENDPOINT),
+		(AMAZON, 'Amazon Canada', AMZ_CAN_REFRESH_ENDPOINT),
+		(EBAY, EBAY, EBAY_REFRESH_ENDPOINT),
+		(PREM_SHIRTS, PREM_SHIRTS, PREM_SHIRTS_REFRESH_ENDPOINT),
+		(NSOTD, NSOTD, NSOTD_REFRESH_ENDPOINT),
+		(BUCKEROO, BUCKEROO, BUCK_REFRESH_ENDPOINT),
+	]
 
-		if (
-			amazon_usa.json()['success'] == 'true' 
-			and amazon_can.json()['success'] == 'true' 
-			and ebay.json()['success'] == 'true' 
-			and prem.json()['success'] == 'true' 
-			and nsotd.json()['success'] == 'true' 
-			and buckeroo.json()['success'] == 'true'
-		):
-			create_tables()
-			return True
+	try:
+		# all six refreshes are sent at once over the shared session
+		responses: list[dict[str, Any]] = _run_concurrently([
+			(store, lambda store=store, endpoint=endpoint: _post_json(store, endpoint))
+			for store, _, endpoint in refreshes
+		])
+	except Exception:
+		logger.exception('store refresh failed')
+		return False
 
-	except Exception as e:
-		print(e)
+	# a store that answered without 'success': 'true' didn't refresh
+	failed: list[str] = [
+		f'{name} ({resp!r})'
+		for (_, name, _), resp in zip(refreshes, responses) if resp.get('success') != 'true'
+	]
+	if failed:
+		logger.warning('store refresh failed: %s', ', '.join(failed))
 		return False
 
+	create_tables()
+	return True
+
+
+# Only the fields of an order that normalization and ingest read; an
+# order's addresses, payment and shipping details are dropped as soon as
+# it is decoded
+def _project_order(order: dict[str, Any]) -> dict[str, Any]:
+	return {
+		'orderNumber': order.get('orderNumber'),
+		'orderKey': order.get('orderKey'),
+		'orderStatus': order.get('orderStatus'),
+		'orderDate': order['orderDate'],
+		'modifyDate': order.get('modifyDate'),
+		'billTo': {'name': order['billTo']['name']},
+		'items': [
+			{'sku': item['sku'], 'name': item['name'], 'quantity': item['quantity']}
+			for item in order['items']
+		],
+	}
+
 
-# Returns a List of JSON data for Amazon orders
-def _get_amazon_orders() -> tuple[list[dict[str, Any]]]:
-	# Amazon order metadata, Amazon sales data is categorized into
-	# "awaiting shipment" and "pending fulfillment" 
-	amazon_usa_await_resp = requests.get(AMZ_USA_AWAIT_ENDPOINT, auth=AUTH)
-	amazon_usa_pend_resp = requests.get(AMZ_USA_PEND_ENDPOINT, auth=AUTH)
-	amazon_can_await_resp = requests.get(AMZ_CAN_AWAIT_ENDPOINT, auth=AUTH)
-	amazon_can_pend_resp = requests.get(AMZ_CAN_PEND_ENDPOINT, auth=AUTH)
-
-	amazon_usa_await_orders: list[dict[str, Any]] = amazon_usa_await_resp.json()['orders']
-	amazon_usa_pend_orders: list[dict[str, Any]] = amazon_usa_pend_resp.json()['orders']
-	amazon_can_await_orders: list[dict[str, Any]] = amazon_can_await_resp.json()['orders']
-	amazon_can_pend_orders: list[dict[str, Any]] = amazon_can_pend_resp.json()['orders']
-
-	# For debugging!
-	#
-	# num_orders = str(
-	# 	len(amazon_usa_await_orders) + 
-	# 	len(amazon_usa_pend_orders) + 
-	# 	len(amazon_can_await_orders) + 
-	# 	len(amazon_can_pend_orders)
-	# )
-	# print('\n-> Amazon: ' + num_orders + ' Orders\n')
-
-	return (amazon_usa_await_orders, amazon_usa_pend_orders, amazon_can_await_orders, amazon_can_pend_orders)
-
-
-# Returns a List of JSON data for eBay orders
-def _get_ebay_orders() -> list[dict[str, Any]]:
-	# eBay order metadata
-	ebay_await_resp = requests.get(EBAY_ENDPOINT, auth=AUTH)
-	ebay_orders: list[dict[str, Any]] = ebay_await_resp.json()['orders']
-	
-	# For debugging!
-	#
-	# num_orders = str(len(ebay_orders))
-	# print('\n-> eBay: ' + num_orders + ' Orders\n')
-	
-	return ebay_orders
-
-
-# Returns a List of JSON data for Premier orders
-def _get_prem_orders() -> list[dict[str, Any]]:
-	# Premier Shirts order metadata
-	prem_shirts_await_resp = requests.get(PREM_SHIRTS_ENDPOINT, auth=AUTH)
-	prem_shirts_orders: list[dict[str, Any]] = prem_shirts_await_resp.json()['orders']
-	
-	# For debugging!
-	#
-	# num_orders = str(len(prem_shirts_orders))
-	# print('\n-> Premier Shirts: ' + num_orders + ' Orders\n')
-	
-	return prem_shirts_orders
-
-
-# Returns a List of JSON data for New Shirt of the Day orders
-def _get_nsotd_orders() -> list[dict[str, Any]]:
-	# New Shirt of the Day order metadata
-	nsotd_await_resp = requests.get(NSOTD_ENDPOINT, auth=AUTH)
-	nsotd_orders: list[dict[str, Any]] = nsotd_await_resp.json()['orders']
-
-	# For debugging!
-	#
-	# num_orders = str(len(nsotd_orders))
-	# print('\n-> New Shirt of the Day: ' + num_orders + ' Orders\n')
-	
-	return nsotd_orders
-
-
-# Returns a List of JSON data for Buckeroo orders
-def _get_buckeroo_orders() -> list[dict[str, Any]]:
-	# Buckeroo order metadata
-	buck_await_resp = requests.get(BUCK_ENDPOINT, auth=AUTH)
-	buck_orders: list[dict[str, Any]] = buck_await_resp.json()['orders']
-	
-	# For debugging!
-	#
-	# num_orders = str(len(buck_orders))
-	# print('\n-> Buckeroo: ' + num_orders + ' Orders\n')
-	
-	return buck_orders
+# A feed's orders, projected, decoded one at a time from the body
+# _fetch_feed streamed to disk; nothing is read until iterated
+def _iter_orders(path: str) -> Iterator[dict[str, Any]]:
+	for order in _iter_feed(path, 'orders'):
+		yield _project_order(order)
 
 
-# Parse a store's order metadata and populate its db table
+# query parameters of a store's order feeds for the sync plan (see _get_sync_plan)
+def _order_params(since: dict[str, str | None], store: str) -> dict[str, str] | None:
+	return {'modifyDateStart': since[store]} if since.get(store) else None
+
+
+# one hash of all of a store's feeds (Amazon has four), in ORDER_ENDPOINTS order
+def _store_hash(feed_hashes: list[str]) -> str:
+	return hashlib.blake2b('|'.join(feed_hashes).encode(), digest_size=16).hexdigest()
+
+
+# Parse a store's order metadata into rows for the Customer_Order and Item
+# tables, ex)
+# 	order row: ('eBay', '1234', '2023-05-25T14:50:07.0000000', '05-25-2023 02:50 PM', 'Jane Doe', '2023-05-25T15:02:11.0000000')
+# 	item row:  ('eBay', '1234', 'PREM-646-MED', 2, 'PREM-646', 'MED')
 # 	is_ebay (bool) : eBay's order number is mapped from key 'orderKey',
 # 	while all other stores order numbers are mapped from key 'orderNumber'
-def _parse_store_metadata(
+def _normalize_orders(
 	orders: list[dict[str, Any]], 
 	store: str, 
 	is_ebay: bool = False
-) -> None:
-	conn = _connect_db()
-	
-	# For debugging!
-	#
-	# METADATA = {}
+) -> tuple[list[tuple[str, str, str, str, str, str]], list[tuple[str, str, str, int, str, str | None, str | None, str | None]]]:
+	order_rows, item_rows, seconds = _normalize_chunk(orders, store, is_ebay)
+	_record_normalized(store, seconds, order_rows, item_rows)
+	return order_rows, item_rows
+
+
+# _normalize_orders without recording metrics, so it can run in a worker
+# process (see _normalize_on_pool); returns the rows and seconds it took
+def _normalize_chunk(
+	orders: list[dict[str, Any]], 
+	store: str, 
+	is_ebay: bool = False
+) -> tuple[list[tuple[str, str, str, str, str, str]], list[tuple[str, str, str, int, str, str | None, str | None, str | None]], float]:
+	start = time.perf_counter()
+	order_rows: list[tuple[str, str, str, str, str, str]] = []
+	item_rows: list[tuple[str, str, str, int, str, str | None, str | None, str | None]] = []
 
 	for order in orders:
 		if is_ebay:
@@ -176,15 +217,10 @@ def _parse_store_metadata(
 		# string formatted datetime, ex: "01-23-2022 11:59 PM"
 		str_datetime: str = order_datetime.strftime('%m-%d-%Y %I:%M %p')	
 
-		# insert order into Customer_Order table
-		cur = conn.cursor()
-		new_customer_order = """
-			INSERT INTO Customer_Order (store, order_number, iso_datetime, order_datetime, customer)
-			VALUES (?, ?, ?, ?, ?);
-		"""
-		order_data = (store, order_num, iso_dt, str_datetime, customer)
-		cur.execute(new_customer_order, order_data)
-		conn.commit()
+		# upstream's last modification, used as the store's sync high-water mark
+		modify_dt: str = order.get('modifyDate') or iso_dt
+
+		order_rows.append((store, order_num, iso_dt, str_datetime, customer, modify_dt))
 
 		# list of dictionaries with item information
 		items_list: list[dict[str, Any]] = order['items']
@@ -194,329 +230,479 @@ def _parse_store_metadata(
 			description: str = item['name']   # description we provided
 			quantity: int = item['quantity']
 
-			# Clean the SKU
-			#  
-			# No SKU (NoneType / empty string), or randomly generated SKU
-			if sku is None or sku == '' or sku[:3] == 'wi_': 
-				sku = description
-			# Revised SKU
-			elif sku in MAP: 
-				sku = MAP[sku]
-			# Obsolete SKU
-			elif sku[-3:] == '-SL': 
-				sku = sku[:-3]
-			elif sku[-4:] == '-SLL': 
-				sku = sku[:-4]
-			elif sku[-2:] == '-D': 
-				sku = sku[:-2]
-				
-			sku = _clean_sku(sku)
-
-			# insert item into Item table
-			cur = conn.cursor()
-			new_item = """
-				INSERT INTO Item (order_number, sku, quantity)
-				VALUES (?, ?, ?);
-			"""
-			item_data = (order_num, sku, quantity)
-			cur.execute(new_item, item_data)
-			conn.commit()
-			
-			# For debugging!
-			#
-			# DATA = (str_datetime, store, customer, sku, description, quantity)
-			# if order_num not in METADATA:
-			# 	METADATA[order_num] = [DATA]
-			# else:
-			# 	METADATA[order_num].append(DATA)
+			# Clean the SKU, see app.sku
+			sku = normalize_item(sku, description)
+
+			# style and size maintain the PickList table, which ranks the
+			# size; an irregular SKU doesn't have a size
+			style, size, size_rank = split_sku(sku)
+
+			# what the SKU was normalized from is kept, so the item can be
+			# re-normalized when the SKU remaps change (see _sync_sku_remap),
+			# and searched for along with its description (see _search_query)
+			item_rows.append((
+				store, order_num, sku, quantity, style, None if size_rank == NO_SIZE_RANK else size,
+				item['sku'], description
+			))
+
+	return order_rows, item_rows, time.perf_counter() - start
+
+
+def _record_normalized(
+	store: str, 
+	seconds: float, 
+	order_rows: list[tuple[str, str, str, str, str, str]], 
+	item_rows: list[tuple[str, str, str, int, str, str | None, str | None, str | None]]
+) -> None:
+	observe('premier_normalize_seconds', seconds, store=store)
+	inc('premier_orders_total', len(order_rows), store=store)
+	inc('premier_items_total', len(item_rows), store=store)
+
+
+# Worker processes to normalize on (NORMALIZE_PROCESSES) for one refresh,
+# None if that's off or processes can't be forked here; they are forked,
+# so they start with the SKU index loaded and don't import the app again,
+# and only run _normalize_chunk, which takes no locks
+def _normalize_pool() -> ProcessPoolExecutor | None:
+	if NORMALIZE_PROCESSES <= 0:
+		return None
+
+	try:
+		context = multiprocessing.get_context('fork')
+	except ValueError:
+		return None
+
+	return ProcessPoolExecutor(NORMALIZE_PROCESSES, mp_context=context)
+
+
+# Cut orders into chunks for the normalizing processes: a quarter of each
+# process's share of the orders known so far, within NORMALIZE_CHUNK_MIN
+# and NORMALIZE_CHUNK_MAX, so chunks grow with the payload; big enough
+# that pickling them costs little next to normalizing them, small enough
+# that every process stays busy
+# 	known : orders known to be in the payload, ex: the length of a list,
+# 	or what a stream has read so far
+def _chunks(orders: Iterator[dict[str, Any]], known: int) -> Iterator[list[dict[str, Any]]]:
+	read: int = 0
+
+	while True:
+		size: int = min(max(max(known, read) // (NORMALIZE_PROCESSES * 4), NORMALIZE_CHUNK_MIN), NORMALIZE_CHUNK_MAX)
+		chunk = list(islice(orders, size))
+		if not chunk:
+			return
+		read += len(chunk)
+		yield chunk
+
+
+# Normalize chunks of orders on pool, at most two per process in flight,
+# yielding (order rows, item rows, closed order keys) in chunk order like
+# _normalize_batches; the rows come back as tuples, cheap to pickle
+# 	chunks : (open orders, closed order keys) of each chunk
+def _normalize_on_pool(
+	pool: ProcessPoolExecutor, 
+	store: str, 
+	is_ebay: bool, 
+	chunks: Iterable[tuple[list[dict[str, Any]], list[tuple[str, str]]]]
+) -> Iterator[tuple[list[tuple[str, str, str, str, str, str]], list[tuple[str, str, str, int, str, str | None, str | None, str | None]], list[tuple[str, str]]]]:
+	pending: deque[tuple[Future, list[tuple[str, str]]]] = deque()
+
+	def collect() -> tuple[list[tuple[str, str, str, str, str, str]], list[tuple[str, str, str, int, str, str | None, str | None, str | None]], list[tuple[str, str]]]:
+		future, closed = pending.popleft()
+		order_rows, item_rows, seconds = future.result()
+		_record_normalized(store, seconds, order_rows, item_rows)
+		return order_rows, item_rows, closed
+
+	for open_orders, closed in chunks:
+		pending.append((pool.submit(_normalize_chunk, open_orders, store, is_ebay), closed))
+		if len(pending) >= NORMALIZE_PROCESSES * 2:
+			yield collect()
+
+	while pending:
+		yield collect()
+
+
+# _normalize_orders, on worker processes for a store of at least
+# NORMALIZE_PROCESS_MIN_ORDERS orders when NORMALIZE_PROCESSES is set
+def _normalize_store(
+	orders: list[dict[str, Any]], 
+	store: str, 
+	is_ebay: bool = False
+) -> tuple[list[tuple[str, str, str, str, str, str]], list[tuple[str, str, str, int, str, str | None, str | None, str | None]]]:
+	pool = _normalize_pool() if len(orders) >= NORMALIZE_PROCESS_MIN_ORDERS else None
+	if pool is None:
+		return _normalize_orders(orders, store, is_ebay)
+
+	order_rows: list[tuple[str, str, str, str, str, str]] = []
+	item_rows: list[tuple[str, str, str, int, str, str | None, str | None, str | None]] = []
+	try:
+		chunks = ((chunk, []) for chunk in _chunks(iter(orders), len(orders)))
+		for chunk_orders, chunk_items, _ in _normalize_on_pool(pool, store, is_ebay, chunks):
+			order_rows += chunk_orders
+			item_rows += chunk_items
+	finally:
+		pool.shutdown(cancel_futures=True)
+
+	return order_rows, item_rows
+
+
+# Parse a store's order metadata and populate its db table
+# 	is_ebay (bool) : see _normalize_orders
+# 	conn : a shadow's connection (see app.db._create_shadow) to write to,
+# 	which the caller publishes; without one the store's rows are written to
+# 	a shadow of their own and published, like a refresh of the one store
+def _parse_store_metadata(
+	orders: list[dict[str, Any]], 
+	store: str, 
+	is_ebay: bool = False,
+	conn: sqlite3.Connection | None = None
+) -> None:
+	remap_version: int | None = get_index().version
+	order_rows, item_rows = _normalize_store(orders, store, is_ebay)
+
+	# the store's orders are upserted, as by an incremental sync
+	keys: list[tuple[str, str]] = [(row[0], row[1]) for row in order_rows]
+
+	def write(conn: sqlite3.Connection) -> None:
+		_unindex_orders(conn, keys)
+		_insert_orders(conn, order_rows, item_rows)
+		_index_orders(conn, keys)
+		_mark_items_written(conn, remap_version, rebuild_search=False)
 
+	if conn is not None:
+		write(conn)
+		return
+
+	shadow = _create_shadow()
+	published: bool = False
+	try:
+		write(shadow[1])
+		_publish_snapshot(*shadow)
+		published = True
+	finally:
+		if not published:
+			_discard_snapshot(*shadow)
+
+	try:
+		_archive_orders()
+	finally:
+		bump_generation()
+
+
+# Returns store -> upstream modify date to pull orders from, or None if
+# the store needs a full sync (SYNC_MODE 'full', never synced, or its
+# last full sync is older than SYNC_FULL_INTERVAL)
+def _get_sync_plan() -> dict[str, str | None]:
+	stores: list[str] = list(dict.fromkeys(store for store, _, _ in ORDER_ENDPOINTS))
+
+	if SYNC_MODE != 'incremental':
+		return {store: None for store in stores}
+
+	conn = _connect_db()
+	state = _get_sync_state(conn)
 	_close_db(conn)
-	
-	# For debugging!
-	#
-	# return METADATA
 
+	now = datetime.datetime.now()
+	plan: dict[str, str | None] = {}
 
-# Clean and normalize the Stock Keeping Unit to sort properly
-def _clean_sku(sku: str) -> str:
-	# Modify VS127 - VS136 for logical sorting
-	vs_map = {
-		"VS127": "VS.127", "VS128": "VS.128", "VS129": "VS.129", "VS130": "VS.130", 
-		"VS131": "VS.131", "VS132": "VS.132", "VS133": "VS.133", "VS134": "VS.134", 
-		"VS135": "VS.135", "VS136": "VS.136", "2VS134": "VS.134"
-	}
+	for store in stores:
+		hwm, last_full, _ = state.get(store, (None, None, None))
+		if (
+			hwm is None 
+			or last_full is None 
+			or now - datetime.datetime.fromisoformat(last_full) > datetime.timedelta(seconds=SYNC_FULL_INTERVAL)
+		):
+			plan[store] = None
+		else:
+			# re-pull a small overlap, upserts make it harmless and it covers
+			# orders upstream imported late with an older modify date
+			mark = datetime.datetime.fromisoformat(hwm.split('.')[0]) - datetime.timedelta(seconds=SYNC_OVERLAP)
+			plan[store] = mark.strftime('%Y-%m-%dT%H:%M:%S')
+
+	return plan
 
-	sku_array: list[str] = sku.split('-')
-	brand: str = sku_array[0]
-	brand_and_style: str
-	size: str
-
-	# PREMIER
-	if brand == 'PREM':
-		# PREM-646-MED, PREM-631NEW-LRG, PREM-210P-5XL
-		if len(sku_array) == 3:
-			premiere, style, _size = sku_array
-			# PREM-631NEW-XL
-			if style[-3:] == 'NEW':
-				style = style[:3]
-			brand_and_style = premiere + '-' + style
-			size = _size
-		# PREM-618-RED-MED, PREM-SS-101-LRG
-		elif len(sku_array) == 4:
-			premiere, index_1, index_2, _size = sku_array
-			style = index_1 + '-' + index_2
-			brand_and_style = premiere + '-' + style
-			size = _size
-	
-	# STEX
-	elif brand == 'STEX' or brand == 'STX':
-		stex, color, _size = sku_array
-
-		# STEX<num> to sort in order by location
-		if color == 'WHT':      stex = 'STEX6'
-		elif color == 'BRIT':   stex = 'STEX7'
-		elif color == 'GRN':    stex = 'STEX5'
-		elif color == 'CHAR':   stex = 'STEX4'
-		elif color == 'BLK':    stex = 'STEX2'
-		elif color == 'GREY':   stex = 'STEX3'
-		elif color == 'RED':    stex = 'STEX8'
-		elif color == 'NAVY':   stex = 'STEX1'
-		elif color == 'KAK':    stex = 'STEX9'
-
-		brand_and_style = stex + '-' + color
-		size = _size
-
-	# WICKED SHORTS / WEAR SHORTS
-	elif brand == 'WICK' or brand == 'WEAR':
-		wick_or_wear, color, _size = sku_array
-		brand_and_style = wick_or_wear + '-' + color
-		size = _size
-
-	# VESE / AMDS
-	elif brand == 'VESE' or brand == 'AMDS':
-		# AMDS-RED-01-XL / VESE-GREEN-11-LRG
-		vese_or_amds, color, style, _size = sku_array
-		brand_and_style = vese_or_amds + '-' + style + '-' + color
-		size = _size
-
-	# CASUAL COUNTRY
-	elif brand == 'CAS' or brand == 'CASS':
-		# long sleeve: CAS-PURP-01-LRG / CAS-NAV-3065-MED
-		if len(sku_array) == 4:
-			cas, color, style, _size = sku_array
-			# CAS-NAV-3065-MED
-			if style == '3065':
-				style = 'SOLID-3065'
-			brand_and_style = cas + '-' + style + '-' + color
-			size = _size
-		# short sleeve: CAS-SS-45-WHT-SML
-		elif len(sku_array) == 5:
-			cas, ss, style, color, _size = sku_array
-			brand_and_style = cas + '-' + ss + '-' + style + '-' + color
-			size = _size
-
-	# RODEO / ACE
-	elif brand == 'ROD' or brand == 'RODEO' or brand == 'ACE':
-		# RODEO-524-XL
-		if len(sku_array) == 3:
-			rodeo, style, _size = sku_array
-			brand_and_style = rodeo + '-' + style
-			size = _size
-		# RODEO-BEIG-533-MED, ROD-WOM-506-XL
-		elif len(sku_array) == 4:
-			rodeo, color_or_women, style, _size = sku_array
-			# strip 'PS400' from style number (RODEO-BRWN-PS400461N-MED)
-			if style[:5] == 'PS400':
-				style = style[5:]
-			brand_and_style = rodeo + '-' + style + '-' + color_or_women
-			size = _size
-		# ACE-WOM-BLU-ES5110-SML / ACE-HFK700-10-NVYBLU-3XL
-		elif len(sku_array) == 5:
-			# HFK700 / HFK200
-			if sku_array[1] == 'HFK700' or sku_array[1] == 'HFK200':
-				ace, hfk, style, color, _size = sku_array
-				brand_and_style = ace + '-' + hfk + '-' + style + '-' + color
-				size = _size
-			# WOMENS
-			else:
-				ace, women, color, style, _size = sku_array
-				brand_and_style = ace + '-' + style + '-' + women + '-' + color
-				size = _size
-	
-	# BUCKEROO
-	elif brand == 'BUCK':
-		# BUCK-WS6-BEGE/BRWN-LRG
-		if len(sku_array) == 4:
-			buck, style, color, _size = sku_array
-			brand_and_style = buck + '-' + style + '-' + color
-			size = _size
-		# BUCK-WS100-01-BLACK/BLUE-SML / BUCK-WS200-01-BLACK/BLUE-SML
-		elif len(sku_array) == 5:
-			buck, style, number, color, _size = sku_array
-			brand_and_style = buck + '-' + style + '-' + number + '-' + color
-			size = _size
-
-	# VICT / ENVY / SOCI JEANS
-	elif brand == 'VIC' or brand == 'VICT' or brand == 'ENVY' or brand == 'SOCI':
-		# VICT-701-XL / ENVY-5034-SML
-		if len(sku_array) == 3:
-			vic_or_envy, style, _size = sku_array
-			brand_and_style = vic_or_envy + '-' + style
-			size = _size
-		# VICT-BLACK-01-38x32 / ENVY-WHIT-101-XL / SOCI-BLU-950-32x32
-		elif len(sku_array) == 4:
-			vic_or_envy_or_soci, color, style, _size = sku_array
-			brand_and_style = vic_or_envy_or_soci + '-' + style + '-' + color
-			size = _size
-		# ENVY-LACE-WHT-64025-SML
-		elif len(sku_array) == 5:
-			envy, lace, color, style, _size = sku_array
-			brand_and_style = envy + '-' + style + '-' + lace + '-' + color
-			size = _size
-		# VIC-500-DENIM-JACKET-DARK-INDIGO-XL
-		elif len(sku_array) == 7:
-			vic, style, denim, jacket, color1, color2, _size = sku_array
-			brand_and_style = vic + '-' + style + '-' + denim + '-' + jacket + '-' + color1 + '-' + color2
-			size = _size
-
-	# VASS / BENZ
-	elif brand == 'VASS' or brand == 'BENZ':
-		# VASS-LEOP-VS135-SML
-		vass, color, style, _size = sku_array
-		# change VS127 - VS136 to VS.127 - VS.136 so they show up in alphanumeric order,
-		# they were in between VS03 and VS15
-		if style in vs_map:
-			style = vs_map[style]
-		brand_and_style = vass + '-' + style + '-' + color
-		size = _size
-	
-	# EVERYTHING ELSE (no cleaning necessary)
-	else:
-		return sku
-
-	if size == 'XXL':
-		size = '2XL'
-
-	return brand_and_style + '-' + size
-
-
-# Condense and sort all Stock Keeping Units along with their sizes and quantities
-def _create_pick_list(items: list[tuple[str, int]]):
-	# sort sizes in logical order (tops: XSML to 8XL, bottoms: 30 to 54)
-	size_ordering = {
-		'XS': 0,
-		'SM': 1, 
-		'ME': 2,
-		'LA': 3,  # 'LARG'
-		'LR': 4,  # 'LRG'
-		'XL': 5, 
-		'2X': 6, 
-		'3X': 7, 
-		'4X': 8, 
-		'5X': 9, 
-		'6X': 10, 
-		'7X': 11, 
-		'8X': 12, 
-		'30': 13, 
-		'32': 14, 
-		'34': 15, 
-		'36': 16, 
-		'38': 17, 
-		'40': 18, 
-		'42': 19, 
-		'44': 20, 
-		'46': 21, 
-		'48': 22, 
-		'50': 23,
-		'52': 24,
-		'54': 25,
-	}
 
-	# Count all SKUs, ex)
-	# dict = { 
-	#	'PREM-001-SML': 1, 
-	#	'PREM-001-MED': 3, 
-	#	'PREM-002-LRG': 2, 
-	#	'PREM-002-XL': 1 
-	# }
-	sku_to_quantity: dict[str, int] = {}
-
-	for item in items:
-		sku: str = item[0]
-		quantity: int = item[1]
-		sku_to_quantity[sku] = sku_to_quantity.get(sku, 0) + quantity
-
-	# Condense styles to their sizes, ex)
-	# dict = { 
-	#	'PREM-001': [SML-1, MED-3], 
-	#	'PREM-002': [LRG-2, XL-1] 
-	# }
-	style_to_sizes: dict[str, str | list[str]] = {}
-
-	for sku, quantity in sku_to_quantity.items():
-		# split style from size, ex: 
-		# 'PREM-001-SML' -> ['PREM-001', 'SML']
-		array: list[str] = sku.rsplit('-', 1)
-
-		# irregular SKU, doesn't have a size
-		if len(array) == 1:
-			style_to_sizes[sku] = str(quantity)
-			continue
-
-		style, size = array
-
-		# sku was a randomly generated coupon code, do not include in pick list
-		if size[:2] not in size_ordering:
-			continue
-
-		if style not in style_to_sizes:
-			style_to_sizes[style] = [size + '-' + str(quantity)]
+# Normalize a store's feeds INGEST_BATCH_SIZE orders at a time, as they
+# stream in; yields (order rows, item rows, closed order keys) per batch
+# 	feeds : (orders, is_ebay) of each of the store's feeds
+# 	pool : worker processes (see _normalize_pool) to normalize a feed of at
+# 	least NORMALIZE_PROCESS_MIN_ORDERS orders on, in chunks (see _chunks)
+def _normalize_batches(
+	store: str, 
+	feeds: list[tuple[Iterable[dict[str, Any]], bool]],
+	pool: ProcessPoolExecutor | None = None
+) -> Iterator[tuple[list[tuple[str, str, str, str, str, str]], list[tuple[str, str, str, int, str, str | None, str | None, str | None]], list[tuple[str, str]]]]:
+	for orders, is_ebay in feeds:
+		key = 'orderKey' if is_ebay else 'orderNumber'
+		iterator = iter(orders)
+
+		def split(batch: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], list[tuple[str, str]]]:
+			open_orders = [order for order in batch if order.get('orderStatus') not in CLOSED_STATUSES]
+			closed = [(store, order[key]) for order in batch if order.get('orderStatus') in CLOSED_STATUSES]
+			return open_orders, closed
+
+		if pool is not None:
+			head: list[dict[str, Any]] = list(islice(iterator, NORMALIZE_PROCESS_MIN_ORDERS))
+			iterator = chain(head, iterator)
+			if len(head) >= NORMALIZE_PROCESS_MIN_ORDERS:
+				chunks = (split(chunk) for chunk in _chunks(iterator, len(head)))
+				yield from _normalize_on_pool(pool, store, is_ebay, chunks)
+				continue
+
+		while batch := list(islice(iterator, INGEST_BATCH_SIZE)):
+			open_orders, closed = split(batch)
+			order_rows, item_rows = _normalize_orders(open_orders, store, is_ebay)
+			yield order_rows, item_rows, closed
+
+
+# Writes one store's normalized batches inside the caller's transaction,
+# then brings the store's orders and sync state up to date:
+# 	since : the store's sync date, None for a full sync, which deletes every
+# 	order of the store not in its feeds, and leaves the search index to be
+# 	rebuilt (see _mark_items_written); otherwise its closed orders are
+# 	deleted, and the index is updated for the orders written and deleted
+# 	hwm_ingested : the store's high-water mark before this refresh
+class StoreIngest:
+	def __init__(self, store: str, since: str | None, hwm_ingested: str | None) -> None:
+		self.store = store
+		self.since = since
+		self.hwm: str | None = hwm_ingested if since is not None else None
+		self.current: set[str] = set()
+		self.closed: list[tuple[str, str]] = []
+
+	def add(
+		self, 
+		conn: sqlite3.Connection, 
+		order_rows: list[tuple[str, str, str, str, str, str]], 
+		item_rows: list[tuple[str, str, str, int, str, str | None, str | None, str | None]], 
+		closed: list[tuple[str, str]]
+	) -> None:
+		keys: list[tuple[str, str]] = [(row[0], row[1]) for row in order_rows]
+		if self.since is not None:
+			_unindex_orders(conn, keys)
+		_insert_orders(conn, order_rows, item_rows)
+		if self.since is not None:
+			_index_orders(conn, keys)
+		self.current.update(row[1] for row in order_rows)
+		self.closed.extend(closed)
+		self.hwm = max(filter(None, (self.hwm, *(row[5] for row in order_rows))), default=None)
+
+	def finish(self, conn: sqlite3.Connection, payload_hash: str | None) -> None:
+		last_full: str | None = None
+
+		if self.since is None:
+			_delete_stale_orders(conn, self.store, self.current)
+			last_full = datetime.datetime.now().isoformat(timespec='seconds')
 		else:
-			style_to_sizes[style].append(size + '-' + str(quantity))
-
-	# Add each condensed style to list, sort in alphanumeric order, ex)
-	# list = [
-	#	'PREM-001 -> SML, MED (3)',
-	#	'PREM-002 -> LRG (2), XL'
-	# ]
-	pick_list: list[str] = []
-
-	for style, sizes in style_to_sizes.items():
-		# list of the style's sizes, ex: [SML-1, MED-3]
-		if type(sizes) is list:
-			sizes.sort(key=lambda x: size_ordering[x[:2]])
-			for i in range(len(sizes)):
-				size, quant = sizes[i].split('-')
-				# transform each element of list, include quantity only if greater than 1, ex)
-				# 'SML-1' -> 'SML'
-				# 'MED-3' -> 'MED (3)'
-				if int(quant) == 1:
-					sizes[i] = size
-				else:
-					sizes[i] = size + ' (' + quant + ')'
-
-			# concatenate delimeter '?', used in front end to split style from sizes 
-			style = style + '?'
-
-			# concatenate sizes to style, ex) 
-			# 'PREM-001?SML, MED (3)'
-			for i in range(len(sizes)):
-				# last item in list, no comma necessary
-				if i + 1 == len(sizes):
-					style = style + str(sizes[i])
-				else:
-					style = style + str(sizes[i]) + ', '
-			style = style + '\n'
-		# sizes is not a list if a SKU was irregular, sizes is a numerical string ('1', '2', etc)
+			# an order open in one feed and closed in another stays
+			closed = [order_key for order_key in self.closed if order_key[1] not in self.current]
+			_unindex_orders(conn, closed)
+			_delete_orders(conn, closed)
+
+		_set_sync_state(conn, self.store, self.hwm, last_full, payload_hash)
+
+
+# Leave a store whose feeds are the ones last ingested as it is, only
+# recording that it was synced
+def _keep_store(
+	conn: sqlite3.Connection, 
+	store: str, 
+	since: str | None, 
+	state: tuple[str | None, str | None, str | None]
+) -> None:
+	hwm_ingested, _, hash_ingested = state
+	last_full = datetime.datetime.now().isoformat(timespec='seconds') if since is None else None
+	_set_sync_state(conn, store, hwm_ingested, last_full, hash_ingested)
+
+
+# Parse every store's orders and write them all in a single transaction,
+# so a refresh costs one commit instead of one per row, to a shadow of
+# the order data that is published once every store is in, as app.pipeline
+# does (see app.db._create_shadow)
+# 	since : the sync plan the orders were fetched with (see _get_sync_plan);
+# 	a store without a date has all its open orders replaced, otherwise its
+# 	changed orders are upserted and shipped or cancelled ones deleted
+#
+# stores are fetched, then written one after another; see app.pipeline for
+# the refresh that overlaps fetching, normalizing and writing
+def _ingest_all_orders(
+	store_orders: list[tuple[str, Iterable[dict[str, Any]], bool]],
+	since: dict[str, str | None] | None = None
+) -> None:
+	since = since or {}
+	remap_version: int | None = get_index().version
+
+	# group the feeds of each store (Amazon has four)
+	by_store: dict[str, list[tuple[Iterable[dict[str, Any]], bool]]] = {}
+	for store, orders, is_ebay in store_orders:
+		by_store.setdefault(store, []).append((orders, is_ebay))
+
+	if not by_store:
+		return
+
+	# worker processes for the big feeds, if NORMALIZE_PROCESSES is set
+	pool = _normalize_pool()
+	shadow = _create_shadow()
+	published: bool = False
+	try:
+		state = _get_sync_state(shadow[1])
+
+		for store, feeds in by_store.items():
+			ingest = StoreIngest(store, since.get(store), state.get(store, (None, None, None))[0])
+
+			# orders stream in from the feeds and are written a batch at a
+			# time, so memory holds one batch however many orders there are
+			for order_rows, item_rows, closed in _normalize_batches(store, feeds, pool):
+				ingest.add(shadow[1], order_rows, item_rows, closed)
+
+			ingest.finish(shadow[1], None)
+
+		# stores fully synced replaced all their items, see StoreIngest
+		_mark_items_written(shadow[1], remap_version, any(since.get(store) is None for store in by_store))
+		_publish_snapshot(*shadow)
+		published = True
+	finally:
+		if pool is not None:
+			pool.shutdown(cancel_futures=True)
+		if not published:
+			_discard_snapshot(*shadow)
+
+	# cached pages are made stale once the archive has the new orders too
+	try:
+		_archive_orders()
+	finally:
+		bump_generation()
+
+
+# Record which SKU remaps the items just written (in the caller's
+# transaction) were normalized with: remap_version, the index's version
+# when normalizing began; if the index was swapped since, they are a mix.
+# 	rebuild_search : rebuild the search index from them in the same
+# 	transaction, for a full sync; an incremental one kept it up to date
+# 	order by order (see StoreIngest)
+def _mark_items_written(conn: sqlite3.Connection, remap_version: int | None, rebuild_search: bool = True) -> None:
+	_mark_items_remap_version(conn, remap_version if get_index().version == remap_version else None)
+	if rebuild_search:
+		_index_search(conn)
+
+
+# Load the SKU remaps if the SkuRemap table changed since they were last
+# loaded, and re-normalize the items already ingested if they were
+# normalized with other remaps, so the pick list follows an edit without
+# waiting for a refresh; only items whose cleaned SKU changes are written
+# returns the number of items re-normalized
+def _sync_sku_remap() -> int:
+	conn = _connect_db()
+	changed: int = 0
+
+	with conn:
+		version, items_version = _get_sku_remap_version(conn)
+
+		index: SkuIndex = get_index()
+		if version != index.version:
+			_, _, remap = _get_sku_remap(conn)
+			index = SkuIndex(version, remap.get('revised', {}), remap.get('vs', {}), remap.get('stex', {}))
+			load_index(index)
+
+		if items_version != version:
+			changes: list[tuple[str | None, str | None, str, str, str, str | None]] = []
+			for raw_sku, description, sku in _get_item_skus(conn):
+				new_sku: str = index.normalize_item(raw_sku, description or '')
+				if new_sku != sku:
+					style, size, size_rank = split_sku(new_sku)
+					changes.append((raw_sku, description, sku, new_sku, style, None if size_rank == NO_SIZE_RANK else size))
+
+			changed = _renormalize_items(conn, changes, version)
+
+	_close_db(conn)
+
+	set_gauge('premier_sku_remap_version', version)
+	if changed:
+		bump_generation()
+
+	return changed
+
+
+# Why a SKU remap can't be saved, None if it can; a revised SKU must map
+# to a SKU its brand's rules recognize, and a VASS style or STEX color is
+# one field of a SKU
+def _check_sku_remap(kind: str, sku: str, remap: str) -> str | None:
+	if kind not in REMAP_KINDS:
+		return f'Unknown kind: {kind}'
+
+	if kind == 'revised':
+		try:
+			clean_sku(remap)
+		except ValueError as e:
+			return str(e)
+	elif '-' in sku or '-' in remap:
+		return f'A {kind} remap is one field of a SKU, without dashes'
+
+	return None
+
+
+# Add, change or (remap None) delete a SKU remap, then bring the items
+# already ingested in line with it; returns the number of items re-normalized
+def _save_sku_remap(kind: str, sku: str, remap: str | None) -> int:
+	conn = _connect_db()
+	with conn:
+		if remap is None:
+			_delete_sku_remap(conn, kind, sku)
 		else:
-			# more than one quantity
-			if int(sizes) > 1:
-				style = style + ' (' + sizes + ')' + '\n'
-			else:
-				style = style + '\n'
+			_set_sku_remap(conn, kind, sku, remap)
+	_close_db(conn)
+
+	return _sync_sku_remap()
+
+
+# Switch readers back to a kept snapshot of the order data (see
+# app.db._publish_snapshot): the one the current snapshot replaced, or
+# the named one; returns the snapshot now current, None if there is none
+# to roll back to. The SKU remaps stay as they are, the snapshot's items
+# are re-normalized if they were normalized with other remaps
+def _rollback_snapshot(to: str | None = None) -> str | None:
+	snapshots = _get_snapshots()
+	names: list[str] = [name for name, _, _, _ in snapshots]
+	current: str | None = next((name for name, _, _, is_current in snapshots if is_current), None)
+
+	if to is None:
+		# snapshots are newest first, the previous one is after the current
+		position: int = names.index(current) + 1 if current is not None else len(names)
+		if position >= len(names):
+			return None
+		to = names[position]
 
-		pick_list.append(style)
+	if to == current or not _set_snapshot(to):
+		return None
 
-	pick_list.sort()
+	bump_generation()
+	_sync_sku_remap()
+	return to
 
-	return pick_list
\ No newline at end of file
+
+# The FTS5 query for what was typed into /search, None if it has no terms;
+# every term must match, each is quoted so a SKU's '-' isn't read as an
+# operator, and a trailing '*' matches it as a prefix, ex)
+# 	'PREM-6* jane' -> '"PREM-6"* "jane"'
+def _search_query(text: str) -> str | None:
+	terms: list[str] = []
+	for term in text.split():
+		prefix: bool = term.endswith('*')
+		term = term.rstrip('*')
+		if term:
+			terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+
+	return ' '.join(terms) or None
+
+
+# the items of open orders matching what was typed into /search, ex) 'PREM-6*',
+# at most SEARCH_LIMIT of them, see db._search_orders
+def _search(text: str, store: str | None = None) -> list[tuple[str, str, str, str, int, str]]:
+	match: str | None = _search_query(text)
+	if match is None:
+		return []
+	return _search_orders(match, store)
+
+
+# Clean and normalize the Stock Keeping Unit to sort properly, see app.sku
+def _clean_sku(sku: str) -> str:
+	return clean_sku(sku)
\ No newline at end of file
@@ -0,0 +1,170 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
+
+from app import METRICS_ENABLED
+
+
+# Histogram bucket upper bounds in seconds, from a cached SKU lookup to a
+# slow store's order feed
+BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# name -> (Prometheus type, help text); only these names can be recorded
+METRICS: dict[str, tuple[str, str]] = {
+	'premier_http_request_seconds': ('histogram', 'Flask request latency by endpoint'),
+	'premier_render_seconds': ('histogram', 'render_template latency by template'),
+	'premier_db_query_seconds': ('histogram', 'SQLite query latency by query'),
+	'premier_fetch_seconds': ('histogram', 'Order management system call latency by store and method'),
+	'premier_json_decode_seconds': ('histogram', 'Order management system JSON decode latency by store'),
+	'premier_fetch_unchanged_total': ('counter', 'Order feeds that came back unchanged by store and reason'),
+	'premier_normalize_seconds': ('histogram', 'Order and SKU normalization latency by store'),
+	'premier_orders_total': ('counter', 'Orders parsed by store'),
+	'premier_items_total': ('counter', 'Items parsed by store'),
+	'premier_pipeline_busy_seconds': ('gauge', 'Seconds each refresh pipeline stage worked in the last refresh'),
+	'premier_pipeline_queue_max_depth': ('gauge', 'Deepest each refresh pipeline queue got in the last refresh'),
+	'premier_pipeline_queue_blocked_seconds': ('gauge', 'Seconds producers waited on each full refresh pipeline queue in the last refresh'),
+	'premier_refreshes_total': ('counter', 'Finished refreshes by state'),
+	'premier_refresh_last_seconds': ('gauge', 'Duration of each stage of the last refresh'),
+	'premier_refresh_store_fetch_seconds': ('gauge', 'Fetch duration of each store in the last refresh'),
+	'premier_refresh_last_timestamp': ('gauge', 'Unix time the last refresh finished'),
+	'premier_response_cache_total': ('counter', 'Cached read route lookups by result'),
+	'premier_sku_cache': ('gauge', 'SKU cache statistics by cache and field'),
+	'premier_sku_remap_version': ('gauge', 'Version of the SKU remaps in use'),
+}
+
+_lock = threading.Lock()
+
+# (name, labels) -> [count per bucket..., sum, count] for histograms, or
+# the value of a counter or gauge; labels is a sorted tuple of pairs
+_values: dict[tuple[str, tuple[tuple[str, str], ...]], list[float] | float] = {}
+
+_NULL_TIMER = nullcontext()
+
+
+def _key(name: str, labels: dict[str, str]) -> tuple[str, tuple[tuple[str, str], ...]]:
+	return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+	if not METRICS_ENABLED:
+		return
+
+	key = _key(name, labels)
+	with _lock:
+		buckets = _values.get(key)
+		if buckets is None:
+			buckets = _values[key] = [0] * (len(BUCKETS) + 2)
+		for i, bound in enumerate(BUCKETS):
+			if seconds <= bound:
+				buckets[i] += 1
+				break
+		buckets[-2] += seconds
+		buckets[-1] += 1
+
+
+def inc(name: str, amount: float = 1, **labels: str) -> None:
+	if not METRICS_ENABLED:
+		return
+
+	key = _key(name, labels)
+	with _lock:
+		_values[key] = _values.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+	if not METRICS_ENABLED:
+		return
+
+	with _lock:
+		_values[_key(name, labels)] = value
+
+
+@contextmanager
+def _timer(name: str, labels: dict[str, str]) -> Iterator[None]:
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		observe(name, time.perf_counter() - start, **labels)
+
+
+# Time the body of a with block into histogram name, ex)
+# 	with timer('premier_db_query_seconds', query='pick_list'):
+# 		rows = cur.execute(PICK_LIST_QUERY).fetchall()
+# a shared no-op context when metrics are disabled
+def timer(name: str, **labels: str):
+	if not METRICS_ENABLED:
+		return _NULL_TIMER
+	return _timer(name, labels)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = '') -> str:
+	pairs = [f'{label}="{value}"' for label, value in labels]
+	if extra:
+		pairs.append(extra)
+	return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Every recorded metric in the Prometheus text exposition format
+def render() -> str:
+	with _lock:
+		values = {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+
+	lines: list[str] = []
+	for name, (kind, help_text) in METRICS.items():
+		series = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+		if not series:
+			continue
+
+		lines.append(f'# HELP {name} {help_text}')
+		lines.append(f'# TYPE {name} {kind}')
+
+		for labels, value in series:
+			if kind != 'histogram':
+				lines.append(f'{name}{_format_labels(labels)} {value}')
+				continue
+
+			# buckets are cumulative
+			cumulative = 0
+			for bound, count in zip(BUCKETS, value):
+				cumulative += count
+				le = f'le="{bound}"'
+				lines.append(f'{name}_bucket{_format_labels(labels, le)} {cumulative}')
+			le = 'le="+Inf"'
+			lines.append(f'{name}_bucket{_format_labels(labels, le)} {value[-1]}')
+			lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]}')
+			lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+
+	return '\n'.join(lines) + '\n'
+
+
+# request and template timing hook into Flask only when metrics are enabled,
+# so a disabled instance pays nothing per request; called by app.web
+def init_app(app) -> None:
+	if not METRICS_ENABLED:
+		return
+
+	from flask import g, request, before_render_template, template_rendered
+
+	@app.before_request
+	def _start_request_timer():
+		g.metrics_request_start = time.perf_counter()
+
+	@app.after_request
+	def _observe_request(response):
+		start: float | None = g.pop('metrics_request_start', None)
+		if start is not None:
+			observe('premier_http_request_seconds', time.perf_counter() - start, endpoint=request.endpoint or 'none')
+		return response
+
+	def _start_render_timer(sender, template, context, **extra):
+		g.setdefault('metrics_render_starts', []).append(time.perf_counter())
+
+	def _observe_render(sender, template, context, **extra):
+		starts: list[float] = g.get('metrics_render_starts') or []
+		if starts:
+			observe('premier_render_seconds', time.perf_counter() - starts.pop(), template=template.name or 'string')
+
+	before_render_template.connect(_start_render_timer, app)
+	template_rendered.connect(_observe_render, app)
\ No newline at end of file
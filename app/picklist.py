@@ -0,0 +1,122 @@
+from typing import Any, NamedTuple
+
+from app.sku import split_sku, NO_SIZE_RANK
+
+
+# One line of the pick list: a style, its sizes in size order with their
+# quantities, and the style's total quantity, ex)
+# 	PickListItem('PREM-001', (('SML', 1), ('MED', 3)), 4)
+# 	PickListItem('GIFTCARD', (), 2)  irregular SKU, doesn't have a size
+class PickListItem(NamedTuple):
+	style: str
+	sizes: tuple[tuple[str, int], ...]
+	total: int
+
+	# JSON for /api/pick-list, ex)
+	# {'style': 'PREM-001', 'sizes': [{'size': 'SML', 'quantity': 1}, ...], 'total': 4}
+	def as_json(self) -> dict[str, Any]:
+		return {
+			'style': self.style,
+			'sizes': [{'size': size, 'quantity': quantity} for size, quantity in self.sizes],
+			'total': self.total,
+		}
+
+
+# Pick list order, the order the list had when each line was sorted as
+# its text: 'PREM-001?SML, MED (3)' or 'GIFTCARD (2)' for irregular SKUs
+def _pick_list_sort_key(item: PickListItem) -> str:
+	if item.sizes:
+		return item.style + '?'
+	if item.total > 1:
+		return item.style + ' (' + str(item.total) + ')\n'
+	return item.style + '\n'
+
+
+# Condense and sort all Stock Keeping Units along with their sizes and quantities
+def _create_pick_list(items: list[tuple[str, int]]) -> list[PickListItem]:
+	# Count all SKUs, ex)
+	# dict = { 
+	#	'PREM-001-SML': 1, 
+	#	'PREM-001-MED': 3, 
+	#	'PREM-002-LRG': 2, 
+	#	'PREM-002-XL': 1 
+	# }
+	sku_to_quantity: dict[str, int] = {}
+
+	for item in items:
+		sku: str = item[0]
+		quantity: int = item[1]
+		sku_to_quantity[sku] = sku_to_quantity.get(sku, 0) + quantity
+
+	# Condense styles to their sizes, ex)
+	# dict = { 
+	#	'PREM-001': [(1, 'SML', 1), (2, 'MED', 3)], 
+	#	'PREM-002': [(4, 'LRG', 2), (5, 'XL', 1)] 
+	# }
+	style_to_sizes: dict[str, list[tuple[int, str, int]]] = {}
+	irregular: dict[str, int] = {}
+
+	for sku, quantity in sku_to_quantity.items():
+		# split style from size, ex: 
+		# 'PREM-001-SML' -> ('PREM-001', 'SML', 1)
+		style, size, size_rank = split_sku(sku)
+
+		# sku was a randomly generated coupon code, do not include in pick list
+		if size_rank is None:
+			continue
+
+		# irregular SKU, doesn't have a size
+		if size_rank == NO_SIZE_RANK:
+			irregular[style] = quantity
+			continue
+
+		style_to_sizes.setdefault(style, []).append((size_rank, size, quantity))
+
+	pick_list: list[PickListItem] = [
+		PickListItem(style, (), quantity) for style, quantity in irregular.items()
+	]
+
+	for style, sizes in style_to_sizes.items():
+		# sort is stable, sizes with the same rank keep their SKU order
+		sizes.sort(key=lambda size: size[0])
+		pick_list.append(PickListItem(
+			style, 
+			tuple((size, quantity) for _, size, quantity in sizes), 
+			sum(quantity for _, _, quantity in sizes)
+		))
+
+	pick_list.sort(key=_pick_list_sort_key)
+
+	return pick_list
+
+
+# Group the rows of the PickList table, already in pick list order, into
+# the same items _create_pick_list returns, ex)
+# 	[('PREM-001', 'SML', 1, 4), ('PREM-001', 'MED', 3, 4)] -> [PickListItem('PREM-001', (('SML', 1), ('MED', 3)), 4)]
+def _format_pick_list(rows: list[tuple[str, str, int, int]]) -> list[PickListItem]:
+	pick_list: list[PickListItem] = []
+	current_style: str | None = None
+	current_total: int = 0
+	sizes: list[tuple[str, int]] = []
+
+	def flush() -> None:
+		if current_style is not None and sizes:
+			pick_list.append(PickListItem(current_style, tuple(sizes), current_total))
+
+	for style, size, quantity, total in rows:
+		# irregular SKU, doesn't have a size
+		if size == '':
+			flush()
+			current_style, sizes = None, []
+			pick_list.append(PickListItem(style, (), total))
+			continue
+
+		if style != current_style:
+			flush()
+			current_style, current_total, sizes = style, total, []
+
+		sizes.append((size, quantity))
+
+	flush()
+
+	return pick_list
\ No newline at end of file
@@ -0,0 +1,328 @@
+import time
+import queue
+import sqlite3
+import threading
+from typing import Any, Callable
+
+from app import PIPELINE_QUEUE_SIZE, PIPELINE_NORMALIZE_WORKERS
+from app.db import _connect_db, _close_db, _get_sync_state, _create_shadow, _publish_snapshot, _discard_snapshot, _archive_orders
+from app.fetch import _fetch_feed, _run_concurrently
+from app.cache import bump_generation
+from app.metrics import set_gauge
+from app.sku import get_index
+from app.logic import (
+	ORDER_ENDPOINTS,
+	StoreIngest,
+	_order_params,
+	_store_hash,
+	_iter_orders,
+	_normalize_batches,
+	_normalize_pool,
+	_keep_store,
+	_mark_items_written
+)
+
+
+# The refresh as three stages joined by bounded queues, so the network,
+# parsing and disk writes overlap instead of taking turns:
+#
+# 	fetch      every feed on the fetch thread pool; a store is queued as
+# 	           soon as all of its feeds are on disk
+# 	normalize  PIPELINE_NORMALIZE_WORKERS threads decode and normalize
+# 	           stores a batch of orders at a time (see logic._normalize_batches),
+# 	           handing big feeds to worker processes if NORMALIZE_PROCESSES is set
+# 	write      one SQLite writer, all stores in a single transaction into a
+# 	           shadow copy of the current snapshot, which readers are
+# 	           switched over to once every store is in (see app.db._create_shadow)
+# 	archive    the new snapshot's orders that weren't seen before are added
+# 	           to the order archive and its daily rollups (see app.db._archive_orders)
+#
+# a full queue blocks the stage feeding it (backpressure), so at most
+# PIPELINE_QUEUE_SIZE batches wait to be written however fast the feeds
+# arrive. The first error in any stage stops the others and discards the
+# shadow, readers never see any of it.
+
+_DONE = object()
+
+
+# A bounded queue that keeps its depth and how long producers were blocked
+# on it, ex) {'max_depth': 8, 'mean_depth': 5.2, 'blocked_seconds': 0.41}
+class StageQueue(queue.Queue):
+	def __init__(self, name: str, maxsize: int) -> None:
+		super().__init__(maxsize)
+		self.name = name
+		self.puts: int = 0
+		self.depth_total: int = 0
+		self.max_depth: int = 0
+		self.blocked_seconds: float = 0.0
+		self._stats_lock = threading.Lock()
+
+	def put(self, item: Any, block: bool = True, timeout: float | None = None) -> None:
+		start = time.perf_counter()
+		super().put(item, block, timeout)
+		blocked = time.perf_counter() - start
+		depth = self.qsize()
+
+		with self._stats_lock:
+			self.puts += 1
+			self.depth_total += depth
+			self.max_depth = max(self.max_depth, depth)
+			self.blocked_seconds += blocked
+
+	def stats(self) -> dict[str, Any]:
+		return {
+			'size': self.maxsize,
+			'max_depth': self.max_depth,
+			'mean_depth': round(self.depth_total / self.puts, 2) if self.puts else 0,
+			'blocked_seconds': round(self.blocked_seconds, 3),
+		}
+
+
+# Work done by one stage: items through it and seconds spent working on
+# them (not waiting on a queue), summed over the stage's threads
+class StageStats:
+	def __init__(self, unit: str) -> None:
+		self.unit = unit
+		self.items: int = 0
+		self.busy_seconds: float = 0.0
+		self._lock = threading.Lock()
+
+	def add(self, items: int, seconds: float) -> None:
+		with self._lock:
+			self.items += items
+			self.busy_seconds += seconds
+
+	def stats(self, wall_seconds: float) -> dict[str, Any]:
+		return {
+			self.unit: self.items,
+			'busy_seconds': round(self.busy_seconds, 3),
+			f'{self.unit}_per_second': round(self.items / wall_seconds, 1) if wall_seconds else None,
+		}
+
+
+# Fetch, normalize and write every store's orders; returns the stages'
+# throughput and the queues' depths, ex)
+# 	{'seconds': 2.1, 'stages': {'fetch': {...}, 'normalize': {...}, 'write': {...}, 'archive': {...}},
+# 	'queues': {'fetched': {...}, 'normalized': {...}}}
+# 	since : the sync plan, see logic._get_sync_plan
+# 	on_store_fetched : called with (store, seconds) once a store's feeds are in
+# 	on_fetch_done : called once every feed is in
+# 	on_store_done : called with (store, number of orders) as each store is written
+def run_pipeline(
+	since: dict[str, str | None] | None = None,
+	on_store_fetched: Callable[[str, float], None] | None = None,
+	on_fetch_done: Callable[[], None] | None = None,
+	on_store_done: Callable[[str, int], None] | None = None
+) -> dict[str, Any]:
+	since = since or {}
+	started = time.perf_counter()
+	remap_version: int | None = get_index().version
+
+	conn = _connect_db()
+	state = _get_sync_state(conn)
+	_close_db(conn)
+
+	# stores ready to normalize, with room for every store and the end
+	# markers; the backpressure that matters is on the batches to write
+	fetched = StageQueue('fetched', len(ORDER_ENDPOINTS) + PIPELINE_NORMALIZE_WORKERS)
+	normalized = StageQueue('normalized', PIPELINE_QUEUE_SIZE)
+	fetch_stats = StageStats('feeds')
+	normalize_stats = StageStats('orders')
+	write_stats = StageStats('orders')
+
+	errors: list[BaseException] = []
+	abort = threading.Event()
+
+	# shared by the normalize threads, see logic._normalize_pool
+	pool = _normalize_pool()
+
+	def fail(e: BaseException) -> None:
+		errors.append(e)
+		abort.set()
+
+	# fetch: feeds[i] is (path, content hash) of ORDER_ENDPOINTS[i]
+	feeds: dict[int, tuple[str, str]] = {}
+	feeds_lock = threading.Lock()
+
+	def fetch(i: int, store: str, endpoint: str) -> None:
+		start = time.perf_counter()
+		feed = _fetch_feed(store, endpoint, _order_params(since, store))
+		with feeds_lock:
+			feeds[i] = feed
+		fetch_stats.add(1, time.perf_counter() - start)
+
+	def store_fetched(store: str, seconds: float) -> None:
+		indexes = [i for i, (feed_store, _, _) in enumerate(ORDER_ENDPOINTS) if feed_store == store]
+		with feeds_lock:
+			complete = all(i in feeds for i in indexes)
+		if complete and not abort.is_set():
+			fetched.put((store, indexes))
+		if on_store_fetched is not None:
+			on_store_fetched(store, seconds)
+
+	def fetch_all() -> None:
+		try:
+			_run_concurrently([
+				(store, lambda i=i, store=store, endpoint=endpoint: fetch(i, store, endpoint))
+				for i, (store, endpoint, _) in enumerate(ORDER_ENDPOINTS)
+			], store_fetched)
+			if on_fetch_done is not None:
+				on_fetch_done()
+		except BaseException as e:
+			fail(e)
+		finally:
+			for _ in range(PIPELINE_NORMALIZE_WORKERS):
+				fetched.put(_DONE)
+
+	# normalize: one store at a time per thread, its batches in order
+	def normalize() -> None:
+		try:
+			while (task := fetched.get()) is not _DONE:
+				if abort.is_set():
+					continue
+
+				store, indexes = task
+				payload_hash = _store_hash([feeds[i][1] for i in indexes])
+
+				if payload_hash == state.get(store, (None, None, None))[2]:
+					normalized.put(('keep', store, payload_hash))
+					continue
+
+				store_feeds = [(_iter_orders(feeds[i][0]), ORDER_ENDPOINTS[i][2]) for i in indexes]
+				batches = _normalize_batches(store, store_feeds, pool)
+
+				while True:
+					start = time.perf_counter()
+					batch = next(batches, None)
+					if batch is None:
+						break
+					normalize_stats.add(len(batch[0]), time.perf_counter() - start)
+
+					normalized.put(('rows', store, batch))
+					if abort.is_set():
+						break
+
+				normalized.put(('done', store, payload_hash))
+		except BaseException as e:
+			fail(e)
+		finally:
+			normalized.put(_DONE)
+
+	threads = [threading.Thread(target=fetch_all, name='pipeline-fetch', daemon=True)]
+	threads += [
+		threading.Thread(target=normalize, name=f'pipeline-normalize-{i}', daemon=True)
+		for i in range(PIPELINE_NORMALIZE_WORKERS)
+	]
+	for thread in threads:
+		thread.start()
+
+	# write: on this thread, until every normalizer is done; after an error
+	# the queue is still drained so no stage stays blocked on it. The shadow
+	# is only copied once a store has changed, until then unchanged stores
+	# wait in kept; if none changed, their sync is recorded on the current
+	# snapshot and there is nothing to switch over to
+	ingests: dict[str, StoreIngest] = {}
+	kept: list[str] = []
+	shadow: tuple[str, sqlite3.Connection] | None = None
+	published: bool = False
+	finished: int = 0
+	# a store was fully synced, the search index is rebuilt (see StoreIngest)
+	full_sync: bool = False
+
+	def shadow_conn() -> sqlite3.Connection:
+		nonlocal shadow
+		if shadow is None:
+			shadow = _create_shadow()
+			for store in kept:
+				_keep_store(shadow[1], store, since.get(store), state.get(store, (None, None, None)))
+		return shadow[1]
+
+	try:
+		while finished < PIPELINE_NORMALIZE_WORKERS:
+			message = normalized.get()
+			if message is _DONE:
+				finished += 1
+				continue
+			if abort.is_set():
+				continue
+
+			start = time.perf_counter()
+			kind, store, payload = message
+			try:
+				if kind == 'keep':
+					if shadow is None:
+						kept.append(store)
+					else:
+						_keep_store(shadow[1], store, since.get(store), state.get(store, (None, None, None)))
+					if on_store_done is not None:
+						on_store_done(store, 0)
+				elif kind == 'rows':
+					if store not in ingests:
+						ingests[store] = StoreIngest(store, since.get(store), state.get(store, (None, None, None))[0])
+					ingests[store].add(shadow_conn(), *payload)
+				else:
+					ingest = ingests.pop(store, None) or StoreIngest(store, since.get(store), state.get(store, (None, None, None))[0])
+					ingest.finish(shadow_conn(), payload)
+					full_sync = full_sync or ingest.since is None
+					if on_store_done is not None:
+						on_store_done(store, len(ingest.current))
+			except BaseException as e:
+				fail(e)
+
+			write_stats.add(len(payload[0]) if kind == 'rows' else 0, time.perf_counter() - start)
+
+		if errors:
+			raise errors[0]
+
+		if shadow is not None:
+			_mark_items_written(shadow[1], remap_version, full_sync)
+			_publish_snapshot(*shadow)
+			published = True
+		elif kept:
+			conn = _connect_db()
+			with conn:
+				for store in kept:
+					_keep_store(conn, store, since.get(store), state.get(store, (None, None, None)))
+			_close_db(conn)
+	finally:
+		for thread in threads:
+			thread.join()
+		if pool is not None:
+			pool.shutdown(cancel_futures=True)
+		if shadow is not None and not published:
+			_discard_snapshot(*shadow)
+
+	archived: int = 0
+	archive_seconds: float = 0.0
+	# cached pages, /api/history's among them, are made stale once the
+	# archive has the new orders too
+	if published:
+		start = time.perf_counter()
+		try:
+			archived = _archive_orders()
+		finally:
+			bump_generation()
+		archive_seconds = time.perf_counter() - start
+
+	wall = time.perf_counter() - started
+	report = {
+		'seconds': round(wall, 3),
+		'stages': {
+			'fetch': fetch_stats.stats(wall),
+			'normalize': normalize_stats.stats(wall),
+			'write': write_stats.stats(wall),
+			'archive': {'orders': archived, 'busy_seconds': round(archive_seconds, 3)},
+		},
+		'queues': {
+			'fetched': fetched.stats(),
+			'normalized': normalized.stats(),
+		},
+	}
+
+	for stage, stats in report['stages'].items():
+		set_gauge('premier_pipeline_busy_seconds', stats['busy_seconds'], stage=stage)
+	for name, stats in report['queues'].items():
+		set_gauge('premier_pipeline_queue_max_depth', stats['max_depth'], queue=name)
+		set_gauge('premier_pipeline_queue_blocked_seconds', stats['blocked_seconds'], queue=name)
+
+	return report
\ No newline at end of file
@@ -0,0 +1,208 @@
+import io
+import os
+import gzip
+import json
+import time
+import hashlib
+import datetime
+import threading
+from typing import Any, Iterator
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+# Record and replay of the order management system: every response is saved
+# as a gzipped JSON envelope and its body, gzipped, beside it, ex)
+# recordings/get-3f1c0a9e2b7d4c11-000002.json.gz
+# 	{
+# 		'method': 'GET', 'url': '...', 'status': 200, 'elapsed': 1.42,
+# 		'recorded': '2023-11-24T18:00:03', 'headers': {'ETag': '"3f1c..."', ...}
+# 	}
+# and recordings/get-3f1c0a9e2b7d4c11-000002.body.gz; recordings made before
+# bodies had a file of their own keep the body in the envelope, as 'body'.
+# Recordings hold customer names and the store endpoints, keep them private.
+#
+# Responses are keyed on method and URL, and a URL's recordings are served
+# back in the order they were made, so replaying a day of refreshes repeats
+# the day; once a URL runs out its last response is served again. A
+# conditional GET is answered as the server would: 304 Not Modified if it
+# names the recorded response's ETag, and a recorded 304 that it doesn't
+# name is served as the last recorded response with a body.
+
+# query parameters that differ between runs and are left out of the key, ex:
+# the incremental sync date (see app.logic._order_params)
+VOLATILE_PARAMS: set[str] = {'modifyDateStart'}
+
+# headers that describe the body as it was sent, not as it is kept: the
+# body is recorded decoded
+WIRE_HEADERS: set[str] = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+# bytes of a body copied to its recording at a time
+BODY_CHUNK_SIZE: int = 64 * 1024
+
+
+def _key(method: str, url: str) -> str:
+	parts = urlsplit(url)
+	query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if k not in VOLATILE_PARAMS])
+	stable = urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+	return method.lower() + '-' + hashlib.sha1(stable.encode()).hexdigest()[:16]
+
+
+def _recordings(directory: str) -> dict[str, list[str]]:
+	by_key: dict[str, list[str]] = {}
+	if os.path.isdir(directory):
+		for name in sorted(os.listdir(directory)):
+			if name.endswith('.json.gz'):
+				key = name.rsplit('-', 1)[0]
+				by_key.setdefault(key, []).append(os.path.join(directory, name))
+	return by_key
+
+
+def _body_path(path: str) -> str:
+	return path[:-len('.json.gz')] + '.body.gz'
+
+
+def _load_envelope(path: str) -> dict[str, Any]:
+	with gzip.open(path, 'rt', encoding='utf-8') as f:
+		return json.load(f)
+
+
+# A response's raw stream that copies the body to its recording as the
+# caller reads it, so recording streams a feed like any other fetch; the
+# envelope is written once the body is complete, and closing the response
+# early reads the rest into the recording first
+class _RecordingStream:
+	def __init__(self, raw: Any, path: str, envelope: dict[str, Any]) -> None:
+		self._raw = raw
+		self._path = path
+		self._envelope = envelope
+		self._body = gzip.open(_body_path(path) + '.tmp', 'wb', compresslevel=1)
+		self._done: bool = False
+
+	def read(self, amt: int | None = None, decode_content: bool = True, **kwargs: Any) -> bytes:
+		chunk: bytes = self._raw.read(amt, decode_content=True)
+		if self._done:
+			return chunk
+		if chunk:
+			self._body.write(chunk)
+		if not chunk or amt is None:
+			self._finish()
+		return chunk
+
+	def stream(self, amt: int = BODY_CHUNK_SIZE, decode_content: bool | None = None) -> Iterator[bytes]:
+		while chunk := self.read(amt):
+			yield chunk
+
+	def _finish(self) -> None:
+		self._done = True
+		self._body.close()
+		os.replace(_body_path(self._path) + '.tmp', _body_path(self._path))
+
+		with gzip.open(self._path + '.tmp', 'wt', encoding='utf-8') as f:
+			json.dump(self._envelope, f)
+		os.replace(self._path + '.tmp', self._path)
+
+	def close(self) -> None:
+		if not self._done:
+			while self.read(BODY_CHUNK_SIZE):
+				pass
+		self._raw.close()
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(self._raw, name)
+
+
+# An HTTPAdapter that saves every response it receives to directory
+class RecordingAdapter(HTTPAdapter):
+	def __init__(self, directory: str, **kwargs: Any) -> None:
+		super().__init__(**kwargs)
+		os.makedirs(directory, exist_ok=True)
+		self.directory = directory
+		self._lock = threading.Lock()
+		self._counts: dict[str, int] = {key: len(paths) for key, paths in _recordings(directory).items()}
+
+	def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+		resp = super().send(request, **kwargs)
+		key = _key(request.method, request.url)
+
+		with self._lock:
+			seq = self._counts.get(key, 0)
+			self._counts[key] = seq + 1
+
+		envelope = {
+			'method': request.method,
+			'url': request.url,
+			'status': resp.status_code,
+			'elapsed': round(resp.elapsed.total_seconds(), 3),
+			'recorded': datetime.datetime.now().isoformat(timespec='seconds'),
+			'headers': {name: value for name, value in resp.headers.items() if name.lower() not in WIRE_HEADERS},
+		}
+
+		resp.raw = _RecordingStream(resp.raw, os.path.join(self.directory, f'{key}-{seq:06d}.json.gz'), envelope)
+		return resp
+
+
+# A transport that serves recorded responses instead of calling the network
+# 	latency : None serves at once, 'recorded' waits as long as the original
+# 	response took, and a number of seconds waits that long on every call
+class ReplayAdapter(BaseAdapter):
+	def __init__(self, directory: str, latency: float | str | None = None) -> None:
+		super().__init__()
+		self.directory = directory
+		self.latency = latency
+		self._lock = threading.Lock()
+		self._recordings: dict[str, list[str]] = _recordings(directory)
+		self._served: dict[str, int] = {}
+
+	# serve every URL's recordings from the first again
+	def rewind(self) -> None:
+		with self._lock:
+			self._served.clear()
+
+	def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+		key = _key(request.method, request.url)
+
+		with self._lock:
+			paths = self._recordings.get(key)
+			if not paths:
+				raise requests.ConnectionError(f'no recording of {request.method} {request.url} in {self.directory}')
+			seq = self._served.get(key, 0)
+			self._served[key] = seq + 1
+
+		seq = min(seq, len(paths) - 1)
+		envelope: dict[str, Any] = _load_envelope(paths[seq])
+		etag: str | None = request.headers.get('If-None-Match')
+
+		# a 304 to a request without that ETag: the body it stood for
+		while envelope['status'] == 304 and etag != envelope.get('headers', {}).get('ETag') and seq > 0:
+			seq -= 1
+			envelope = _load_envelope(paths[seq])
+
+		if self.latency == 'recorded':
+			time.sleep(envelope['elapsed'])
+		elif self.latency:
+			time.sleep(float(self.latency))
+
+		resp = requests.Response()
+		resp.status_code = envelope['status']
+		resp.headers = CaseInsensitiveDict(envelope.get('headers') or {'Content-Type': 'application/json'})
+
+		if etag is not None and resp.status_code == 200 and etag == resp.headers.get('ETag'):
+			resp.status_code = 304
+			resp.raw = io.BytesIO(b'')
+		elif 'body' in envelope:
+			resp.raw = io.BytesIO(envelope['body'].encode('utf-8'))
+		else:
+			resp.raw = gzip.open(_body_path(paths[seq]), 'rb')
+
+		resp.encoding = 'utf-8'
+		resp.url = request.url
+		resp.request = request
+		resp.elapsed = datetime.timedelta(seconds=envelope['elapsed'])
+		return resp
+
+	def close(self) -> None:
+		pass
\ No newline at end of file
@@ -0,0 +1,341 @@
+from functools import lru_cache
+from typing import Callable, NamedTuple
+
+
+# Number of distinct SKUs remembered by normalize() and clean_sku(); a day's
+# orders repeat the same few hundred SKUs across thousands of items
+SKU_CACHE_SIZE: int = 4096
+
+
+# The remaps below are only the defaults the SkuRemap table is seeded with
+# (see app.db.create_tables); edit them at /sku-remap, see SkuIndex
+
+# STEX<num> to sort in order by location
+STEX_LOCATIONS: dict[str, str] = {
+	'WHT': 'STEX6',
+	'BRIT': 'STEX7',
+	'GRN': 'STEX5',
+	'CHAR': 'STEX4',
+	'BLK': 'STEX2',
+	'GREY': 'STEX3',
+	'RED': 'STEX8',
+	'NAVY': 'STEX1',
+	'KAK': 'STEX9',
+}
+
+# change VS127 - VS136 to VS.127 - VS.136 so they show up in alphanumeric order,
+# they were in between VS03 and VS15
+VS_MAP: dict[str, str] = {
+	"VS127": "VS.127", "VS128": "VS.128", "VS129": "VS.129", "VS130": "VS.130",
+	"VS131": "VS.131", "VS132": "VS.132", "VS133": "VS.133", "VS134": "VS.134",
+	"VS135": "VS.135", "VS136": "VS.136", "2VS134": "VS.134"
+}
+
+# sizes renamed so they sort with the rest
+SIZE_MAP: dict[str, str] = {'XXL': '2XL'}
+
+# sort sizes in logical order (tops: XSML to 8XL, bottoms: 30 to 54), a
+# size is ranked by its first two characters
+SIZE_ORDERING: dict[str, int] = {
+	'XS': 0,
+	'SM': 1, 
+	'ME': 2,
+	'LA': 3,  # 'LARG'
+	'LR': 4,  # 'LRG'
+	'XL': 5, 
+	'2X': 6, 
+	'3X': 7, 
+	'4X': 8, 
+	'5X': 9, 
+	'6X': 10, 
+	'7X': 11, 
+	'8X': 12, 
+	'30': 13, 
+	'32': 14, 
+	'34': 15, 
+	'36': 16, 
+	'38': 17, 
+	'40': 18, 
+	'42': 19, 
+	'44': 20, 
+	'46': 21, 
+	'48': 22, 
+	'50': 23,
+	'52': 24,
+	'54': 25,
+}
+
+# size rank of an irregular SKU, which doesn't have a size
+NO_SIZE_RANK: int = -1
+
+# obsolete SKU suffixes, stripped before cleaning
+OBSOLETE_SUFFIXES: tuple[str, ...] = ('-SL', '-SLL', '-D')
+
+# kinds of SkuRemap entries, kind -> what it maps
+REMAP_KINDS: dict[str, str] = {
+	'revised': 'revised or obsolete SKU to its current SKU',
+	'vs': 'VASS / BENZ style to the style it sorts as',
+	'stex': 'STEX color to its location',
+}
+
+
+# A SKU's fields are named by its layout, ex: 'brand-style-size' names
+# the fields of PREM-646-MED; the cleaned SKU is the template's fields
+# followed by the size, after each rewrite (field -> function of all
+# fields) is applied. A rule only applies if every field named in 'when'
+# has one of the listed values.
+class SkuRule(NamedTuple):
+	layout: str
+	template: str
+	rewrites: dict[str, Callable[[dict[str, str]], str]] = {}
+	when: dict[str, frozenset[str]] = {}
+
+
+# brand(s) -> rules, first matching rule for the SKU's number of fields
+# wins; the VASS styles and STEX locations are remapped with vs_map and
+# stex_locations
+def _sku_rules(vs_map: dict[str, str], stex_locations: dict[str, str]) -> dict[tuple[str, ...], list[SkuRule]]:
+	return {
+		# PREMIER
+		('PREM',): [
+			# PREM-646-MED, PREM-631NEW-LRG, PREM-210P-5XL
+			SkuRule('brand-style-size', 'brand-style',
+				{'style': lambda f: f['style'][:3] if f['style'][-3:] == 'NEW' else f['style']}),
+			# PREM-618-RED-MED, PREM-SS-101-LRG
+			SkuRule('brand-index_1-index_2-size', 'brand-index_1-index_2'),
+		],
+
+		# STEX
+		('STEX', 'STX'): [
+			SkuRule('brand-color-size', 'brand-color',
+				{'brand': lambda f: stex_locations.get(f['color'], f['brand'])}),
+		],
+
+		# WICKED SHORTS / WEAR SHORTS
+		('WICK', 'WEAR'): [
+			SkuRule('brand-color-size', 'brand-color'),
+		],
+
+		# VESE / AMDS
+		('VESE', 'AMDS'): [
+			# AMDS-RED-01-XL / VESE-GREEN-11-LRG
+			SkuRule('brand-color-style-size', 'brand-style-color'),
+		],
+
+		# CASUAL COUNTRY
+		('CAS', 'CASS'): [
+			# long sleeve: CAS-PURP-01-LRG / CAS-NAV-3065-MED
+			SkuRule('brand-color-style-size', 'brand-style-color',
+				{'style': lambda f: 'SOLID-3065' if f['style'] == '3065' else f['style']}),
+			# short sleeve: CAS-SS-45-WHT-SML
+			SkuRule('brand-ss-style-color-size', 'brand-ss-style-color'),
+		],
+
+		# RODEO / ACE
+		('ROD', 'RODEO', 'ACE'): [
+			# RODEO-524-XL
+			SkuRule('brand-style-size', 'brand-style'),
+			# RODEO-BEIG-533-MED, ROD-WOM-506-XL; strip 'PS400' from style number (RODEO-BRWN-PS400461N-MED)
+			SkuRule('brand-color_or_women-style-size', 'brand-style-color_or_women',
+				{'style': lambda f: f['style'][5:] if f['style'][:5] == 'PS400' else f['style']}),
+			# ACE-HFK700-10-NVYBLU-3XL / HFK200
+			SkuRule('brand-hfk-style-color-size', 'brand-hfk-style-color',
+				when={'hfk': frozenset(('HFK700', 'HFK200'))}),
+			# WOMENS: ACE-WOM-BLU-ES5110-SML
+			SkuRule('brand-women-color-style-size', 'brand-style-women-color'),
+		],
+
+		# BUCKEROO
+		('BUCK',): [
+			# BUCK-WS6-BEGE/BRWN-LRG
+			SkuRule('brand-style-color-size', 'brand-style-color'),
+			# BUCK-WS100-01-BLACK/BLUE-SML / BUCK-WS200-01-BLACK/BLUE-SML
+			SkuRule('brand-style-number-color-size', 'brand-style-number-color'),
+		],
+
+		# VICT / ENVY / SOCI JEANS
+		('VIC', 'VICT', 'ENVY', 'SOCI'): [
+			# VICT-701-XL / ENVY-5034-SML
+			SkuRule('brand-style-size', 'brand-style'),
+			# VICT-BLACK-01-38x32 / ENVY-WHIT-101-XL / SOCI-BLU-950-32x32
+			SkuRule('brand-color-style-size', 'brand-style-color'),
+			# ENVY-LACE-WHT-64025-SML
+			SkuRule('brand-lace-color-style-size', 'brand-style-lace-color'),
+			# VIC-500-DENIM-JACKET-DARK-INDIGO-XL
+			SkuRule('brand-style-denim-jacket-color1-color2-size', 'brand-style-denim-jacket-color1-color2'),
+		],
+
+		# VASS / BENZ
+		('VASS', 'BENZ'): [
+			# VASS-LEOP-VS135-SML
+			SkuRule('brand-color-style-size', 'brand-style-color',
+				{'style': lambda f: vs_map.get(f['style'], f['style'])}),
+		],
+	}
+
+
+SKU_RULES: dict[tuple[str, ...], list[SkuRule]] = _sku_rules(VS_MAP, STEX_LOCATIONS)
+
+
+# A rule compiled for one field count:
+# 	(output field indexes, rewrites by field index, required values by field index, field names)
+_CompiledRule = tuple[
+	tuple[int, ...],
+	tuple[tuple[int, Callable[[dict[str, str]], str]], ...],
+	tuple[tuple[int, frozenset[str]], ...],
+	tuple[str, ...]
+]
+
+
+# Resolve each rule's field names to indexes once, and index the rules
+# by (brand, number of fields) so cleaning a SKU is one dict lookup
+def _compile_rules(rules: dict[tuple[str, ...], list[SkuRule]]) -> dict[tuple[str, int], list[_CompiledRule]]:
+	compiled: dict[tuple[str, int], list[_CompiledRule]] = {}
+
+	for brands, brand_rules in rules.items():
+		for rule in brand_rules:
+			fields: tuple[str, ...] = tuple(rule.layout.split('-'))
+			position: dict[str, int] = {name: i for i, name in enumerate(fields)}
+
+			if fields[0] != 'brand' or fields[-1] != 'size':
+				raise ValueError(f'SKU layout must start with brand and end with size: {rule.layout}')
+
+			output = tuple(position[name] for name in rule.template.split('-'))
+			rewrites = tuple((position[name], fn) for name, fn in rule.rewrites.items())
+			when = tuple((position[name], values) for name, values in rule.when.items())
+
+			for brand in brands:
+				compiled.setdefault((brand, len(fields)), []).append((output, rewrites, when, fields))
+
+	return compiled
+
+
+# The SKU remaps compiled into lookups, one immutable index per version of
+# the SkuRemap table (None: the defaults, not loaded from the db); each
+# index caches its own results, so swapping in a new index (load_index)
+# never serves a SKU cleaned with the old remaps
+# 	revised : revised or obsolete SKU -> current SKU, ex) 'PREM-646-MEDIUM' -> 'PREM-646-MED'
+# 	vs_map, stex_locations : see VS_MAP and STEX_LOCATIONS
+class SkuIndex:
+	def __init__(
+		self, 
+		version: int | None = None, 
+		revised: dict[str, str] | None = None, 
+		vs_map: dict[str, str] | None = None, 
+		stex_locations: dict[str, str] | None = None
+	) -> None:
+		self.version = version
+		self.revised: dict[str, str] = dict(revised or {})
+		self.vs_map: dict[str, str] = dict(VS_MAP if vs_map is None else vs_map)
+		self.stex_locations: dict[str, str] = dict(STEX_LOCATIONS if stex_locations is None else stex_locations)
+
+		rules = _sku_rules(self.vs_map, self.stex_locations)
+		self._rules: dict[tuple[str, int], list[_CompiledRule]] = _compile_rules(rules)
+		self._brands: frozenset[str] = frozenset(brand for brands in rules for brand in brands)
+
+		self.clean_sku: Callable[[str], str] = lru_cache(maxsize=SKU_CACHE_SIZE)(self._clean_sku)
+		self.normalize: Callable[[str], str] = lru_cache(maxsize=SKU_CACHE_SIZE)(self._normalize)
+
+	# Clean and normalize the Stock Keeping Unit to sort properly, ex)
+	# 	'PREM-631NEW-XXL' -> 'PREM-631-2XL'
+	# 	'VASS-LEOP-VS135-SML' -> 'VASS-VS.135-LEOP-SML'
+	# SKUs of other brands need no cleaning and are returned as is
+	def _clean_sku(self, sku: str) -> str:
+		sku_array: list[str] = sku.split('-')
+		brand: str = sku_array[0]
+
+		if brand not in self._brands:
+			return sku
+
+		for output, rewrites, when, names in self._rules.get((brand, len(sku_array)), ()):
+			if any(sku_array[i] not in values for i, values in when):
+				continue
+
+			if rewrites:
+				named: dict[str, str] = dict(zip(names, sku_array))
+				for i, fn in rewrites:
+					sku_array[i] = fn(named)
+
+			size: str = sku_array[-1]
+			return '-'.join([sku_array[i] for i in output] + [SIZE_MAP.get(size, size)])
+
+		raise ValueError(f'Unrecognized {brand} SKU: {sku}')
+
+	# Map a revised or obsolete SKU to its current SKU, ex)
+	# 	'PREM-646-MED-SL' -> 'PREM-646-MED'
+	def revise(self, raw_sku: str) -> str:
+		# Revised SKU
+		if raw_sku in self.revised:
+			return self.revised[raw_sku]
+
+		# Obsolete SKU
+		for suffix in OBSOLETE_SUFFIXES:
+			if raw_sku.endswith(suffix):
+				return raw_sku[:-len(suffix)]
+
+		return raw_sku
+
+	# Map a revised or obsolete SKU to its cleaned SKU
+	def _normalize(self, raw_sku: str) -> str:
+		return self.clean_sku(self.revise(raw_sku))
+
+	# Cleaned SKU of an order item; an item with no usable SKU (None, '' or
+	# a randomly generated 'wi_' SKU) is named by its description instead
+	def normalize_item(self, raw_sku: str | None, description: str) -> str:
+		if not has_sku(raw_sku):
+			return self.clean_sku(description)
+		return self.normalize(raw_sku)
+
+
+# the index every SKU is normalized with, until the SkuRemap table is
+# loaded (see app.logic._sync_sku_remap)
+_index: SkuIndex = SkuIndex()
+
+
+def get_index() -> SkuIndex:
+	return _index
+
+
+# Normalize with index from now on; a single assignment, so every caller
+# sees either the old index or the new one
+def load_index(index: SkuIndex) -> None:
+	global _index
+	_index = index
+
+
+# False for an item SKU that doesn't name the item: None, '' or a randomly
+# generated 'wi_' SKU
+def has_sku(raw_sku: str | None) -> bool:
+	return raw_sku is not None and raw_sku != '' and raw_sku[:3] != 'wi_'
+
+
+# The current index's lookups, see SkuIndex
+def clean_sku(sku: str) -> str:
+	return _index.clean_sku(sku)
+
+
+def revise(raw_sku: str) -> str:
+	return _index.revise(raw_sku)
+
+
+def normalize(raw_sku: str) -> str:
+	return _index.normalize(raw_sku)
+
+
+def normalize_item(raw_sku: str | None, description: str) -> str:
+	return _index.normalize_item(raw_sku, description)
+
+
+# Split a cleaned SKU into (style, size, size rank) for the pick list, ex)
+# 	'PREM-646-MED'  -> ('PREM-646', 'MED', 2)
+# 	'GIFTCARD'      -> ('GIFTCARD', '', NO_SIZE_RANK) irregular SKU, doesn't have a size
+# 	'WELCOME-X1Z9Q' -> ('WELCOME', 'X1Z9Q', None)       randomly generated coupon code, not picked
+@lru_cache(maxsize=SKU_CACHE_SIZE)
+def split_sku(sku: str) -> tuple[str, str, int | None]:
+	array: list[str] = sku.rsplit('-', 1)
+
+	if len(array) == 1:
+		return sku, '', NO_SIZE_RANK
+
+	style, size = array
+	return style, size, SIZE_ORDERING.get(size[:2])
\ No newline at end of file
@@ -0,0 +1,9 @@
+# The online stores, by the name their orders are stored under; a
+# store's page is its name as a URL path, ex) 'New Shirt of the Day' -> /new-shirt-of-the-day
+AMAZON: str = 'Amazon'
+EBAY: str = 'eBay'
+PREM_SHIRTS: str = 'Premier Shirts'
+NSOTD: str = 'New Shirt of the Day'
+BUCKEROO: str = 'Buckeroo'
+
+STORES: tuple[str, ...] = (AMAZON, EBAY, PREM_SHIRTS, NSOTD, BUCKEROO)
\ No newline at end of file
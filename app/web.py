@@ -0,0 +1,36 @@
+import threading
+
+from flask import Flask
+import config
+
+from app import metrics, db
+
+# The web app: the routes (app.api) and the request hooks of app.metrics
+# and app.db; templates and static files are the app package's. Importing
+# it touches neither the db nor the scheduled refresh, see init_app
+app = Flask('app')
+app.config['SECRET_KEY'] = config.SECRET_KEY
+
+app.teardown_appcontext(db._teardown_db)
+metrics.init_app(app)
+
+from app import api, worker
+
+_initialized: bool = False
+_init_lock = threading.Lock()
+
+
+# Ready the app to serve, once per process: create or upgrade the db's
+# tables and start the scheduled refresh; the web server gets the app
+# through premier.app, which calls this, so whoever imports the app
+# itself (ex: the bench scripts) can point it at another db first
+def init_app() -> Flask:
+	global _initialized
+
+	with _init_lock:
+		if not _initialized:
+			db.create_tables()
+			worker.start_scheduler()
+			_initialized = True
+
+	return app
\ No newline at end of file
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import uuid
+import socket
+import datetime
+import threading
+from typing import Any
+
+from app import logger, REFRESH_INTERVAL, REFRESH_LEASE_SECONDS
+from app.metrics import inc, set_gauge
+from app.db import _claim_refresh, _save_refresh, _get_last_refresh, _get_last_update
+from app.logic import ORDER_ENDPOINTS, _refresh_stores, _get_sync_plan, _sync_sku_remap
+from app.pipeline import run_pipeline
+
+
+# One run of the refresh pipeline (refresh stores -> fetch -> ingest) on a
+# background thread, with its progress:
+# 	state : 'running', 'done' or 'failed'
+# 	stage : 'refreshing', 'fetching', 'ingesting' or 'finished'; stores are
+# 	ingested while others are still fetching, 'ingesting' is what's left
+# 	once every feed is in
+# 	stores : store -> {'state': 'pending' | 'fetched' | 'ingested', 'fetch_seconds', 'orders'}
+# 	stage_seconds : seconds each finished stage took, ex) {'refreshing': 1.2, 'fetching': 3.4}
+# 	pipeline : stage throughput and queue depths, see app.pipeline.run_pipeline
+#
+# a job is saved to the Refresh_Job table as it starts, fetches and
+# finishes, which is how other worker processes see it (see loaded)
+class RefreshJob:
+	def __init__(self) -> None:
+		self.id: str = uuid.uuid4().hex[:12]
+		self.state: str = 'running'
+		self.stage: str = 'refreshing'
+		self.error: str | None = None
+		self.started: float = time.time()
+		self.finished: float | None = None
+		self.stage_seconds: dict[str, float] = {}
+		self.pipeline: dict[str, Any] | None = None
+		self._stage_started: float = time.perf_counter()
+		self.stores: dict[str, dict[str, Any]] = {
+			store: {'state': 'pending', 'fetch_seconds': None, 'orders': None}
+			for store, _, _ in ORDER_ENDPOINTS
+		}
+
+	def as_json(self) -> dict[str, Any]:
+		return {
+			'id': self.id,
+			'state': self.state,
+			'stage': self.stage,
+			'error': self.error,
+			'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+			'seconds': round((self.finished or time.time()) - self.started, 3),
+			'stores': self.stores,
+			'stage_seconds': self.stage_seconds,
+			'pipeline': self.pipeline,
+		}
+
+	# A job as it was last saved by the worker process running it
+	@classmethod
+	def loaded(cls, row: tuple[str, str, str, float, float | None, str]) -> 'RefreshJob':
+		job_id, state, _, started, finished, saved = row
+		detail: dict[str, Any] = json.loads(saved)
+
+		job = cls()
+		job.id, job.state, job.started, job.finished = job_id, state, started, finished
+		job.stage = detail['stage']
+		job.error = detail['error']
+		job.stores = detail['stores']
+		job.stage_seconds = detail['stage_seconds']
+		job.pipeline = detail['pipeline']
+		return job
+
+	def save(self) -> None:
+		_save_refresh(self.id, self.state, self.finished, json.dumps(self.as_json()))
+
+	# finish the current stage and start the next one
+	def advance(self, stage: str) -> None:
+		now = time.perf_counter()
+		self.stage_seconds[self.stage] = round(now - self._stage_started, 3)
+		self.stage = stage
+		self._stage_started = now
+
+
+# this worker process, the owner of the refreshes it runs
+_OWNER: str = f'{socket.gethostname()}:{os.getpid()}'
+
+_lock = threading.Lock()
+_current_job: RefreshJob | None = None
+_last_job: RefreshJob | None = None
+
+
+# A running refresh is abandoned when the worker process running it on
+# this host is gone, or it has run longer than REFRESH_LEASE_SECONDS; this
+# process only asks when it isn't running one itself
+def _is_stale(row: tuple[str, str, str, float, float | None, str]) -> bool:
+	_, _, owner, started, _, _ = row
+	if time.time() - started > REFRESH_LEASE_SECONDS:
+		return True
+
+	host, _, pid = owner.rpartition(':')
+	if host != socket.gethostname():
+		return False
+	if int(pid) == os.getpid():
+		return True
+
+	try:
+		os.kill(int(pid), 0)
+	except ProcessLookupError:
+		return True
+	except PermissionError:
+		pass
+	return False
+
+
+def _run_refresh(job: RefreshJob) -> None:
+	global _current_job, _last_job
+
+	def fetched(store: str, seconds: float) -> None:
+		job.stores[store].update(state='fetched', fetch_seconds=seconds)
+		set_gauge('premier_refresh_store_fetch_seconds', seconds, store=store)
+
+	def ingested(store: str, num_orders: int) -> None:
+		job.stores[store].update(state='ingested', orders=num_orders)
+
+	# no app context: every db call checks out its own connection, so the
+	# SKU remap sync after the pipeline reads the snapshot it just published
+	try:
+		if not _refresh_stores():
+			raise RuntimeError('Store refresh failed')
+
+		# normalize with the latest SKU remaps, and again after: orders
+		# normalized while the remaps were edited are re-normalized
+		_sync_sku_remap()
+
+		job.advance('fetching')
+		job.save()
+		since: dict[str, str | None] = _get_sync_plan()
+		job.pipeline = run_pipeline(
+			since, 
+			on_store_fetched=fetched, 
+			on_fetch_done=lambda: job.advance('ingesting'), 
+			on_store_done=ingested
+		)
+		_sync_sku_remap()
+
+		job.state = 'done'
+	except Exception as e:
+		logger.exception('refresh %s failed', job.id)
+		job.state = 'failed'
+		job.error = str(e)
+	finally:
+		job.advance('finished')
+		job.finished = time.time()
+
+		# releases the refresh lock; when the db can't be written, the
+		# lock is taken over once the lease runs out
+		try:
+			job.save()
+		except Exception:
+			logger.exception('refresh %s could not be saved', job.id)
+
+		for stage, seconds in job.stage_seconds.items():
+			set_gauge('premier_refresh_last_seconds', seconds, stage=stage)
+		set_gauge('premier_refresh_last_seconds', round(job.finished - job.started, 3), stage='total')
+		set_gauge('premier_refresh_last_timestamp', job.finished)
+		inc('premier_refreshes_total', state=job.state)
+
+		with _lock:
+			_current_job = None
+			_last_job = job
+
+
+# Start a refresh on a background thread and return its job; while one is
+# already running, in this worker process or another, every caller gets
+# that job instead of a second refresh
+def start_refresh() -> RefreshJob:
+	global _current_job
+
+	with _lock:
+		if _current_job is not None:
+			return _current_job
+
+		job = RefreshJob()
+		running = _claim_refresh(job.id, _OWNER, job.started, json.dumps(job.as_json()), _is_stale)
+		if running is not None:
+			return RefreshJob.loaded(running)
+
+		_current_job = job
+
+	threading.Thread(target=_run_refresh, args=(job,), name='refresh-' + job.id, daemon=True).start()
+	return job
+
+
+# The running job, or the most recent one if none is running, in any
+# worker process; this process's own jobs are live, others' as last saved
+def get_job() -> RefreshJob | None:
+	with _lock:
+		if _current_job is not None:
+			return _current_job
+		local = _last_job
+
+	row = _get_last_refresh()
+	if row is None:
+		return local
+	if local is not None and local.id == row[0]:
+		return local
+	return RefreshJob.loaded(row)
+
+
+# date and time the stores were last updated by any worker process, ex:
+# "Jan 31, 11:59 PM", None if they never were
+def get_last_update() -> str | None:
+	finished: float | None = _get_last_update()
+	if finished is None:
+		return None
+	return datetime.datetime.fromtimestamp(finished).strftime('%b %d, %I:%M %p')
+
+
+# a refresh that can't be started, ex: the db is locked, is tried again
+# at the next interval instead of stopping the schedule
+def _schedule(interval: float) -> None:
+	while True:
+		time.sleep(interval)
+		try:
+			start_refresh()
+		except Exception:
+			logger.exception('scheduled refresh could not be started')
+
+
+# Keep the data warm: refresh every REFRESH_INTERVAL seconds (0 disables)
+def start_scheduler() -> None:
+	if REFRESH_INTERVAL > 0:
+		threading.Thread(target=_schedule, args=(REFRESH_INTERVAL,), name='refresh-schedule', daemon=True).start()
@@ -0,0 +1,141 @@
+# Synthetic order JSON in the shape the order management system returns
+# and _parse_store_metadata reads, ex)
+# 	{
+# 		'orderNumber': '113-4567890', 'orderKey': '...', 'orderStatus': 'awaiting_shipment',
+# 		'orderDate': '2023-05-25T14:50:07.0000000', 'modifyDate': '...',
+# 		'billTo': {'name': 'Jane Doe'},
+# 		'items': [{'sku': 'PREM-646-MED', 'name': 'Premier Shirt 646', 'quantity': 1}]
+# 	}
+# SKUs cover every brand layout in app.sku.SKU_RULES, revised and obsolete
+# SKUs, missing and 'wi_' SKUs, irregular SKUs and coupon codes.
+import random
+import datetime
+from typing import Any
+
+
+# a SKU without its size, and the sizes it is sold in
+TOPS: list[str] = ['XSML', 'SML', 'MED', 'LRG', 'LARG', 'XL', 'XXL', '2XL', '3XL', '4XL', '5XL']
+BOTTOMS: list[str] = ['30x30', '32x32', '34x30', '36x32', '38x32', '40x34', '42x32']
+SHORTS: list[str] = ['30', '32', '34', '36', '38', '40', '42']
+
+STYLES: list[tuple[str, list[str]]] = [
+	# PREMIER
+	('PREM-646', TOPS), ('PREM-631NEW', TOPS), ('PREM-210P', TOPS),
+	('PREM-618-RED', TOPS), ('PREM-SS-101', TOPS),
+	# STEX
+	('STEX-WHT', TOPS), ('STEX-NAVY', TOPS), ('STX-KAK', TOPS), ('STEX-PINK', TOPS),
+	# WICKED SHORTS / WEAR SHORTS
+	('WICK-BLK', SHORTS), ('WEAR-GRY', SHORTS),
+	# VESE / AMDS
+	('AMDS-RED-01', TOPS), ('VESE-GREEN-11', TOPS),
+	# CASUAL COUNTRY
+	('CAS-PURP-01', TOPS), ('CAS-NAV-3065', TOPS), ('CASS-SS-45-WHT', TOPS),
+	# RODEO / ACE
+	('RODEO-524', TOPS), ('RODEO-BEIG-533', TOPS), ('ROD-WOM-506', TOPS),
+	('RODEO-BRWN-PS400461N', TOPS), ('ACE-HFK700-10-NVYBLU', TOPS),
+	('ACE-HFK200-12-BLK', TOPS), ('ACE-WOM-BLU-ES5110', TOPS),
+	# BUCKEROO
+	('BUCK-WS6-BEGE/BRWN', TOPS), ('BUCK-WS100-01-BLACK/BLUE', TOPS),
+	# VICT / ENVY / SOCI JEANS
+	('VICT-701', TOPS), ('ENVY-5034', TOPS), ('VICT-BLACK-01', BOTTOMS),
+	('SOCI-BLU-950', BOTTOMS), ('ENVY-LACE-WHT-64025', TOPS),
+	('VIC-500-DENIM-JACKET-DARK-INDIGO', TOPS),
+	# VASS / BENZ
+	('VASS-LEOP-VS135', TOPS), ('BENZ-BLK-VS15', TOPS), ('VASS-RED-2VS134', TOPS),
+	# no cleaning necessary
+	('HAT-BLK', TOPS),
+]
+
+# SKUs that skip the style table, ex: obsolete suffixes and coupon codes;
+# None, '' and 'wi_' SKUs are named by the item description instead
+ODD_SKUS: list[str | None] = [
+	'PREM-646-MED-SL', 'STEX-WHT-LRG-SLL', 'VICT-701-XL-D',
+	'GIFTCARD', 'WELCOME-X1Z9Q', None, '', 'wi_8f2c61a0',
+]
+
+DESCRIPTIONS: list[str] = ['PREM-646-LRG', 'STEX-BLK-XL', 'Gift Card', 'Sticker']
+
+FIRST_NAMES: list[str] = ['Jane', 'John', 'Maria', 'Wei', 'Sam', 'Alex', 'Priya', 'Luis']
+LAST_NAMES: list[str] = ['Doe', 'Smith', 'Garcia', 'Chen', 'Patel', 'Brown', 'Nguyen']
+
+# share of the day's orders each store gets, in ORDER_ENDPOINTS order
+ENDPOINT_WEIGHTS: list[int] = [40, 10, 6, 2, 15, 15, 7, 5]
+
+
+# every size of the first styles (all of them if None), the odd SKUs and
+# a few revised ones
+def _sku_pool(rng: random.Random, styles: int | None = None) -> list[str | None]:
+	pool: list[str | None] = [style + '-' + size for style, sizes in STYLES[:styles] for size in sizes]
+	pool.extend(ODD_SKUS)
+
+	# a few revised SKUs, if the map has any
+	try:
+		from app.sku_map import MAP
+		pool.extend(rng.sample(sorted(MAP), min(len(MAP), 10)))
+	except ImportError:
+		pass
+
+	return pool
+
+
+def _iso(dt: datetime.datetime) -> str:
+	return dt.strftime('%Y-%m-%dT%H:%M:%S') + '.0000000'
+
+
+# Returns num_orders orders; the same seed always gives the same orders
+# 	styles : items are drawn from the first this many STYLES, all if None
+# 	odd_share : share of items with an ODD_SKUS SKU on top of the pool's own
+def generate_orders(
+	num_orders: int,
+	seed: int = 0,
+	start_number: int = 100000,
+	styles: int | None = None,
+	odd_share: float = 0.1
+) -> list[dict[str, Any]]:
+	rng = random.Random(seed)
+	pool = _sku_pool(rng, styles)
+	now = datetime.datetime(2023, 11, 24, 18, 0, 0)
+	orders: list[dict[str, Any]] = []
+
+	for i in range(num_orders):
+		order_dt = now - datetime.timedelta(minutes=rng.randint(0, 3 * 24 * 60))
+		modify_dt = order_dt + datetime.timedelta(minutes=rng.randint(0, 120))
+		number = str(start_number + i)
+
+		items: list[dict[str, Any]] = []
+		for _ in range(rng.choices([1, 2, 3, 4, 6], weights=[60, 22, 10, 5, 3])[0]):
+			# most items are regular styles, a few are odd
+			sku = rng.choice(pool) if rng.random() < 1 - odd_share else rng.choice(ODD_SKUS)
+			items.append({
+				'sku': sku,
+				'name': rng.choice(DESCRIPTIONS),
+				'quantity': rng.choices([1, 2, 3], weights=[85, 12, 3])[0],
+			})
+
+		orders.append({
+			'orderNumber': number,
+			'orderKey': 'k' + number,
+			'orderStatus': 'awaiting_shipment',
+			'orderDate': _iso(order_dt),
+			'modifyDate': _iso(modify_dt),
+			'billTo': {'name': rng.choice(FIRST_NAMES) + ' ' + rng.choice(LAST_NAMES)},
+			'items': items,
+		})
+
+	return orders
+
+
+# Returns (store, orders, is_ebay) for every order endpoint, in
+# app.logic.ORDER_ENDPOINTS order, splitting num_orders across the stores
+def generate_store_orders(num_orders: int, seed: int = 0) -> list[tuple[str, list[dict[str, Any]], bool]]:
+	from app.logic import ORDER_ENDPOINTS
+
+	total = sum(ENDPOINT_WEIGHTS)
+	store_orders: list[tuple[str, list[dict[str, Any]], bool]] = []
+
+	for i, ((store, _, is_ebay), weight) in enumerate(zip(ORDER_ENDPOINTS, ENDPOINT_WEIGHTS)):
+		count = max(1, num_orders * weight // total)
+		orders = generate_orders(count, seed=seed + i, start_number=(i + 1) * 1000000)
+		store_orders.append((store, orders, is_ebay))
+
+	return store_orders
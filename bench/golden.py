@@ -0,0 +1,296 @@
+# Golden check of app.sku's table-driven SkuIndex against the if/elif
+# cascade it replaced (_legacy_clean_sku and _legacy_normalize_item below,
+# as they were before the rules became tables): every SKU on each path of
+# the cascade must come out the same, or fail the same way.
+#
+# 	revised      a SKU in the revised SKU map (app.sku_map's and SAMPLE_MAP)
+# 	obsolete     a -SL, -SLL or -D suffix on a current SKU
+# 	no sku       None, '' or a 'wi_' SKU, named by its description
+# 	coupon       a coupon code, ex) WELCOME-X1Z9Q
+# 	irregular    a SKU of no known brand, ex) GIFTCARD
+# 	brand rules  every brand's SKUs with every field count from 1 to 7 and
+# 	             the field values the rules look at (NEW, VS135, ...)
+#
+# exits non-zero and prints the first mismatches if any SKU differs.
+#
+# 	python -m bench.golden
+import sys
+import itertools
+from typing import Any
+
+from app.sku import SkuIndex, OBSOLETE_SUFFIXES
+from bench.generator import STYLES, ODD_SKUS, DESCRIPTIONS
+
+
+# revised SKUs checked on top of app.sku_map's, if it's there
+SAMPLE_MAP: dict[str, str] = {
+	'PREM-646-MEDIUM': 'PREM-646-MED',
+	'STEX-WHITE-XL': 'STEX-WHT-XL',
+	'VASS-LEOP-135-SML': 'VASS-LEOP-VS135-SML',
+	'CAS-SS45-WHT-LRG': 'CASS-SS-45-WHT-LRG',
+}
+
+BRANDS: list[str] = [
+	'PREM', 'STEX', 'STX', 'WICK', 'WEAR', 'VESE', 'AMDS', 'CAS', 'CASS', 'ROD', 'RODEO', 'ACE',
+	'BUCK', 'VIC', 'VICT', 'ENVY', 'SOCI', 'VASS', 'BENZ', 'HAT', '',
+]
+
+# field values the cascade tests for, and a few it doesn't; SKUs of more
+# than five fields take theirs from LONG_FIELDS
+FIELDS: list[str] = [
+	'631NEW', 'NEW', 'WHT', 'KAK', 'FOO', '3065', 'PS400461N', 'HFK700', 'HFK200',
+	'VS135', '2VS134', 'VS15', 'XXL', 'MED', '',
+]
+
+LONG_FIELDS: list[str] = ['DENIM', 'NEW', 'VS135', 'XXL', '']
+
+COUPONS: list[str] = ['WELCOME-X1Z9Q', 'SAVE10-ABCDE', 'THANKS-2023', 'FREESHIP']
+
+IRREGULAR: list[str] = ['GIFTCARD', 'Gift Card', 'Sticker', 'HAT-BLK', 'HAT-BLK-XL', 'MYSTERY-BOX-XL', '']
+
+
+def _legacy_clean_sku(sku: str) -> str:
+	# Modify VS127 - VS136 for logical sorting
+	vs_map = {
+		"VS127": "VS.127", "VS128": "VS.128", "VS129": "VS.129", "VS130": "VS.130", 
+		"VS131": "VS.131", "VS132": "VS.132", "VS133": "VS.133", "VS134": "VS.134", 
+		"VS135": "VS.135", "VS136": "VS.136", "2VS134": "VS.134"
+	}
+
+	sku_array: list[str] = sku.split('-')
+	brand: str = sku_array[0]
+	brand_and_style: str
+	size: str
+
+	# PREMIER
+	if brand == 'PREM':
+		# PREM-646-MED, PREM-631NEW-LRG, PREM-210P-5XL
+		if len(sku_array) == 3:
+			premiere, style, _size = sku_array
+			# PREM-631NEW-XL
+			if style[-3:] == 'NEW':
+				style = style[:3]
+			brand_and_style = premiere + '-' + style
+			size = _size
+		# PREM-618-RED-MED, PREM-SS-101-LRG
+		elif len(sku_array) == 4:
+			premiere, index_1, index_2, _size = sku_array
+			style = index_1 + '-' + index_2
+			brand_and_style = premiere + '-' + style
+			size = _size
+	
+	# STEX
+	elif brand == 'STEX' or brand == 'STX':
+		stex, color, _size = sku_array
+
+		# STEX<num> to sort in order by location
+		if color == 'WHT':      stex = 'STEX6'
+		elif color == 'BRIT':   stex = 'STEX7'
+		elif color == 'GRN':    stex = 'STEX5'
+		elif color == 'CHAR':   stex = 'STEX4'
+		elif color == 'BLK':    stex = 'STEX2'
+		elif color == 'GREY':   stex = 'STEX3'
+		elif color == 'RED':    stex = 'STEX8'
+		elif color == 'NAVY':   stex = 'STEX1'
+		elif color == 'KAK':    stex = 'STEX9'
+
+		brand_and_style = stex + '-' + color
+		size = _size
+
+	# WICKED SHORTS / WEAR SHORTS
+	elif brand == 'WICK' or brand == 'WEAR':
+		wick_or_wear, color, _size = sku_array
+		brand_and_style = wick_or_wear + '-' + color
+		size = _size
+
+	# VESE / AMDS
+	elif brand == 'VESE' or brand == 'AMDS':
+		# AMDS-RED-01-XL / VESE-GREEN-11-LRG
+		vese_or_amds, color, style, _size = sku_array
+		brand_and_style = vese_or_amds + '-' + style + '-' + color
+		size = _size
+
+	# CASUAL COUNTRY
+	elif brand == 'CAS' or brand == 'CASS':
+		# long sleeve: CAS-PURP-01-LRG / CAS-NAV-3065-MED
+		if len(sku_array) == 4:
+			cas, color, style, _size = sku_array
+			# CAS-NAV-3065-MED
+			if style == '3065':
+				style = 'SOLID-3065'
+			brand_and_style = cas + '-' + style + '-' + color
+			size = _size
+		# short sleeve: CAS-SS-45-WHT-SML
+		elif len(sku_array) == 5:
+			cas, ss, style, color, _size = sku_array
+			brand_and_style = cas + '-' + ss + '-' + style + '-' + color
+			size = _size
+
+	# RODEO / ACE
+	elif brand == 'ROD' or brand == 'RODEO' or brand == 'ACE':
+		# RODEO-524-XL
+		if len(sku_array) == 3:
+			rodeo, style, _size = sku_array
+			brand_and_style = rodeo + '-' + style
+			size = _size
+		# RODEO-BEIG-533-MED, ROD-WOM-506-XL
+		elif len(sku_array) == 4:
+			rodeo, color_or_women, style, _size = sku_array
+			# strip 'PS400' from style number (RODEO-BRWN-PS400461N-MED)
+			if style[:5] == 'PS400':
+				style = style[5:]
+			brand_and_style = rodeo + '-' + style + '-' + color_or_women
+			size = _size
+		# ACE-WOM-BLU-ES5110-SML / ACE-HFK700-10-NVYBLU-3XL
+		elif len(sku_array) == 5:
+			# HFK700 / HFK200
+			if sku_array[1] == 'HFK700' or sku_array[1] == 'HFK200':
+				ace, hfk, style, color, _size = sku_array
+				brand_and_style = ace + '-' + hfk + '-' + style + '-' + color
+				size = _size
+			# WOMENS
+			else:
+				ace, women, color, style, _size = sku_array
+				brand_and_style = ace + '-' + style + '-' + women + '-' + color
+				size = _size
+	
+	# BUCKEROO
+	elif brand == 'BUCK':
+		# BUCK-WS6-BEGE/BRWN-LRG
+		if len(sku_array) == 4:
+			buck, style, color, _size = sku_array
+			brand_and_style = buck + '-' + style + '-' + color
+			size = _size
+		# BUCK-WS100-01-BLACK/BLUE-SML / BUCK-WS200-01-BLACK/BLUE-SML
+		elif len(sku_array) == 5:
+			buck, style, number, color, _size = sku_array
+			brand_and_style = buck + '-' + style + '-' + number + '-' + color
+			size = _size
+
+	# VICT / ENVY / SOCI JEANS
+	elif brand == 'VIC' or brand == 'VICT' or brand == 'ENVY' or brand == 'SOCI':
+		# VICT-701-XL / ENVY-5034-SML
+		if len(sku_array) == 3:
+			vic_or_envy, style, _size = sku_array
+			brand_and_style = vic_or_envy + '-' + style
+			size = _size
+		# VICT-BLACK-01-38x32 / ENVY-WHIT-101-XL / SOCI-BLU-950-32x32
+		elif len(sku_array) == 4:
+			vic_or_envy_or_soci, color, style, _size = sku_array
+			brand_and_style = vic_or_envy_or_soci + '-' + style + '-' + color
+			size = _size
+		# ENVY-LACE-WHT-64025-SML
+		elif len(sku_array) == 5:
+			envy, lace, color, style, _size = sku_array
+			brand_and_style = envy + '-' + style + '-' + lace + '-' + color
+			size = _size
+		# VIC-500-DENIM-JACKET-DARK-INDIGO-XL
+		elif len(sku_array) == 7:
+			vic, style, denim, jacket, color1, color2, _size = sku_array
+			brand_and_style = vic + '-' + style + '-' + denim + '-' + jacket + '-' + color1 + '-' + color2
+			size = _size
+
+	# VASS / BENZ
+	elif brand == 'VASS' or brand == 'BENZ':
+		# VASS-LEOP-VS135-SML
+		vass, color, style, _size = sku_array
+		# change VS127 - VS136 to VS.127 - VS.136 so they show up in alphanumeric order,
+		# they were in between VS03 and VS15
+		if style in vs_map:
+			style = vs_map[style]
+		brand_and_style = vass + '-' + style + '-' + color
+		size = _size
+	
+	# EVERYTHING ELSE (no cleaning necessary)
+	else:
+		return sku
+
+	if size == 'XXL':
+		size = '2XL'
+
+	return brand_and_style + '-' + size
+
+
+# The item SKU as the ingest cleaned it before SkuIndex
+def _legacy_normalize_item(sku: str | None, description: str, revised: dict[str, str]) -> str:
+	# No SKU (NoneType / empty string), or randomly generated SKU
+	if sku is None or sku == '' or sku[:3] == 'wi_':
+		sku = description
+	# Revised SKU
+	elif sku in revised:
+		sku = revised[sku]
+	# Obsolete SKU
+	elif sku[-3:] == '-SL':
+		sku = sku[:-3]
+	elif sku[-4:] == '-SLL':
+		sku = sku[:-4]
+	elif sku[-2:] == '-D':
+		sku = sku[:-2]
+
+	return _legacy_clean_sku(sku)
+
+
+# fn's result, or that it raised: an unrecognized SKU must be rejected by both
+def _outcome(fn: Any, *args: Any) -> tuple[str, str | None]:
+	try:
+		return ('ok', fn(*args))
+	except Exception:
+		return ('error', None)
+
+
+# (path, raw SKU, description) for every path of the cascade
+def _cases(revised: dict[str, str]) -> list[tuple[str, str | None, str]]:
+	current: list[str] = [style + '-' + size for style, sizes in STYLES for size in sizes]
+	cases: list[tuple[str, str | None, str]] = []
+
+	cases += [('revised', sku, 'x') for sku in revised]
+	cases += [('obsolete', sku + suffix, 'x') for sku in current for suffix in OBSOLETE_SUFFIXES]
+	cases += [('obsolete', sku, 'x') for sku in ODD_SKUS if sku and sku.endswith(OBSOLETE_SUFFIXES)]
+	cases += [
+		('no sku', sku, description)
+		for sku in (None, '', 'wi_8f2c61a0') for description in DESCRIPTIONS + current + IRREGULAR
+	]
+	cases += [('coupon', sku, 'x') for sku in COUPONS]
+	cases += [('irregular', sku, 'x') for sku in IRREGULAR if sku]
+	cases += [('brand rules', sku, 'x') for sku in current]
+	cases += [
+		('brand rules', '-'.join((brand,) + fields), 'x')
+		for brand in BRANDS for count in range(0, 7)
+		for fields in itertools.product(FIELDS if count < 5 else LONG_FIELDS, repeat=count)
+	]
+	cases += [
+		('brand rules', sku, 'x')
+		for sku in ('VIC-500-DENIM-JACKET-DARK-INDIGO-XL', 'VIC-500-DENIM-JACKET-DARK-INDIGO-XXL', 'PREM-1-2-3-4-5-6')
+	]
+	return cases
+
+
+def main(argv: list[str] | None = None) -> int:
+	try:
+		from app.sku_map import MAP
+		revised: dict[str, str] = dict(SAMPLE_MAP, **MAP)
+	except ImportError:
+		revised = SAMPLE_MAP
+
+	index = SkuIndex(revised=revised)
+	checked: dict[str, int] = {}
+	mismatches: list[str] = []
+
+	for path, sku, description in _cases(revised):
+		checked[path] = checked.get(path, 0) + 1
+		expected = _outcome(_legacy_normalize_item, sku, description, revised)
+		got = _outcome(index.normalize_item, sku, description)
+		if got != expected:
+			mismatches.append(f'{path}: {sku!r} ({description!r}) cascade {expected} index {got}')
+
+	for path, count in checked.items():
+		print(f'{path:<12} {count:>8} SKUs')
+
+	for mismatch in mismatches[:20]:
+		print(mismatch, file=sys.stderr)
+	print(f'{len(mismatches)} mismatches' if mismatches else 'ok')
+	return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,69 @@
+# Compare the legacy per-row ingest (one cursor, one INSERT and one commit
+# per row) with the bulk path (normalized row tuples written with
+# executemany inside a single transaction).
+#
+# 	python -m bench.ingest [num_orders]
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from typing import Any
+
+import app.db
+from app.db import create_tables, _snapshot_path, _get_snapshot
+from app.logic import _normalize_orders, _parse_store_metadata, _ingest_all_orders
+from bench.generator import generate_store_orders
+
+
+# the ingest as it was before the bulk path: a cursor and a commit per row,
+# on a connection of its own with SQLite's defaults (a rollback journal and
+# synchronous = FULL) as the app's were then, straight to the order tables
+# of the current snapshot (see app.db._attach_snapshot)
+def _legacy_ingest(orders: list[dict[str, Any]], store: str, is_ebay: bool) -> None:
+	order_rows, item_rows = _normalize_orders(orders, store, is_ebay)
+	conn = sqlite3.connect(_snapshot_path(_get_snapshot()))
+	# WAL is kept in the file once set, the snapshot was created with it
+	conn.execute("PRAGMA journal_mode = DELETE")
+	for row in order_rows:
+		cur = conn.cursor()
+		cur.execute("""
+			INSERT INTO Customer_Order (store, order_number, iso_datetime, order_datetime, customer, modify_date)
+			VALUES (?, ?, ?, ?, ?, ?);
+		""", row)
+		conn.commit()
+	for row in item_rows:
+		cur = conn.cursor()
+		cur.execute("""
+			INSERT INTO Item (store, order_number, sku, quantity, style, size, raw_sku, description)
+			VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+		""", row)
+		conn.commit()
+	conn.close()
+
+
+# each run gets a fresh db file, refreshes no longer drop the tables
+def _time(fn, store_orders, db_path: str) -> float:
+	app.db.SQLITE_DATABASE_URI = db_path
+	create_tables()
+	start = time.perf_counter()
+	fn(store_orders)
+	return time.perf_counter() - start
+
+
+def main(num_orders: int = 2000) -> None:
+	store_orders = generate_store_orders(num_orders)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		legacy = _time(lambda so: [_legacy_ingest(o, s, e) for s, o, e in so], store_orders, os.path.join(tmp, 'legacy.db'))
+		per_store_txn = _time(lambda so: [_parse_store_metadata(o, s, e) for s, o, e in so], store_orders, os.path.join(tmp, 'store.db'))
+		bulk = _time(_ingest_all_orders, store_orders, os.path.join(tmp, 'bulk.db'))
+
+	print(f'orders: {sum(len(orders) for _, orders, _ in store_orders)}')
+	print(f'legacy per-row commits:    {legacy:8.3f}s')
+	print(f'one transaction / store:   {per_store_txn:8.3f}s')
+	print(f'one transaction / refresh: {bulk:8.3f}s  ({legacy / bulk:.1f}x)')
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,200 @@
+# Load test the app against the fake order management system (see
+# bench.oms): pickers read /pick-list and the store pages as fast as they
+# can (or with --think seconds between reads) through --workers app
+# processes, first with nothing else going on, then while an /update runs,
+# and the latency of every read is reported by phase and route:
+#
+# 	idle     --duration seconds of reads alone
+# 	update   reads from the moment /update is called until its refresh is done
+#
+# ex)
+# 	phase   route                   requests errors    p50ms    p95ms    p99ms   req/s
+# 	update  /pick-list                   412      0     18.2     61.0     97.4    68.7
+#
+# the db is first filled by one refresh; exits non-zero if a read failed, or
+# if a refresh failed without --error-rate.
+#
+# 	python -m bench.load [--pickers 8] [--workers 2] [--duration 10] [--think 0] [--output results.json]
+# 	[--orders 2000] [--styles 35] [--odd-skus 0.1] [--churn 0.1] [--latency 0.05] [--jitter 0.02] [--error-rate 0]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from typing import Any, Callable
+
+import requests
+
+from bench.oms import _add_arguments, _settings, serve as serve_oms
+from bench.workers import _serve, _free_port, _wait_until
+
+
+# the pages a picker reads: the pick list and every store's orders
+def _routes() -> list[str]:
+	from app.stores import STORES
+	from premier import _store_slug
+
+	return ['/pick-list'] + ['/' + _store_slug(store) for store in STORES]
+
+
+# Start /update on url and return its job once the refresh is over
+def _refresh(url: str, timeout: float = 600) -> dict[str, Any]:
+	requests.get(url + '/update', headers={'Accept': 'application/json'})
+	_wait_until(lambda: requests.get(url + '/update/status').json()['state'] != 'running', timeout=timeout, poll=0.05)
+	return requests.get(url + '/update/status').json()
+
+
+# Readers, each cycling through the routes on its own session and worker,
+# until stop is set; every read is kept as (route, seconds, ok)
+class Pickers:
+	def __init__(self, urls: list[str], routes: list[str], pickers: int, think: float) -> None:
+		self.samples: list[tuple[str, float, bool]] = []
+		self.stop = threading.Event()
+		self._lock = threading.Lock()
+		self._threads = [
+			threading.Thread(target=self._pick, args=(urls[i % len(urls)], routes[i % len(routes):] + routes[:i % len(routes)], think), daemon=True)
+			for i in range(pickers)
+		]
+
+	def _pick(self, url: str, routes: list[str], think: float) -> None:
+		session = requests.Session()
+		samples: list[tuple[str, float, bool]] = []
+
+		while not self.stop.is_set():
+			for route in routes:
+				start = time.perf_counter()
+				try:
+					ok = session.get(url + route).status_code == 200
+				except requests.RequestException:
+					ok = False
+				samples.append((route, time.perf_counter() - start, ok))
+
+				if think:
+					self.stop.wait(think)
+				if self.stop.is_set():
+					break
+
+		with self._lock:
+			self.samples.extend(samples)
+
+	def run(self, until: Callable[[], Any]) -> tuple[list[tuple[str, float, bool]], float]:
+		start = time.perf_counter()
+		for thread in self._threads:
+			thread.start()
+		until()
+		self.stop.set()
+		for thread in self._threads:
+			thread.join()
+		return self.samples, time.perf_counter() - start
+
+
+# A report row per route and one for every route, ex)
+# 	{'phase': 'idle', 'route': '/pick-list', 'requests': 412, 'errors': 0,
+# 	'p50_ms': 18.2, 'p95_ms': 61.0, 'p99_ms': 97.4, 'per_second': 68.7}
+def _summarize(phase: str, routes: list[str], samples: list[tuple[str, float, bool]], seconds: float) -> list[dict[str, Any]]:
+	rows: list[dict[str, Any]] = []
+
+	for route in routes + ['all']:
+		reads = [(elapsed, ok) for read_route, elapsed, ok in samples if route in ('all', read_route)]
+		times = sorted(elapsed for elapsed, _ in reads)
+		cuts = statistics.quantiles(times, n=100, method='inclusive') if len(times) > 1 else times * 99
+		rows.append({
+			'phase': phase,
+			'route': route,
+			'requests': len(reads),
+			'errors': sum(1 for _, ok in reads if not ok),
+			'p50_ms': round(cuts[49] * 1000, 1) if cuts else None,
+			'p95_ms': round(cuts[94] * 1000, 1) if cuts else None,
+			'p99_ms': round(cuts[98] * 1000, 1) if cuts else None,
+			'per_second': round(len(reads) / seconds, 1) if seconds else None,
+		})
+
+	return rows
+
+
+def run(urls: list[str], routes: list[str], pickers: int, duration: float, think: float) -> dict[str, Any]:
+	first = _refresh(urls[0])
+
+	idle_samples, idle_seconds = Pickers(urls, routes, pickers, think).run(lambda: time.sleep(duration))
+
+	refreshes: list[dict[str, Any]] = []
+	update_samples, update_seconds = Pickers(urls, routes, pickers, think).run(lambda: refreshes.append(_refresh(urls[0])))
+
+	return {
+		'first_refresh': first,
+		'refresh': refreshes[0],
+		'phases': {'idle': idle_seconds, 'update': update_seconds},
+		'reads': _summarize('idle', routes, idle_samples, idle_seconds) + _summarize('update', routes, update_samples, update_seconds),
+	}
+
+
+def main(argv: list[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description='Load test the read routes during a refresh, against a fake order management system')
+	parser.add_argument('--pickers', type=int, default=8, help='concurrent readers')
+	parser.add_argument('--workers', type=int, default=2, help='app worker processes')
+	parser.add_argument('--duration', type=float, default=10, help='seconds of reads before the update')
+	parser.add_argument('--think', type=float, default=0, help='seconds a picker waits between reads')
+	parser.add_argument('--output', help='write results as JSON to this file')
+	_add_arguments(parser)
+	args = parser.parse_args(argv)
+
+	context = multiprocessing.get_context('spawn')
+	processes: list[multiprocessing.Process] = []
+
+	with tempfile.TemporaryDirectory() as tmp:
+		oms_port = _free_port()
+		oms_url = f'http://127.0.0.1:{oms_port}'
+		ports = [_free_port() for _ in range(args.workers)]
+		urls = [f'http://127.0.0.1:{port}' for port in ports]
+
+		try:
+			processes.append(context.Process(target=serve_oms, args=(oms_port, _settings(args)), daemon=True))
+			for port in ports:
+				processes.append(context.Process(
+					target=_serve,
+					args=(port, os.path.join(tmp, 'load.db'), oms_url, os.path.join(tmp, 'fetch-cache')),
+					daemon=True
+				))
+			for process in processes:
+				process.start()
+
+			for url in [oms_url] + urls:
+				path = '/stats' if url == oms_url else '/update/status'
+				if not _wait_until(lambda: requests.get(url + path).ok):
+					print(f'{url} did not start', file=sys.stderr)
+					return 1
+
+			result = run(urls, _routes(), args.pickers, args.duration, args.think)
+			result['oms'] = requests.get(oms_url + '/stats').json()
+		finally:
+			for process in processes:
+				if process.is_alive():
+					process.terminate()
+					process.join()
+
+	result['settings'] = vars(args)
+
+	refresh = result['refresh']
+	print(f"refresh: {refresh['state']} in {refresh['seconds']}s {refresh.get('stage_seconds', '')}", file=sys.stderr)
+	print(f"{'phase':<7} {'route':<24} {'requests':>8} {'errors':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'req/s':>7}")
+	for row in result['reads']:
+		print(
+			f"{row['phase']:<7} {row['route']:<24} {row['requests']:>8} {row['errors']:>6} "
+			f"{row['p50_ms'] or '-':>8} {row['p95_ms'] or '-':>8} {row['p99_ms'] or '-':>8} {row['per_second'] or '-':>7}"
+		)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(result, f, indent=2)
+
+	failed_reads = any(row['errors'] for row in result['reads'])
+	failed_refresh = not args.error_rate and 'failed' in (result['first_refresh']['state'], refresh['state'])
+	return 1 if failed_reads or failed_refresh else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
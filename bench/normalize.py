@@ -0,0 +1,84 @@
+# Normalization on worker processes (NORMALIZE_PROCESSES, see
+# app.logic._normalize_on_pool) against the pipeline's single-process
+# normalize, for one feed of each size: each process count's time covers
+# starting the processes, so the sizes where it loses show where
+# NORMALIZE_PROCESS_MIN_ORDERS belongs. Orders are synthetic (see
+# bench.generator); the speedup is bounded by the cores this runs on.
+#
+# 	python -m bench.normalize [--orders 1000 5000 20000 50000] [--processes 1 2 4] [--repeat 3]
+import os
+import sys
+import time
+import argparse
+import statistics
+from typing import Any, Callable
+
+import app.logic
+from app.logic import AMAZON, _normalize_batches, _normalize_pool
+from bench.generator import generate_orders
+
+
+def _median(fn: Callable[[], None], repeat: int) -> float:
+	runs: list[float] = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		runs.append(time.perf_counter() - start)
+	return statistics.median(runs)
+
+
+def _single(orders: list[dict[str, Any]]) -> None:
+	for _ in _normalize_batches(AMAZON, [(orders, False)]):
+		pass
+
+
+def _on_processes(orders: list[dict[str, Any]]) -> None:
+	pool = _normalize_pool()
+	try:
+		for _ in _normalize_batches(AMAZON, [(orders, False)], pool):
+			pass
+	finally:
+		pool.shutdown()
+
+
+def main(argv: list[str] | None = None) -> int:
+	cores: int = os.cpu_count() or 1
+	parser = argparse.ArgumentParser(description='Compare normalizing orders on one process and on several')
+	parser.add_argument('--orders', type=int, nargs='+', default=[1000, 5000, 20000, 50000], help='orders in the feed')
+	parser.add_argument('--processes', type=int, nargs='+',
+		default=sorted({n for n in (1, 2, 4, 8) if n < cores} | {cores}), help='worker processes')
+	parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the median is reported')
+	args = parser.parse_args(argv)
+
+	# every feed goes to the processes, to see where they stop paying off
+	app.logic.NORMALIZE_PROCESS_MIN_ORDERS = 0
+
+	print(f'cores: {cores}')
+	print(f"{'orders':>8} {'single':>9} " + ' '.join(f'{f"{n} proc":>16}' for n in args.processes))
+
+	threshold: int | None = None
+	for num_orders in args.orders:
+		orders = generate_orders(num_orders)
+		single = _median(lambda: _single(orders), args.repeat)
+
+		cells: list[str] = []
+		wins: bool = False
+		for processes in args.processes:
+			app.logic.NORMALIZE_PROCESSES = processes
+			seconds = _median(lambda: _on_processes(orders), args.repeat)
+			cells.append(f'{seconds:7.3f}s {single / seconds:5.2f}x')
+			wins = wins or seconds < single
+
+		if wins and threshold is None:
+			threshold = num_orders
+		print(f'{num_orders:>8} {single:8.3f}s ' + ' '.join(f'{cell:>16}' for cell in cells))
+
+	if threshold is None:
+		print('processes never beat a single process here, keep NORMALIZE_PROCESSES = 0')
+	else:
+		print(f'processes first pay off at {threshold} orders, see NORMALIZE_PROCESS_MIN_ORDERS')
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
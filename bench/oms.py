@@ -0,0 +1,326 @@
+# A local stand-in for the order management system behind app.secrets, to
+# load test /update and the read routes without the real one:
+#
+# 	POST /refresh/<store>   {"success": "true"}, as the refresh endpoints
+# 	GET /orders/<i>         ORDER_ENDPOINTS[i]'s feed, {"orders": [...]} of
+# 	                        synthetic orders (see bench.generator), gzipped
+# 	                        if asked, with an ETag and modifyDateStart
+# 	GET /stats              requests served and errors injected so far
+#
+# every call waits --latency seconds (give or take --jitter) and fails with
+# a 500 at --error-rate. Each refresh after orders were read moves every
+# feed on: --churn of its orders ship and as many new ones come in, so a
+# refresh has work to do. _use_fake_oms points the app's endpoints at it;
+# run on its own, --secrets prints an app/secrets.py that does the same.
+#
+# 	python -m bench.oms [--port 5999] [--orders 2000] [--styles 35] [--odd-skus 0.1]
+# 	[--churn 0.1] [--latency 0.05] [--jitter 0.02] [--error-rate 0] [--secrets]
+import sys
+import gzip
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from typing import Any
+
+from bench.generator import ENDPOINT_WEIGHTS, STYLES, generate_orders
+
+
+# the refresh endpoints of app.secrets, in the order app.logic._refresh_stores posts to them
+REFRESH_ENDPOINTS: tuple[str, ...] = (
+	'AMZ_USA_REFRESH_ENDPOINT',
+	'AMZ_CAN_REFRESH_ENDPOINT',
+	'EBAY_REFRESH_ENDPOINT',
+	'PREM_SHIRTS_REFRESH_ENDPOINT',
+	'NSOTD_REFRESH_ENDPOINT',
+	'BUCK_REFRESH_ENDPOINT',
+)
+
+# the order endpoints of app.secrets, in ORDER_ENDPOINTS order
+ORDER_ENDPOINT_NAMES: tuple[str, ...] = (
+	'AMZ_USA_AWAIT_ENDPOINT',
+	'AMZ_USA_PEND_ENDPOINT',
+	'AMZ_CAN_AWAIT_ENDPOINT',
+	'AMZ_CAN_PEND_ENDPOINT',
+	'EBAY_ENDPOINT',
+	'PREM_SHIRTS_ENDPOINT',
+	'NSOTD_ENDPOINT',
+	'BUCK_ENDPOINT',
+)
+
+
+# The fake's settings and state, shared by its request threads
+class FakeOMS:
+	def __init__(
+		self,
+		orders: int = 2000,
+		styles: int | None = None,
+		odd_share: float = 0.1,
+		churn: float = 0.1,
+		latency: float = 0.05,
+		jitter: float = 0.02,
+		error_rate: float = 0.0,
+		seed: int = 0
+	) -> None:
+		self.styles = styles
+		self.odd_share = odd_share
+		self.latency = latency
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.seed = seed
+
+		total = sum(ENDPOINT_WEIGHTS)
+		self.sizes: list[int] = [max(1, orders * weight // total) for weight in ENDPOINT_WEIGHTS]
+		self.shipped: list[int] = [round(size * churn) for size in self.sizes]
+
+		# feeds move on at the first refresh after a feed was read
+		self.version: int = 0
+		self.read_since_refresh: bool = False
+
+		self.counts: dict[str, int] = {'refresh': 0, 'orders': 0, 'not_modified': 0, 'errors': 0, 'orders_served': 0}
+		self._bodies: dict[tuple[int, int], tuple[bytes, str]] = {}
+		self._chunks: dict[tuple[int, int], list[dict[str, Any]]] = {}
+		self._lock = threading.Lock()
+		self._rng = random.Random(seed)
+
+	def count(self, name: str, n: int = 1) -> None:
+		with self._lock:
+			self.counts[name] += n
+
+	def wait(self) -> None:
+		with self._lock:
+			delay = self.latency + self._rng.uniform(-self.jitter, self.jitter)
+		time.sleep(max(0.0, delay))
+
+	def fails(self) -> bool:
+		with self._lock:
+			return self._rng.random() < self.error_rate
+
+	def refresh(self) -> None:
+		with self._lock:
+			if self.read_since_refresh:
+				self.version += 1
+				self.read_since_refresh = False
+			self.counts['refresh'] += 1
+
+	# Feed i's orders at a version: a window over a stream of orders, sizes[i]
+	# long, that moves on by shipped[i] orders per version; the stream is
+	# generated a window's worth (a chunk) at a time, so an order keeps its
+	# number and content from one version to the next
+	def feed_orders(self, i: int, version: int) -> list[dict[str, Any]]:
+		size = self.sizes[i]
+		start = version * self.shipped[i]
+		orders: list[dict[str, Any]] = []
+
+		for chunk in range(start // size, (start + size - 1) // size + 1):
+			with self._lock:
+				cached = self._chunks.get((i, chunk))
+			if cached is None:
+				cached = generate_orders(
+					size,
+					seed=self.seed + i * 1000003 + chunk,
+					start_number=(i + 1) * 10000000 + chunk * size,
+					styles=self.styles,
+					odd_share=self.odd_share
+				)
+				with self._lock:
+					# the window never reaches back past the chunk before this one
+					for key in [key for key in self._chunks if key[0] == i and key[1] < chunk - 1]:
+						del self._chunks[key]
+					self._chunks[(i, chunk)] = cached
+			orders.extend(cached)
+
+		offset = start % size
+		return orders[offset:offset + size]
+
+	# Feed i's current body, gzipped, and its ETag; orders modified before
+	# since are left out
+	def feed_body(self, i: int, since: str | None) -> tuple[bytes, str, int]:
+		with self._lock:
+			version = self.version
+			self.read_since_refresh = True
+			cached = self._bodies.get((i, version)) if since is None else None
+		if cached is not None:
+			body, etag = cached
+			return body, etag, self.sizes[i]
+
+		orders = self.feed_orders(i, version)
+		if since is not None:
+			orders = [order for order in orders if order['modifyDate'] >= since]
+
+		body = gzip.compress(json.dumps({'orders': orders}).encode(), compresslevel=1)
+		etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+		if since is None:
+			with self._lock:
+				self._bodies = {key: value for key, value in self._bodies.items() if key[1] >= version}
+				self._bodies[(i, version)] = (body, etag)
+		return body, etag, len(orders)
+
+
+class FakeOMSHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	server: 'FakeOMSServer'
+
+	def _send(self, status: int, body: bytes, headers: dict[str, str] | None = None) -> None:
+		self.send_response(status)
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _send_json(self, status: int, obj: Any) -> None:
+		self._send(status, json.dumps(obj).encode(), {'Content-Type': 'application/json'})
+
+	# the injected latency and errors; True if the call was failed
+	def _failed(self) -> bool:
+		oms = self.server.oms
+		oms.wait()
+		if oms.fails():
+			oms.count('errors')
+			self._send_json(500, {'error': 'injected failure'})
+			return True
+		return False
+
+	def do_POST(self) -> None:
+		self.rfile.read(int(self.headers.get('Content-Length') or 0))
+		if not urlsplit(self.path).path.startswith('/refresh/'):
+			self._send_json(404, {'error': 'not found'})
+			return
+		if self._failed():
+			return
+
+		self.server.oms.refresh()
+		self._send_json(200, {'success': 'true'})
+
+	def do_GET(self) -> None:
+		oms = self.server.oms
+		url = urlsplit(self.path)
+
+		if url.path == '/stats':
+			with oms._lock:
+				stats = dict(oms.counts, version=oms.version)
+			self._send_json(200, stats)
+			return
+
+		parts = url.path.strip('/').split('/')
+		if len(parts) != 2 or parts[0] != 'orders' or not parts[1].isdigit() or int(parts[1]) >= len(oms.sizes):
+			self._send_json(404, {'error': 'not found'})
+			return
+		if self._failed():
+			return
+
+		since: str | None = parse_qs(url.query).get('modifyDateStart', [None])[0]
+		body, etag, num_orders = oms.feed_body(int(parts[1]), since)
+
+		if self.headers.get('If-None-Match') == etag:
+			oms.count('not_modified')
+			self._send(304, b'', {'ETag': etag})
+			return
+
+		oms.count('orders')
+		oms.count('orders_served', num_orders)
+		headers = {'Content-Type': 'application/json', 'ETag': etag}
+		if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+			headers['Content-Encoding'] = 'gzip'
+		else:
+			body = gzip.decompress(body)
+		self._send(200, body, headers)
+
+	def log_message(self, format: str, *args: Any) -> None:
+		pass
+
+
+class FakeOMSServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address: tuple[str, int], oms: FakeOMS) -> None:
+		super().__init__(address, FakeOMSHandler)
+		self.oms = oms
+
+
+# the endpoint URLs of the fake at url, by app.secrets name
+def _endpoints(url: str) -> dict[str, str]:
+	endpoints: dict[str, str] = {
+		name: f"{url}/refresh/{name.removesuffix('_REFRESH_ENDPOINT').lower().replace('_', '-')}"
+		for name in REFRESH_ENDPOINTS
+	}
+	endpoints.update({name: f'{url}/orders/{i}' for i, name in enumerate(ORDER_ENDPOINT_NAMES)})
+	return endpoints
+
+
+# Point this process's refresh at the fake at url, as bench.replay._use_replay
+# does for recordings
+def _use_fake_oms(url: str) -> None:
+	import app.fetch
+	import app.logic
+
+	endpoints = _endpoints(url)
+	for name in REFRESH_ENDPOINTS:
+		setattr(app.logic, name, endpoints[name])
+	# in place, the pipeline and the worker hold the same list
+	app.logic.ORDER_ENDPOINTS[:] = [
+		(store, endpoints[name], is_ebay) for name, (store, _, is_ebay) in zip(ORDER_ENDPOINT_NAMES, app.logic.ORDER_ENDPOINTS)
+	]
+	app.fetch.FETCH_MODE = 'live'
+	app.fetch._session = None
+
+
+# Run a fake with settings (FakeOMS's arguments) on port until the
+# process is stopped, ex: as a multiprocessing target
+def serve(port: int, settings: dict[str, Any]) -> None:
+	FakeOMSServer(('127.0.0.1', port), FakeOMS(**settings)).serve_forever()
+
+
+def _add_arguments(parser: argparse.ArgumentParser) -> None:
+	parser.add_argument('--orders', type=int, default=2000, help='open orders across every feed')
+	parser.add_argument('--styles', type=int, default=None, help=f'styles the SKUs are drawn from, up to {len(STYLES)}')
+	parser.add_argument('--odd-skus', type=float, default=0.1, help='share of items with odd SKUs, ex: coupons, missing SKUs')
+	parser.add_argument('--churn', type=float, default=0.1, help='share of each feed replaced per refresh')
+	parser.add_argument('--latency', type=float, default=0.05, help='seconds per call')
+	parser.add_argument('--jitter', type=float, default=0.02, help='seconds the latency varies by, either way')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls failed with a 500')
+	parser.add_argument('--seed', type=int, default=0)
+
+
+# FakeOMS's arguments from the command line's
+def _settings(args: argparse.Namespace) -> dict[str, Any]:
+	return {
+		'orders': args.orders,
+		'styles': args.styles,
+		'odd_share': args.odd_skus,
+		'churn': args.churn,
+		'latency': args.latency,
+		'jitter': args.jitter,
+		'error_rate': args.error_rate,
+		'seed': args.seed,
+	}
+
+
+def main(argv: list[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description='Serve a fake order management system')
+	parser.add_argument('--port', type=int, default=5999)
+	parser.add_argument('--secrets', action='store_true', help='print an app/secrets.py pointing at this server')
+	_add_arguments(parser)
+	args = parser.parse_args(argv)
+
+	url = f'http://127.0.0.1:{args.port}'
+	if args.secrets:
+		print("AUTH = ('user', 'password')")
+		for name, endpoint in _endpoints(url).items():
+			print(f'{name} = {endpoint!r}')
+
+	print(f'serving on {url}', file=sys.stderr)
+	try:
+		serve(args.port, _settings(args))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,69 @@
+# Assert the hot queries are served by their indexes (EXPLAIN QUERY PLAN)
+# rather than full table scans, over a db of synthetic orders; exits
+# non-zero if any plan regressed.
+#
+# 	python -m bench.plans [num_orders]
+import os
+import sys
+import tempfile
+
+import app.db
+from app.db import create_tables, _connect_db, _close_db, _close_pool
+from app.logic import _ingest_all_orders
+from bench.generator import generate_store_orders
+
+
+STORE_ORDERS = """
+	SELECT order_number
+	FROM Customer_Order
+	WHERE store = ?
+"""
+
+# query, parameters, index names every one of which the plan must use
+PLANS: list[tuple[str, str, tuple, list[str]]] = [
+	('metadata page', app.db.METADATA_PAGE_QUERY, ('Amazon', '~', 2 ** 63 - 1, 101), ['store_iso_dt_idx', 'item_order_idx']),
+	('pick list', app.db.PICK_LIST_QUERY, (), ['pick_list_idx']),
+	('store orders', STORE_ORDERS, ('Amazon',), ['order_key_idx']),
+	('item delete', app.db.DELETE_ITEMS, ('Amazon', '1'), ['item_order_idx']),
+	('search', app.db.SEARCH_QUERY, ('"PREM-6"*', None, None, 200), ['VIRTUAL TABLE INDEX', 'order_key_idx']),
+	('history', app.db.HISTORY_QUERY.format(day='day'), ('2023-11-01', '2023-11-30', 'PREM-646', 'PREM-646', None, None, None, None), ['PRIMARY KEY (day>? AND day<?)']),
+]
+
+
+def check(conn) -> list[str]:
+	failures: list[str] = []
+
+	for name, query, params, indexes in PLANS:
+		plan: list[str] = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+		text = '\n'.join(plan)
+		missing = [index for index in indexes if index not in text]
+		# scanning a CTE or window subquery reads rows already produced by an index
+		scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step and 'Page' not in step and 'subquery' not in step]
+
+		if missing or scans:
+			failures.append(f'{name}: missing {missing}, full scans {scans}\n{text}')
+		print(f"{name:<16} {'ok' if not (missing or scans) else 'FAILED'}")
+
+	return failures
+
+
+def main(num_orders: int = 2000) -> int:
+	with tempfile.TemporaryDirectory() as tmp:
+		_close_pool()
+		app.db.SQLITE_DATABASE_URI = os.path.join(tmp, 'plans.db')
+		create_tables()
+		_ingest_all_orders(generate_store_orders(num_orders))
+
+		conn = _connect_db()
+		conn.execute('ANALYZE')
+		failures = check(conn)
+		_close_db(conn)
+		_close_pool()
+
+	for failure in failures:
+		print(failure, file=sys.stderr)
+	return 1 if failures else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,73 @@
+# Re-run recorded refreshes (FETCH_MODE = 'record', see app.replay) through
+# the background refresh worker against a scratch db, and report each run's
+# stage and per-store timings as JSON; every run serves the next recorded
+# responses, so a recorded day is replayed in order.
+#
+# 	python -m bench.replay recordings [--runs 3] [--latency recorded] [--output results.json]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Any
+
+import app.fetch
+from app.worker import start_refresh
+from bench.suite import _use_db
+
+
+def _use_replay(directory: str, latency: float | str | None) -> None:
+	app.fetch.FETCH_MODE = 'replay'
+	app.fetch.FETCH_RECORD_DIR = directory
+	app.fetch.FETCH_REPLAY_LATENCY = latency
+	app.fetch._session = None
+
+
+def _wait(poll: float = 0.05) -> dict[str, Any]:
+	job = start_refresh()
+	while job.state == 'running':
+		time.sleep(poll)
+	return job.as_json()
+
+
+def main(argv: list[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description='Replay recorded order management system responses')
+	parser.add_argument('directory', help='recordings directory, FETCH_RECORD_DIR')
+	parser.add_argument('--runs', type=int, default=1, help='refreshes to run')
+	parser.add_argument('--latency', default=None,
+		help="seconds to wait per call, or 'recorded' for the original response times")
+	parser.add_argument('--output', help='write results as JSON to this file')
+	args = parser.parse_args(argv)
+
+	latency: float | str | None = args.latency
+	if latency not in (None, 'recorded'):
+		latency = float(latency)
+
+	if not os.path.isdir(args.directory):
+		parser.error(f'no such directory: {args.directory}')
+
+	_use_replay(args.directory, latency)
+	runs: list[dict[str, Any]] = []
+
+	with tempfile.TemporaryDirectory() as tmp:
+		_use_db(os.path.join(tmp, 'replay.db'))
+		app.fetch.FETCH_CACHE_DIR = os.path.join(tmp, 'fetch-cache')
+
+		for i in range(args.runs):
+			result = _wait()
+			runs.append(result)
+			print(f"run {i + 1}: {result['state']} in {result['seconds']:.3f}s {result['stage_seconds']}", file=sys.stderr)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(runs, f, indent=2)
+	else:
+		json.dump(runs, sys.stdout, indent=2)
+		print()
+
+	return 0 if all(run['state'] == 'done' for run in runs) else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
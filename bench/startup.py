@@ -0,0 +1,109 @@
+# How long premier.py's subcommands take to start and what they import,
+# each run in a fresh interpreter against a db of synthetic orders (see
+# bench.generator): the time over a bare interpreter's is the command's
+# own, imports plus the query. The reading commands must not import the
+# web app, the HTTP client or the order endpoints (see premier.py); exits
+# non-zero if one does or takes longer than the budget.
+#
+# 	python -m bench.startup [--orders 1000] [--repeat 5] [--budget 100]
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+# premier.py with the db pointed at the benchmark's, as the bench scripts do
+RUN = 'import sys, app.db; app.db.SQLITE_DATABASE_URI = sys.argv[1]; import premier; sys.exit(premier.main(sys.argv[2:]))'
+
+COMMANDS: list[list[str]] = [
+	['pick-list'],
+	['pick-list', '--format', 'csv'],
+	['pick-list', '--format', 'json'],
+	['metadata', 'amazon'],
+	['metadata', 'amazon', '--format', 'json'],
+]
+
+# modules a reading command has no use for
+FORBIDDEN: tuple[str, ...] = (
+	'flask',
+	'werkzeug',
+	'flask_wtf',
+	'requests',
+	'app.web',
+	'app.api',
+	'app.logic',
+	'app.fetch',
+	'app.secrets',
+	'app.sku_map',
+)
+
+
+def _run(args: list[str]) -> subprocess.CompletedProcess:
+	return subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def _median_seconds(args: list[str], repeat: int) -> float:
+	runs: list[float] = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = _run(args)
+		runs.append(time.perf_counter() - start)
+		if result.returncode != 0:
+			raise RuntimeError(f'{args}: {result.stderr}')
+	return statistics.median(runs)
+
+
+# Modules imported by a run, from -X importtime's lines, ex)
+# 	import time:       312 |       1204 |   app.db
+def _imports(args: list[str]) -> set[str]:
+	result = _run(['-X', 'importtime', *args])
+	return {
+		line.rsplit('|', 1)[1].strip()
+		for line in result.stderr.splitlines() if line.startswith('import time:') and line.count('|') == 2
+	}
+
+
+def main(argv: list[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description="Time premier.py's subcommands and check what they import")
+	parser.add_argument('--orders', type=int, default=1000, help='orders in the db')
+	parser.add_argument('--repeat', type=int, default=5, help='runs per command, the median is reported')
+	parser.add_argument('--budget', type=float, default=100, help='milliseconds a command may take over a bare interpreter')
+	args = parser.parse_args(argv)
+
+	from bench.suite import _use_db
+	from bench.generator import generate_store_orders
+	from app.logic import _ingest_all_orders
+
+	failures: list[str] = []
+
+	with tempfile.TemporaryDirectory() as tmp:
+		db_path = os.path.join(tmp, 'startup.db')
+		_use_db(db_path)
+		_ingest_all_orders(generate_store_orders(args.orders))
+
+		bare = _median_seconds(['-c', 'pass'], args.repeat)
+		print(f'bare interpreter {bare * 1000:8.1f}ms')
+		print(f"{'command':<32} {'total':>9} {'own':>9} {'modules':>8}")
+
+		for command in COMMANDS:
+			run = ['-c', RUN, db_path, *command]
+			seconds = _median_seconds(run, args.repeat)
+			modules = _imports(run)
+			own = (seconds - bare) * 1000
+			print(f"{' '.join(command):<32} {seconds * 1000:7.1f}ms {own:7.1f}ms {len(modules):>8}")
+
+			imported = sorted(name for name in modules if name.split('.')[0] in FORBIDDEN or name in FORBIDDEN)
+			if imported:
+				failures.append(f"{' '.join(command)} imports {', '.join(imported)}")
+			if own > args.budget:
+				failures.append(f"{' '.join(command)} takes {own:.1f}ms, over the {args.budget:g}ms budget")
+
+	for failure in failures:
+		print(failure, file=sys.stderr)
+	return 1 if failures else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,201 @@
+# End-to-end benchmarks over synthetic orders (see bench.generator): SKU
+# cleaning, ingest, the pick list, store metadata, and the routes through
+# the Flask test client, both rendered and from the response cache. Results
+# are written as JSON so runs of different versions can be compared.
+#
+# 	python -m bench.suite [--orders 200 1000 10000] [--repeat 5] [--output results.json]
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import datetime
+from typing import Any, Callable
+
+import app.db
+from app import app as flask_app
+from app.cache import bump_generation
+from app.db import create_tables, _connect_db, _close_db, _close_pool, _get_metadata
+from app.sku import get_index, normalize_item, revise
+from app.logic import AMAZON, _clean_sku, _parse_store_metadata, _ingest_all_orders, _iter_orders
+from app.picklist import _create_pick_list
+from bench.generator import generate_store_orders
+
+
+ROUTES: list[str] = [
+	'/pick-list',
+	'/api/pick-list',
+	'/amazon',
+	'/ebay',
+	'/premier-shirts',
+	'/new-shirt-of-the-day',
+	'/buckeroo',
+	'/search?q=PREM-6*',
+	'/api/history?start=2023-11-01&end=2023-11-30',
+]
+
+
+# Time fn repeat times, running setup (untimed) before each run; returns
+# a result row with every run's seconds and their summary
+def _measure(
+	name: str,
+	num_orders: int,
+	fn: Callable[[], Any],
+	repeat: int,
+	setup: Callable[[], Any] | None = None
+) -> dict[str, Any]:
+	runs: list[float] = []
+
+	for _ in range(repeat):
+		if setup is not None:
+			setup()
+		start = time.perf_counter()
+		fn()
+		runs.append(time.perf_counter() - start)
+
+	result = {
+		'name': name,
+		'orders': num_orders,
+		'repeat': repeat,
+		'min': min(runs),
+		'median': statistics.median(runs),
+		'mean': statistics.fmean(runs),
+		'runs': runs,
+	}
+	print(f"{name:<40} {num_orders:>7} orders  median {result['median'] * 1000:10.2f} ms  min {result['min'] * 1000:10.2f} ms", file=sys.stderr)
+	return result
+
+
+def _git_revision() -> str | None:
+	try:
+		out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+		return out.stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def _use_db(path: str) -> None:
+	_close_pool()
+	# the db and its snapshots of the order data, see app.db._snapshot_path
+	for stale in [path, path + '-wal', path + '-shm'] + glob.glob(glob.escape(path) + '.orders-*'):
+		if os.path.exists(stale):
+			os.remove(stale)
+	app.db.SQLITE_DATABASE_URI = path
+	create_tables()
+
+
+def run(sizes: list[int], repeat: int, tmp: str) -> list[dict[str, Any]]:
+	results: list[dict[str, Any]] = []
+	db_path = os.path.join(tmp, 'bench.db')
+	client = flask_app.test_client()
+
+	for num_orders in sizes:
+		store_orders = generate_store_orders(num_orders)
+		raw_items: list[tuple[str | None, str]] = [
+			(item['sku'], item['name']) for _, orders, _ in store_orders for order in orders for item in order['items']
+		]
+		# what _clean_sku is given: revised, with obsolete suffixes stripped
+		skus: list[str] = [
+			revise(sku) if sku and sku[:3] != 'wi_' else description for sku, description in raw_items
+		]
+
+		def clear_caches() -> None:
+			get_index().clean_sku.cache_clear()
+			get_index().normalize.cache_clear()
+
+		def clean_all() -> None:
+			for sku in skus:
+				_clean_sku(sku)
+
+		def normalize_all() -> None:
+			for sku, description in raw_items:
+				normalize_item(sku, description)
+
+		# every order as one feed body, as app.fetch._fetch_feed stores it
+		feed_path = os.path.join(tmp, 'feed.json.gz')
+		with gzip.open(feed_path, 'wt', encoding='utf-8', compresslevel=1) as f:
+			json.dump({'orders': [order for _, orders, _ in store_orders for order in orders]}, f)
+
+		def decode_feed() -> None:
+			with gzip.open(feed_path, 'rb') as f:
+				json.loads(f.read())
+
+		def stream_feed() -> None:
+			for _ in _iter_orders(feed_path):
+				pass
+
+		def parse_per_store() -> None:
+			for store, orders, is_ebay in store_orders:
+				_parse_store_metadata(orders, store, is_ebay=is_ebay)
+
+		results.append(_measure('_clean_sku (cold cache)', num_orders, clean_all, repeat, setup=clear_caches))
+		results.append(_measure('_clean_sku (warm cache)', num_orders, clean_all, repeat))
+		results.append(_measure('normalize_item (cold cache)', num_orders, normalize_all, repeat, setup=clear_caches))
+		results.append(_measure('decode feed (json.loads)', num_orders, decode_feed, repeat))
+		results.append(_measure('decode feed (_iter_orders)', num_orders, stream_feed, repeat))
+		results.append(_measure(
+			'_parse_store_metadata', num_orders, parse_per_store, repeat, setup=lambda: _use_db(db_path)
+		))
+		results.append(_measure(
+			'_ingest_all_orders', num_orders, lambda: _ingest_all_orders(store_orders), repeat, setup=lambda: _use_db(db_path)
+		))
+
+		# everything below reads the ingested orders
+		conn = _connect_db()
+		query = """
+			SELECT sku, SUM(quantity)
+			FROM Item
+			GROUP BY sku
+		"""
+		items: list[tuple[str, int]] = conn.execute(query).fetchall()
+		_close_db(conn)
+
+		results.append(_measure('_create_pick_list', num_orders, lambda: _create_pick_list(items), repeat))
+		results.append(_measure('_get_metadata', num_orders, lambda: _get_metadata(AMAZON), repeat))
+		results.append(_measure('_get_metadata (page of 1000)', num_orders, lambda: _get_metadata(AMAZON, limit=1000), repeat))
+
+		for route in ROUTES:
+			def get(route: str = route) -> None:
+				resp = client.get(route)
+				assert resp.status_code == 200, f'{route}: {resp.status_code}'
+			results.append(_measure('GET ' + route + ' (rendered)', num_orders, get, repeat, setup=bump_generation))
+			results.append(_measure('GET ' + route + ' (cached)', num_orders, get, repeat))
+
+	return results
+
+
+def main(argv: list[str] | None = None) -> None:
+	parser = argparse.ArgumentParser(description='Premier pick list benchmarks')
+	parser.add_argument('--orders', type=int, nargs='+', default=[200, 1000, 10000],
+		help='order counts to benchmark, from 200 (a normal day) to 100000')
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--output', help='write results as JSON to this file')
+	args = parser.parse_args(argv)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		results = run(args.orders, args.repeat, tmp)
+
+	report = {
+		'created': datetime.datetime.now().isoformat(timespec='seconds'),
+		'revision': _git_revision(),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'results': results,
+	}
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=2)
+	else:
+		json.dump(report, sys.stdout, indent=2)
+		print()
+
+
+if __name__ == '__main__':
+	main()
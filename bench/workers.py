@@ -0,0 +1,185 @@
+# Run the app as several worker processes on one db, the way gunicorn
+# does, and check the state they share (see app.db Shared_State and
+# Refresh_Job) holds up when requests land on any of them at once:
+#
+# 	one refresh     concurrent /update calls on every worker start one refresh
+# 	status          every worker reports that refresh, and its last update
+# 	generation      a change made through one worker makes every worker's
+# 	                cached pages stale
+# 	notes           notes edited at once through different workers each get
+# 	                their own text
+# 	lock released   the next /update starts a new refresh
+#
+# the workers refresh from a fake order management system (see bench.oms)
+# started alongside them; exits non-zero if any check failed.
+#
+# 	python -m bench.workers [--workers 4] [--threads 16] [--orders 2000] [--latency 0.05]
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import requests
+
+from bench.oms import _add_arguments, _settings, serve as serve_oms
+
+# An app worker process on port, refreshing from the fake at oms_url
+def _serve(port: int, db_path: str, oms_url: str, cache_dir: str) -> None:
+	import logging
+	from werkzeug.serving import make_server
+
+	import app.db
+	import app.fetch
+	from app.web import init_app
+	from bench.oms import _use_fake_oms
+
+	app.db.SQLITE_DATABASE_URI = db_path
+	app.fetch.FETCH_CACHE_DIR = cache_dir
+	_use_fake_oms(oms_url)
+	flask_app = init_app()
+	flask_app.config['WTF_CSRF_ENABLED'] = False
+	logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+	make_server('127.0.0.1', port, flask_app, threaded=True).serve_forever()
+
+
+def _free_port() -> int:
+	with socket.socket() as s:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+
+
+def _wait_until(check: Callable[[], bool], timeout: float = 60, poll: float = 0.1) -> bool:
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		try:
+			if check():
+				return True
+		except requests.ConnectionError:
+			pass
+		time.sleep(poll)
+	return False
+
+
+def _update(url: str) -> dict[str, Any]:
+	return requests.get(url + '/update', headers={'Accept': 'application/json'}).json()
+
+
+def _status(url: str) -> dict[str, Any]:
+	return requests.get(url + '/update/status').json()
+
+
+def _etag(url: str) -> str | None:
+	return requests.get(url + '/api/pick-list').headers.get('ETag')
+
+
+def run(urls: list[str], threads: int) -> list[str]:
+	failures: list[str] = []
+	pool = ThreadPoolExecutor(threads)
+
+	def check(name: str, ok: bool, detail: Any = '') -> None:
+		print(f"{name:<16} {'ok' if ok else 'FAILED'}")
+		if not ok:
+			failures.append(f'{name}: {detail}')
+
+	def on_every_worker(fn: Callable[[str], Any], times: int = 1) -> list[Any]:
+		return list(pool.map(fn, [urls[i % len(urls)] for i in range(len(urls) * times)]))
+
+	# one refresh
+	jobs = on_every_worker(_update, times=threads // len(urls) or 1)
+	ids = {job['id'] for job in jobs}
+	check('one refresh', len(ids) == 1, ids)
+	job_id = jobs[0]['id']
+
+	# status
+	done = _wait_until(lambda: all(
+		status['id'] == job_id and status['state'] == 'done' for status in on_every_worker(_status)
+	))
+	homes = on_every_worker(lambda url: requests.get(url + '/').text)
+	check('status', done and all('Stores last updated on' in home for home in homes), on_every_worker(_status))
+
+	# generation
+	before = set(on_every_worker(_etag))
+	requests.post(urls[0] + '/sku-remap', data={'kind': 'stex', 'sku': 'WHT', 'remap': 'STEX0'})
+	after = set(on_every_worker(_etag))
+	requests.post(urls[0] + '/sku-remap', data={'kind': 'stex', 'sku': 'WHT', 'remap': 'STEX6'})
+	restored = set(on_every_worker(_etag))
+	check('generation', len(before) == 1 and len(after) == 1 and after != before and restored == before,
+		(before, after, restored))
+
+	# notes
+	on_every_worker(lambda url: requests.post(url + '/notes', data={'note': 'note'}), times=2)
+	note_ids = sorted({int(i) for i in re.findall(r'/edit-note/(\d+)', requests.get(urls[0] + '/notes').text)})
+	list(pool.map(
+		lambda note_id: requests.post(urls[note_id % len(urls)] + f'/edit-note/{note_id}', data={'note': f'edited {note_id}'}),
+		note_ids
+	))
+	notes = requests.get(urls[-1] + '/notes').text
+	missing = [note_id for note_id in note_ids if f'edited {note_id}\n' not in notes]
+	check('notes', len(note_ids) == 2 * len(urls) and not missing, missing)
+
+	# lock released
+	next_job = _update(urls[-1])
+	check('lock released', next_job['id'] != job_id, next_job)
+	_wait_until(lambda: _status(urls[0])['state'] != 'running')
+
+	pool.shutdown()
+	return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+	parser = argparse.ArgumentParser(description='Check the app under several worker processes')
+	parser.add_argument('--workers', type=int, default=4, help='worker processes')
+	parser.add_argument('--threads', type=int, default=16, help='concurrent requests')
+	_add_arguments(parser)
+	args = parser.parse_args(argv)
+
+	context = multiprocessing.get_context('spawn')
+	processes: list[multiprocessing.Process] = []
+
+	with tempfile.TemporaryDirectory() as tmp:
+		db_path = os.path.join(tmp, 'workers.db')
+		oms_port = _free_port()
+		oms_url = f'http://127.0.0.1:{oms_port}'
+		ports = [_free_port() for _ in range(args.workers)]
+		urls = [f'http://127.0.0.1:{port}' for port in ports]
+
+		try:
+			processes.append(context.Process(target=serve_oms, args=(oms_port, _settings(args)), daemon=True))
+			for port in ports:
+				processes.append(context.Process(
+					target=_serve,
+					args=(port, db_path, oms_url, os.path.join(tmp, 'fetch-cache')),
+					daemon=True
+				))
+			for process in processes:
+				process.start()
+
+			if not _wait_until(lambda: requests.get(oms_url + '/stats').ok):
+				print(f'order management system {oms_url} did not start', file=sys.stderr)
+				return 1
+			for url in urls:
+				if not _wait_until(lambda: requests.get(url + '/update/status').ok):
+					print(f'worker {url} did not start', file=sys.stderr)
+					return 1
+
+			failures = run(urls, args.threads)
+		finally:
+			for process in processes:
+				if process.is_alive():
+					process.terminate()
+					process.join()
+
+	for failure in failures:
+		print(failure, file=sys.stderr)
+	return 1 if failures else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file
@@ -1 +1,183 @@
-from app import app
\ No newline at end of file
+# Command line for the cron job and the printing station, and the module
+# the web server loads the app from (premier:app, FLASK_APP=premier):
+#
+# 	python premier.py refresh [--json]
+# 	python premier.py pick-list [--format text|csv|json]
+# 	python premier.py metadata STORE [--format text|csv|json]
+#
+# each subcommand imports only what it needs and nothing runs in a Flask
+# app context: printing the pick list or a store's metadata reads the db
+# without importing Flask, requests or the order endpoints (app.secrets),
+# see bench.startup for what each one imports and how long it takes
+import os
+import sys
+import argparse
+
+
+# premier.app, the Flask app, is only created when the web server asks for
+# it, and readied to serve then (see app.web.init_app)
+def __getattr__(name: str):
+	if name == 'app':
+		from app.web import init_app
+		return init_app()
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# a store on the command line is named like its page, ex) new-shirt-of-the-day
+def _store_slug(store: str) -> str:
+	return store.lower().replace(' ', '-')
+
+
+# no db yet means no refresh yet; reading would create an empty one. A db
+# from an older version has none of the tables read here until a refresh
+# upgrades it (see app.db.create_tables)
+def _check_db() -> None:
+	import sqlite3
+	import app.db
+
+	path: str = app.db.SQLITE_DATABASE_URI
+	if not os.path.exists(path):
+		sys.exit(f'no database at {path}, run: python premier.py refresh')
+
+	conn = sqlite3.connect(path)
+	try:
+		version: int = conn.execute("PRAGMA user_version").fetchone()[0]
+	finally:
+		conn.close()
+
+	if version < app.db.SCHEMA_VERSION:
+		sys.exit(f'{path} is from an older version (schema {version}), run: python premier.py refresh')
+
+
+# Refresh every store as /update does, or wait for the refresh another
+# process is running, and report it; exits non-zero if it failed
+def refresh(args: argparse.Namespace) -> int:
+	import json
+	import time
+	from app.db import create_tables
+	from app.worker import start_refresh, get_job
+
+	create_tables()
+	job = start_refresh()
+	while job.state == 'running':
+		time.sleep(0.2)
+		job = get_job()
+
+	if args.json:
+		print(json.dumps(job.as_json(), indent=2))
+	else:
+		for store, progress in job.stores.items():
+			print(f"{store:<24} {progress['state']:<10} {progress['orders'] if progress['orders'] is not None else '-':>6} orders")
+		print(f"{job.state} in {job.as_json()['seconds']}s" + (f': {job.error}' if job.error else ''))
+
+	return 0 if job.state == 'done' else 1
+
+
+# The pick list, in pick list order:
+# 	text : a line per style, its sizes with their quantities as on /pick-list
+# 	csv : a row per style and size, ex) PREM-001,MED,3,4
+# 	json : as /api/pick-list
+def pick_list(args: argparse.Namespace) -> int:
+	_check_db()
+	from app.db import _get_pick_list_rows
+
+	rows: list[tuple[str, str, int, int]] = _get_pick_list_rows()
+
+	if args.format == 'csv':
+		import csv
+		writer = csv.writer(sys.stdout)
+		writer.writerow(('style', 'size', 'quantity', 'total'))
+		writer.writerows(rows)
+		return 0
+
+	from app.picklist import _format_pick_list
+
+	pick_list = _format_pick_list(rows)
+
+	if args.format == 'json':
+		import json
+		print(json.dumps({'pick_list': [item.as_json() for item in pick_list]}, indent=2))
+		return 0
+
+	for item in pick_list:
+		if not item.sizes:
+			print(item.style + (f' ({item.total})' if item.total > 1 else ''))
+			continue
+		sizes = ', '.join(size + (f' ({quantity})' if quantity != 1 else '') for size, quantity in item.sizes)
+		print(f'{item.style:<32} {sizes}')
+
+	return 0
+
+
+# Every open order of a store and its items, newest first, a page of
+# orders at a time as the store's page reads them (see app.db._get_metadata):
+# 	text : an item per line, ex) 05/25/2023 02:50 PM  1001  Jane Doe  PREM-646-MED (2)
+# 	csv : a row per item
+# 	json : a list of items
+def metadata(args: argparse.Namespace) -> int:
+	_check_db()
+	from app.stores import STORES
+	from app.db import _get_metadata
+
+	store: str = next(name for name in STORES if _store_slug(name) == args.store)
+	fields: tuple[str, ...] = ('order_datetime', 'order_number', 'customer', 'sku', 'quantity')
+
+	if args.format == 'csv':
+		import csv
+		writer = csv.writer(sys.stdout)
+		writer.writerow(fields)
+
+	rows: list[dict[str, str | int]] = []
+	after: tuple[str, int] | None = None
+	while True:
+		items, after = _get_metadata(store, after)
+
+		for item in items:
+			if args.format == 'csv':
+				writer.writerow(item)
+			elif args.format == 'json':
+				rows.append(dict(zip(fields, item)))
+			else:
+				order_datetime, order_number, customer, sku, quantity = item
+				print(f'{order_datetime}  {order_number}  {customer}  {sku}' + (f' ({quantity})' if quantity > 1 else ''))
+
+		if after is None:
+			break
+
+	if args.format == 'json':
+		import json
+		print(json.dumps(rows, indent=2))
+
+	return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+	from app.stores import STORES
+
+	parser = argparse.ArgumentParser(prog='premier.py', description='Premier pick list')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	command = commands.add_parser('refresh', help='refresh every store and wait for it')
+	command.add_argument('--json', action='store_true', help='print the refresh job as JSON')
+	command.set_defaults(run=refresh)
+
+	command = commands.add_parser('pick-list', help='print the pick list')
+	command.add_argument('--format', choices=('text', 'csv', 'json'), default='text')
+	command.set_defaults(run=pick_list)
+
+	command = commands.add_parser('metadata', help="print a store's open orders and their items")
+	command.add_argument('store', choices=[_store_slug(store) for store in STORES])
+	command.add_argument('--format', choices=('text', 'csv', 'json'), default='text')
+	command.set_defaults(run=metadata)
+
+	args = parser.parse_args(argv)
+	try:
+		return args.run(args)
+	except BrokenPipeError:
+		# the reader went away, ex) | head; nothing more to print
+		os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+		return 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
\ No newline at end of file